@@ -1,11 +1,69 @@
-import json
+import concurrent.futures
+import logging
 import pathlib
-from typing import Optional
+from typing import Any, Iterator, Optional
 
 import click
 from tqdm import tqdm
 
-from slow_learner.type_learner import TypeLearner
+from slow_learner.csv_tables import iter_csv_column_batches
+from slow_learner.decoders import DECODERS, JsonDecoder, available_decoders, get_decoder
+from slow_learner.incremental import IncrementalState, file_digest, iter_input_files
+from slow_learner.json_documents import iter_concatenated_json_documents
+from slow_learner.json_path import JsonPath
+from slow_learner.persistence import open_atomically
+from slow_learner.server import LearnerServer
+from slow_learner.server import serve as serve_learners
+from slow_learner.type_learner import TypeLearner, write_types_module
+
+INPUT_FORMATS = ["json", "concatenated-json", "csv"]
+# CSV rows are parsed and learnt column by column in batches of that size
+CSV_BATCH_SIZE = 10_000
+# with --jobs, items are handed to the learner in batches of that size
+OBSERVE_BATCH_SIZE = 10_000
+
+
+def iter_documents(input_path: pathlib.Path, input_format: str, decoder: JsonDecoder) -> Iterator[Any]:
+    if input_format == "concatenated-json":
+        yield from iter_concatenated_json_documents(input_path, decoder)
+    elif decoder.accepts_bytes:
+        yield decoder.decode(input_path.read_bytes())
+    else:
+        yield decoder.decode(input_path.read_text())
+
+
+def learn_csv(tl: TypeLearner, input_path: pathlib.Path, progress_bar: tqdm) -> bool:
+    """Learns CSV rows in batches, skipping erroneous ones; returns whether the whole file was read"""
+    idx = 0
+    try:
+        for columns in iter_csv_column_batches(input_path, CSV_BATCH_SIZE):
+            rows = len(next(iter(columns.values()), []))
+            try:
+                tl.observe_columns(columns)
+            except Exception as e:
+                click.secho(f"Error parsing rows #{idx}-#{idx + rows - 1}, ignoring: {e!r}", fg="red")
+            finally:
+                idx += rows
+                progress_bar.update(rows)
+    except Exception as e:
+        click.secho(f"Error parsing data from {input_path}, ignoring: {e!r}", fg="red")
+        return False
+    return True
+
+
+def parse_selections(values: tuple[str, ...]) -> list[tuple[Optional[JsonPath], str]]:
+    selections: list[tuple[Optional[JsonPath], str]] = []
+    for value in values:
+        expression, separator, selected_type_name = value.rpartition("=")
+        if not separator or not selected_type_name:
+            raise click.BadParameter(f"Expected PATH=TypeName, got {value!r}")
+        try:
+            selections.append((JsonPath(expression), selected_type_name))
+        except ValueError as e:
+            raise click.BadParameter(str(e))
+    if len({selected_type_name for _, selected_type_name in selections}) != len(selections):
+        raise click.BadParameter("Type names must be unique")
+    return selections
 
 
 @click.group()
@@ -28,40 +86,243 @@ def cli():
     is_flag=True,
     help="If set, each input file is expected to contain a JSON list, and the type of it's items is learned",
 )
+@click.option(
+    "--input-format",
+    default="json",
+    type=click.Choice(INPUT_FORMATS),
+    help=(
+        "json: each input file contains a single JSON document; "
+        + "concatenated-json: each input file contains many JSON documents written back-to-back, "
+        + "they are read from a memory-mapped file one at a time; "
+        + "csv: each input file is a CSV table with a header row, the type of its rows is learned"
+    ),
+)
+@click.option(
+    "--decoder",
+    "decoder_name",
+    default="json",
+    type=click.Choice(list(DECODERS)),
+    help="JSON parsing backend; non-default ones require the corresponding package to be installed",
+)
 @click.option("--max-literal-type-size", default=5, type=int)
+@click.option(
+    "--no-literal-pattern",
+    "no_literal_patterns",
+    multiple=True,
+    help="Regex for JSON paths (e.g. '$.password') whose values are never turned into literals, may be repeated",
+)
+@click.option(
+    "--discriminator",
+    default=None,
+    help="Object field whose value (tag) selects a separate type to learn, the result is a union of per-tag types",
+)
+@click.option(
+    "--jobs",
+    default=1,
+    type=click.IntRange(min=1),
+    help="Number of processes learning per-tag types in parallel, only used with --discriminator",
+)
+@click.option(
+    "--select",
+    "selections",
+    multiple=True,
+    callback=lambda ctx, param, value: parse_selections(value),
+    help=(
+        "PATH=TypeName, e.g. '$.data.items[*]=Item': learns the type of values matching JSONPath separately; "
+        + "may be repeated, all types are written into one module"
+    ),
+)
+@click.option(
+    "--include-path",
+    "include_paths",
+    multiple=True,
+    help="JSONPath (e.g. '$.data.items[*]') of values to learn, other values are typed as Any; may be repeated",
+)
+@click.option(
+    "--exclude-path",
+    "exclude_paths",
+    multiple=True,
+    help="JSONPath (e.g. '$.debug') of values not to learn, they are typed as Any; may be repeated",
+)
+@click.option(
+    "--seed-module",
+    default=None,
+    type=click.Path(exists=True, dir_okay=False),
+    help=(
+        "Previously generated module with known types: learning starts from the types of the same names and only "
+        + "the parts of values deviating from them are learnt"
+    ),
+)
+@click.option(
+    "--state-dir",
+    default=None,
+    type=click.Path(file_okay=False),
+    help=(
+        "Directory to keep learnt types and the manifest of learnt files in between runs: only new and changed "
+        + "input files are learnt and merged into the saved types, the output file is regenerated"
+    ),
+)
+@click.option(
+    "--hash-contents",
+    default=False,
+    is_flag=True,
+    help="With --state-dir, files with changed modification time are hashed to tell if their contents changed",
+)
 def learn(
-    inputs: list[str], output_file: Optional[str], type_name: str, max_literal_type_size: int, spread: bool
+    inputs: list[str],
+    output_file: Optional[str],
+    type_name: str,
+    max_literal_type_size: int,
+    no_literal_patterns: tuple[str, ...],
+    spread: bool,
+    input_format: str,
+    decoder_name: str,
+    discriminator: Optional[str],
+    jobs: int,
+    selections: list[tuple[Optional[JsonPath], str]],
+    include_paths: tuple[str, ...],
+    exclude_paths: tuple[str, ...],
+    seed_module: Optional[str],
+    state_dir: Optional[str],
+    hash_contents: bool,
 ) -> None:
+    """Learns types of values from input files; directories are read recursively"""
+    selections = selections or [(None, type_name)]
     output_path = pathlib.Path(output_file or type_name + ".py")
-    if output_path.exists():
+    if output_path.exists() and state_dir is None:
         click.secho(f"File already exists: {output_path.resolve()}", fg="red")
         return
 
-    input_paths = [pathlib.Path(input_) for input_ in inputs]
+    input_paths = list(iter_input_files(pathlib.Path(input_) for input_ in inputs))
     missing_input_paths = [input_path for input_path in input_paths if not input_path.exists()]
     if missing_input_paths:
         click.secho(f"Some input paths are missing: {missing_input_paths}", fg="red")
         return
 
-    tl = TypeLearner(max_literal_type_size=max_literal_type_size)
+    try:
+        decoder = get_decoder(decoder_name)
+    except ImportError as e:
+        click.secho(
+            f"JSON decoder {decoder_name!r} is not available: {e}; available decoders: {', '.join(available_decoders())}",
+            fg="red",
+        )
+        return
+
+    if input_format == "csv" and any(json_path is not None for json_path, _ in selections):
+        click.secho("--select is not supported for CSV input", fg="red")
+        return
+
+    try:
+        learners = {
+            selected_type_name: TypeLearner(
+                max_literal_type_size=max_literal_type_size,
+                no_literal_patterns=list(no_literal_patterns),
+                discriminator=discriminator,
+                include_paths=list(include_paths),
+                exclude_paths=list(exclude_paths),
+            )
+            for _, selected_type_name in selections
+        }
+    except ValueError as e:
+        click.secho(f"Invalid --include-path or --exclude-path: {e}", fg="red")
+        return
+    state: Optional[IncrementalState] = None
+    if state_dir is not None:
+        state = IncrementalState(
+            pathlib.Path(state_dir),
+            options={
+                "selections": [
+                    [json_path.expression if json_path is not None else None, selected_type_name]
+                    for json_path, selected_type_name in selections
+                ],
+                "spread": spread,
+                "input_format": input_format,
+                "max_literal_type_size": max_literal_type_size,
+                "no_literal_patterns": no_literal_patterns,
+                "discriminator": discriminator,
+                "include_paths": include_paths,
+                "exclude_paths": exclude_paths,
+                # types are seeded only when learning from scratch, so they're relearnt when the seed changes
+                "seed_module": file_digest(pathlib.Path(seed_module)) if seed_module is not None else None,
+            },
+            hash_contents=hash_contents,
+        )
+        saved_learners = state.load()
+        if saved_learners is not None:
+            learners = saved_learners
+            seed_module = None  # the saved types were seeded already
+            input_paths_count = len(input_paths)
+            input_paths = [input_path for input_path in input_paths if not state.is_learnt(input_path)]
+            click.echo(
+                f"Loaded learnt types from {state_dir}, learning {len(input_paths)} new or changed input file(s) "
+                + f"of {input_paths_count}"
+            )
+    if seed_module is not None:
+        seed_source = pathlib.Path(seed_module).read_text()
+        for selected_type_name, learner in learners.items():
+            try:
+                learner.seed_from_module(seed_source, selected_type_name)
+            except ValueError as e:
+                click.secho(
+                    f"Can't seed {selected_type_name} from {seed_module}, learning from scratch: {e}", fg="yellow"
+                )
+    executor = concurrent.futures.ProcessPoolExecutor(max_workers=jobs) if jobs > 1 and discriminator else None
+    batches: dict[str, list[Any]] = {selected_type_name: [] for selected_type_name in learners}
+
+    def observe_batch(selected_type_name: str) -> None:
+        batch = batches[selected_type_name]
+        try:
+            learners[selected_type_name].observe_many(batch, executor)
+        except Exception as e:
+            click.secho(f"Error parsing {len(batch)} {selected_type_name} value(s), ignoring: {e!r}", fg="red")
+        batch.clear()
+
+    def observe_item(item: Any) -> None:
+        for json_path, selected_type_name in selections:
+            for value in json_path.select(item) if json_path is not None else [item]:
+                if executor is None:
+                    learners[selected_type_name].observe(value)
+                else:
+                    batches[selected_type_name].append(value)
+                    if len(batches[selected_type_name]) >= OBSERVE_BATCH_SIZE:
+                        observe_batch(selected_type_name)
+
+    file_entries = {input_path: state.file_entry(input_path) for input_path in input_paths} if state else dict()
     with tqdm() as progress_bar:
         for input_path in input_paths:
+            if input_format == "csv":
+                if learn_csv(learners[type_name], input_path, progress_bar) and state is not None:
+                    state.record_learnt(input_path, file_entries[input_path])
+                continue
             try:
-                data = json.loads(input_path.read_text())
-                if spread:
-                    assert isinstance(data, list)
-                    items = data
-                else:
-                    items = [data]
-                for idx, item in enumerate(items):
-                    try:
-                        tl.observe(item)
-                    except Exception as e:
-                        click.secho(f"Error parsing item #{idx}, ignoring: {e!r}", fg="red")
-                    finally:
-                        progress_bar.update()
+                idx = 0
+                for data in iter_documents(input_path, input_format, decoder):
+                    if spread:
+                        assert isinstance(data, list)
+                        items = data
+                    else:
+                        items = [data]
+                    for item in items:
+                        try:
+                            observe_item(item)
+                        except Exception as e:
+                            click.secho(f"Error parsing item #{idx}, ignoring: {e!r}", fg="red")
+                        finally:
+                            idx += 1
+                            progress_bar.update()
             except Exception as e:
                 click.secho(f"Error parsing data from {input_path}, ignoring: {e!r}", fg="red")
+            else:
+                if state is not None:
+                    state.record_learnt(input_path, file_entries[input_path])
+            for selected_type_name, batch in batches.items():
+                if batch:
+                    observe_batch(selected_type_name)
+    if executor is not None:
+        executor.shutdown()
+    if state is not None:
+        state.save(learners)
+        input_paths = [pathlib.Path(path) for path in state.files]  # for the docstring
 
     paths_in_doc = 10
     doc = f"Source JSON files:\n" + "\n".join(
@@ -69,5 +330,44 @@ def learn(
     )
     if len(input_paths) > paths_in_doc:
         doc += f"\n- {len(input_paths) - paths_in_doc} more..."
-    typedef = tl.generate_type_definition(type_name=type_name, doc=doc)
-    output_path.write_text(typedef)
+    selected_paths = [
+        (json_path, selected_type_name) for json_path, selected_type_name in selections if json_path is not None
+    ]
+    if selected_paths:
+        for json_path, selected_type_name in selected_paths:
+            if learners[selected_type_name].observed_values == 0:
+                click.secho(f"No values matched {json_path.expression}, skipping {selected_type_name}", fg="yellow")
+                del learners[selected_type_name]
+        if not learners:
+            click.secho("No values matched any of the selectors", fg="red")
+            return
+        doc += "\n\nSelected values:\n" + "\n".join(
+            f"- {selected_type_name}: {json_path.expression}" for json_path, selected_type_name in selected_paths
+        )
+    with open_atomically(output_path) as output:
+        if selections[0][0] is None:
+            learners[type_name].write_type_definition(output, type_name=type_name, doc=doc)
+        else:
+            write_types_module(output, learners, doc=doc)
+
+
+@cli.command()
+@click.option("--host", default="127.0.0.1", help="Host to listen on, localhost by default")
+@click.option("--port", default=8765, type=int)
+@click.option("--unix-socket", default=None, help="Unix socket path to listen on instead of host and port")
+@click.option(
+    "--checkpoint",
+    default=None,
+    help="File to load learners from on start and to save them to on shutdown (compressed pickle)",
+)
+@click.option("--max-literal-type-size", default=5, type=int)
+def serve(
+    host: str, port: int, unix_socket: Optional[str], checkpoint: Optional[str], max_literal_type_size: int
+) -> None:
+    """Keeps named learners in memory and serves them over HTTP, see slow_learner.server for the API"""
+    logging.basicConfig(level=logging.INFO)
+    learner_server = LearnerServer(
+        learner_options={"max_literal_type_size": max_literal_type_size},
+        checkpoint_path=pathlib.Path(checkpoint) if checkpoint else None,
+    )
+    serve_learners(learner_server, host, port, pathlib.Path(unix_socket) if unix_socket else None)
@@ -0,0 +1,178 @@
+import collections.abc
+import sys
+from dataclasses import dataclass
+from typing import Any, Iterator, Optional
+
+# numpy dtype kinds of columns holding python scalars of a single type
+_NUMPY_SCALAR_TYPES: dict[str, type] = {"b": bool, "i": int, "u": int, "f": float, "U": str, "S": bytes}
+
+
+def numpy_array(value: Any) -> bool:
+    numpy = sys.modules.get("numpy")
+    return numpy is not None and isinstance(value, numpy.ndarray)
+
+
+def numpy_array_item_type(array: Any) -> type:
+    """Python type of array's elements derived from its dtype, without looking at them; object arrays give object and
+    other dtypes with no python counterpart (e.g. datetime64 or structured ones) give their numpy scalar type"""
+    kind = array.dtype.kind
+    if kind in _NUMPY_SCALAR_TYPES:
+        return _NUMPY_SCALAR_TYPES[kind]
+    if kind == "c":
+        return complex
+    if kind == "O":
+        return object
+    return array.dtype.type
+
+
+@dataclass
+class ColumnSummary:
+    """What is needed to learn a column's type without looking at each of its values
+
+    For columns of scalars of a single type, only their distinct values are kept, and only if there are few of them.
+    Other columns keep all their values as python objects.
+    """
+
+    name: Any
+    # type of all non-null values, None if the column has to be learnt value by value
+    scalar_type: Optional[type]
+    has_nulls: bool
+    # distinct non-null values in order of their first occurrence, None if there are more than max_distinct of them
+    distinct_values: Optional[list[Any]] = None
+    # all values, with nulls as None; only set for columns without scalar type
+    values: Optional[list[Any]] = None
+
+
+def _iter_raw_columns(data: Any) -> Iterator[tuple[Any, Any]]:
+    numpy = sys.modules.get("numpy")
+    if numpy is not None and isinstance(data, numpy.ndarray):
+        if data.dtype.names is None:
+            raise TypeError("Only structured (record) numpy arrays can be observed by columns")
+        for name in data.dtype.names:
+            yield name, data[name]
+        return
+    pyarrow = sys.modules.get("pyarrow")
+    if pyarrow is not None and isinstance(data, (pyarrow.Table, pyarrow.RecordBatch)):
+        yield from zip(data.column_names, data.columns)
+        return
+    if isinstance(data, collections.abc.Mapping):
+        yield from data.items()
+        return
+    raise TypeError(
+        f"Can't observe {type(data)} by columns, expected numpy structured array, pyarrow table or record batch, "
+        + "or mapping of column names to sequences of values"
+    )
+
+
+def rows_count(data: Any) -> int:
+    numpy = sys.modules.get("numpy")
+    if numpy is not None and isinstance(data, numpy.ndarray):
+        return len(data)
+    pyarrow = sys.modules.get("pyarrow")
+    if pyarrow is not None and isinstance(data, (pyarrow.Table, pyarrow.RecordBatch)):
+        return data.num_rows
+    lengths = {len(column) for _, column in _iter_raw_columns(data)}
+    if len(lengths) > 1:
+        raise ValueError(f"Columns have different lengths: {sorted(lengths)}")
+    return lengths.pop() if lengths else 0
+
+
+def _to_list(column: Any) -> list[Any]:
+    pyarrow = sys.modules.get("pyarrow")
+    if pyarrow is not None and isinstance(column, (pyarrow.Array, pyarrow.ChunkedArray)):
+        return column.to_pylist()
+    if hasattr(column, "tolist"):  # numpy arrays, masked ones have None in place of masked values
+        return column.tolist()
+    return list(column)
+
+
+def column_lists(data: Any) -> dict[Any, list[Any]]:
+    """Columns as lists of python values, with nulls as None"""
+    return {name: _to_list(column) for name, column in _iter_raw_columns(data)}
+
+
+def _summarize_numpy_column(name: str, column: Any, max_distinct: int) -> ColumnSummary:
+    numpy = sys.modules["numpy"]
+    if isinstance(column, numpy.ma.MaskedArray):
+        has_nulls = bool(numpy.ma.getmaskarray(column).any())
+        values = column.compressed()
+    else:
+        has_nulls = False
+        values = column
+    scalar_type = _NUMPY_SCALAR_TYPES.get(values.dtype.kind) if column.ndim == 1 and values.size > 0 else None
+    if scalar_type is None:
+        return ColumnSummary(name, scalar_type=None, has_nulls=has_nulls, values=column.tolist())
+    summary = ColumnSummary(name, scalar_type=scalar_type, has_nulls=has_nulls)
+    if scalar_type is not float and max_distinct > 0:
+        distinct_values, first_indices = numpy.unique(values, return_index=True)
+        if len(distinct_values) <= max_distinct:
+            summary.distinct_values = distinct_values[numpy.argsort(first_indices)].tolist()
+    return summary
+
+
+def _summarize_arrow_column(name: str, column: Any, max_distinct: int) -> ColumnSummary:
+    import pyarrow
+    import pyarrow.compute
+
+    arrow_type = column.type
+    scalar_type: Optional[type] = None
+    if pyarrow.types.is_boolean(arrow_type):
+        scalar_type = bool
+    elif pyarrow.types.is_integer(arrow_type):
+        scalar_type = int
+    elif pyarrow.types.is_floating(arrow_type):
+        scalar_type = float
+    elif pyarrow.types.is_string(arrow_type) or pyarrow.types.is_large_string(arrow_type):
+        scalar_type = str
+    elif pyarrow.types.is_binary(arrow_type) or pyarrow.types.is_large_binary(arrow_type):
+        scalar_type = bytes
+    has_nulls = column.null_count > 0
+    if len(column) == column.null_count:
+        scalar_type = None
+    if scalar_type is None:
+        return ColumnSummary(name, scalar_type=None, has_nulls=has_nulls, values=column.to_pylist())
+    summary = ColumnSummary(name, scalar_type=scalar_type, has_nulls=has_nulls)
+    if scalar_type is not float and max_distinct > 0:
+        # unique values are returned in order of their first occurrence
+        distinct_values = pyarrow.compute.unique(column).drop_null()
+        if len(distinct_values) <= max_distinct:
+            summary.distinct_values = distinct_values.to_pylist()
+    return summary
+
+
+def _summarize_list_column(name: Any, values: list[Any], max_distinct: int) -> ColumnSummary:
+    """Summarizes a column of python values, giving it a scalar type if all its non-null values are of one type"""
+    scalar_types = {type(value) for value in values if value is not None}
+    has_nulls = any(value is None for value in values)
+    if len(scalar_types) != 1 or not scalar_types <= set(_NUMPY_SCALAR_TYPES.values()):
+        return ColumnSummary(name, scalar_type=None, has_nulls=has_nulls, values=values)
+    scalar_type = scalar_types.pop()
+    summary = ColumnSummary(name, scalar_type=scalar_type, has_nulls=has_nulls)
+    if scalar_type is not float and max_distinct > 0:
+        distinct_values: dict[Any, None] = dict()
+        for value in values:
+            if value is not None:
+                distinct_values[value] = None
+                if len(distinct_values) > max_distinct:
+                    return summary
+        summary.distinct_values = list(distinct_values)
+    return summary
+
+
+def summarize_columns(data: Any, max_distinct: int) -> list[ColumnSummary]:
+    """Summarizes columns of numpy structured array, pyarrow table or record batch, or a mapping of lists
+
+    Columns' scalar types come from dtypes and schemas and distinct values are found with vectorized operations;
+    mapping's columns get a scalar type if all their non-null values are of one type, e.g. parsed CSV columns
+    """
+    summaries: list[ColumnSummary] = []
+    numpy = sys.modules.get("numpy")
+    pyarrow = sys.modules.get("pyarrow")
+    for name, column in _iter_raw_columns(data):
+        if numpy is not None and isinstance(column, numpy.ndarray):
+            summaries.append(_summarize_numpy_column(name, column, max_distinct))
+        elif pyarrow is not None and isinstance(column, (pyarrow.Array, pyarrow.ChunkedArray)):
+            summaries.append(_summarize_arrow_column(name, column, max_distinct))
+        else:
+            summaries.append(_summarize_list_column(name, _to_list(column), max_distinct))
+    return summaries
@@ -0,0 +1,55 @@
+import csv
+import pathlib
+import re
+from typing import Any, Iterator, Optional
+
+_INT_RE = re.compile(r"[+-]?\d+")
+# unlike float(), doesn't accept underscores, surrounding whitespace, nan or inf
+_FLOAT_RE = re.compile(r"[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?")
+
+
+def parse_csv_scalar(value: str) -> Optional[Any]:
+    """Parses CSV cell into None (for empty cells), bool, int, float or keeps it as string, in that order"""
+    if value == "":
+        return None
+    lowercase_value = value.lower()
+    if lowercase_value == "true":
+        return True
+    if lowercase_value == "false":
+        return False
+    if _INT_RE.fullmatch(value):
+        return int(value)
+    if _FLOAT_RE.fullmatch(value):
+        return float(value)
+    return value
+
+
+def iter_csv_column_batches(path: pathlib.Path, batch_size: int) -> Iterator[dict[str, list[Any]]]:
+    """Streams CSV file with a header row, yielding batches of up to batch_size rows as columns of parsed values
+
+    Short rows are padded with empty cells; rows longer than the header and repeated column names are an error
+    """
+    with open(path, newline="") as file:
+        reader = csv.reader(file)
+        header = next(reader, None)
+        if header is None:
+            return
+        duplicate_names = sorted({name for name in header if header.count(name) > 1})
+        if duplicate_names:
+            raise ValueError(f"Header has repeated column names: {duplicate_names}")
+        columns: list[list[Any]] = [[] for _ in header]
+        rows_in_batch = 0
+        for row in reader:
+            if len(row) > len(header):
+                raise ValueError(f"Row on line {reader.line_num} has more values than the header: {len(row)}")
+            for column, value in zip(columns, row):
+                column.append(parse_csv_scalar(value))
+            for column in columns[len(row) :]:
+                column.append(None)
+            rows_in_batch += 1
+            if rows_in_batch == batch_size:
+                yield dict(zip(header, columns))
+                columns = [[] for _ in header]
+                rows_in_batch = 0
+        if rows_in_batch:
+            yield dict(zip(header, columns))
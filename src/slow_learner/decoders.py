@@ -0,0 +1,95 @@
+import json
+from abc import ABC, abstractmethod
+from typing import Any, Type, Union
+
+
+class JsonDecoder(ABC):
+    """JSON parsing backend; backends produce the same Python objects for typical documents, but may reject or change
+    values that json.loads accepts, e.g. NaN or integers beyond 64 bits"""
+
+    name: str
+    # whether the backend parses raw bytes natively, so that decoding them to str beforehand can be skipped
+    accepts_bytes: bool
+
+    @abstractmethod
+    def decode(self, data: Union[str, bytes]) -> Any:
+        ...
+
+
+class StdlibJsonDecoder(JsonDecoder):
+    name = "json"
+    accepts_bytes = False
+
+    def decode(self, data: Union[str, bytes]) -> Any:
+        return json.loads(data)
+
+
+class OrjsonDecoder(JsonDecoder):
+    """See https://github.com/ijl/orjson"""
+
+    name = "orjson"
+    accepts_bytes = True
+
+    def __init__(self) -> None:
+        import orjson
+
+        self._loads = orjson.loads
+
+    def decode(self, data: Union[str, bytes]) -> Any:
+        return self._loads(data)
+
+
+class UjsonDecoder(JsonDecoder):
+    """See https://github.com/ultrajson/ultrajson"""
+
+    name = "ujson"
+    accepts_bytes = True
+
+    def __init__(self) -> None:
+        import ujson
+
+        self._loads = ujson.loads
+
+    def decode(self, data: Union[str, bytes]) -> Any:
+        return self._loads(data)
+
+
+class SimdjsonDecoder(JsonDecoder):
+    """See https://github.com/TkTech/pysimdjson"""
+
+    name = "simdjson"
+    accepts_bytes = True
+
+    def __init__(self) -> None:
+        import simdjson
+
+        self._loads = simdjson.loads
+
+    def decode(self, data: Union[str, bytes]) -> Any:
+        return self._loads(data)
+
+
+DECODERS: dict[str, Type[JsonDecoder]] = {
+    decoder_cls.name: decoder_cls for decoder_cls in (StdlibJsonDecoder, OrjsonDecoder, UjsonDecoder, SimdjsonDecoder)
+}
+
+
+def get_decoder(name: str) -> JsonDecoder:
+    """Instantiates decoder by name; raises ImportError if the backend's package is not installed"""
+    try:
+        decoder_cls = DECODERS[name]
+    except KeyError:
+        raise ValueError(f"Unknown JSON decoder {name!r}, expected one of: {', '.join(DECODERS)}")
+    return decoder_cls()
+
+
+def available_decoders() -> list[str]:
+    """Names of decoders whose backend packages are installed"""
+    available: list[str] = []
+    for name in DECODERS:
+        try:
+            get_decoder(name)
+        except ImportError:
+            continue
+        available.append(name)
+    return available
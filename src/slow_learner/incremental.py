@@ -0,0 +1,115 @@
+import hashlib
+import json
+import logging
+import pathlib
+from typing import Any, Iterable, Iterator, Optional
+
+from .persistence import load_compressed_pickle, save_compressed_pickle, write_atomically
+from .type_learner import TypeLearner
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 2
+DIGEST_CHUNK_SIZE = 1 << 20
+
+
+def iter_input_files(input_paths: Iterable[pathlib.Path]) -> Iterator[pathlib.Path]:
+    """Input files with directories replaced by all files in them, recursively and in sorted order"""
+    for input_path in input_paths:
+        if input_path.is_dir():
+            yield from sorted(path for path in input_path.rglob("*") if path.is_file())
+        else:
+            yield input_path
+
+
+def file_digest(path: pathlib.Path) -> str:
+    hash_ = hashlib.sha256()
+    with open(path, "rb") as file:
+        while chunk := file.read(DIGEST_CHUNK_SIZE):
+            hash_.update(chunk)
+    return hash_.hexdigest()
+
+
+class IncrementalState:
+    """Named learners and the manifest of input files they have learnt, kept in a directory between runs
+
+    Files are identified by their resolved paths and considered unchanged while their size and modification time
+    are the same or, with hash_contents, while their contents' hash is. Learners can't forget what they have
+    learnt, so changed files are learnt again on top of their previous contents. The state is discarded when the
+    learning options it was saved with differ from the current ones.
+
+    Learners are saved in one file together with the options and the learnt files, so that they are never out of
+    sync; the manifest is written after that, for the record, and is not needed to load the state.
+    """
+
+    LEARNERS_FILE = "learners.pickle.z"
+    MANIFEST_FILE = "manifest.json"
+
+    def __init__(self, state_dir: pathlib.Path, options: dict[str, Any], hash_contents: bool = False) -> None:
+        self.state_dir = state_dir
+        # round trip through JSON so that options compare equal to the saved ones, e.g. with tuples turned into lists
+        self.options = json.loads(json.dumps(options))
+        self.hash_contents = hash_contents
+        self.files: dict[str, dict[str, Any]] = dict()
+
+    @property
+    def learners_path(self) -> pathlib.Path:
+        return self.state_dir / self.LEARNERS_FILE
+
+    @property
+    def manifest_path(self) -> pathlib.Path:
+        return self.state_dir / self.MANIFEST_FILE
+
+    def load(self) -> Optional[dict[str, TypeLearner]]:
+        """Learners saved by the previous run, None if there are none or they were learnt with other options"""
+        if not self.learners_path.exists():
+            return None
+        saved_state = load_compressed_pickle(self.learners_path)
+        if (
+            not isinstance(saved_state, dict)
+            or saved_state.get("version") != MANIFEST_VERSION
+            or saved_state.get("options") != self.options
+        ):
+            logger.info(f"State in {self.state_dir} was saved with other options, learning from scratch")
+            return None
+        learners: dict[str, TypeLearner] = saved_state["learners"]
+        self.files = saved_state["files"]
+        return learners
+
+    def file_entry(self, path: pathlib.Path, digest: Optional[str] = None) -> dict[str, Any]:
+        """Manifest entry of the file as it is now; taken before learning it, so that changes made meanwhile are not
+        mistaken for learnt ones"""
+        stat = path.stat()
+        entry: dict[str, Any] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        if self.hash_contents:
+            entry["sha256"] = digest or file_digest(path)
+        return entry
+
+    def is_learnt(self, path: pathlib.Path) -> bool:
+        """Whether the file was learnt before and is unchanged since then"""
+        key = str(path.resolve())
+        entry = self.files.get(key)
+        if entry is None:
+            return False
+        stat = path.stat()
+        if stat.st_size != entry["size"]:
+            return False
+        if stat.st_mtime_ns == entry["mtime_ns"]:
+            return True
+        if not self.hash_contents or "sha256" not in entry:
+            return False
+        digest = file_digest(path)
+        if digest != entry["sha256"]:
+            return False
+        self.files[key] = self.file_entry(path, digest)  # e.g. touched or copied, so that it's not hashed again
+        return True
+
+    def record_learnt(self, path: pathlib.Path, entry: dict[str, Any]) -> None:
+        self.files[str(path.resolve())] = entry
+
+    def save(self, learners: dict[str, TypeLearner]) -> None:
+        """Atomically saves learners with the files they have learnt, then the manifest"""
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        manifest = {"version": MANIFEST_VERSION, "options": self.options, "files": self.files}
+        save_compressed_pickle({**manifest, "learners": learners}, self.learners_path)
+        write_atomically(json.dumps(manifest, indent=2).encode(), self.manifest_path)
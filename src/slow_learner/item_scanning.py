@@ -0,0 +1,45 @@
+import math
+import random
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass(frozen=True)
+class ItemScanPolicy:
+    """How items of large collections and mappings are scanned when learning their item type
+
+    Items are learnt one by one until the reduced item type stays unchanged for stable_items consecutive items (it's
+    compared every check_every items) or max_scanned_items items were learnt, then at most max_sampled_items of the
+    remaining items are learnt, taken every stride items (by default, evenly spread over the rest) or, with
+    random_sampling, at random. Containers with at most stable_items items are always learnt in full.
+    """
+
+    stable_items: int = 100
+    max_sampled_items: int = 100
+    stride: Optional[int] = None
+    random_sampling: bool = False
+    seed: Optional[int] = None
+    check_every: int = 10
+    max_scanned_items: int = 10_000
+
+    def __post_init__(self) -> None:
+        if self.stable_items < 1:
+            raise ValueError(f"stable_items must be positive, got {self.stable_items}")
+        if self.check_every < 1:
+            raise ValueError(f"check_every must be positive, got {self.check_every}")
+        if self.max_scanned_items < self.stable_items:
+            raise ValueError(
+                f"max_scanned_items must be at least stable_items ({self.stable_items}), got {self.max_scanned_items}"
+            )
+        if self.stride is not None and self.stride < 1:
+            raise ValueError(f"stride must be positive, got {self.stride}")
+
+    def sampled_indices(self, start: int, stop: int, rng: random.Random) -> list[int]:
+        """Indices of items in [start, stop) to learn after the item type became stable, in increasing order"""
+        remaining = stop - start
+        if remaining <= 0 or self.max_sampled_items <= 0:
+            return []
+        if self.random_sampling:
+            return sorted(rng.sample(range(start, stop), min(self.max_sampled_items, remaining)))
+        stride = self.stride or math.ceil(remaining / self.max_sampled_items)
+        return list(range(start, stop, stride)[: self.max_sampled_items])
@@ -0,0 +1,88 @@
+import mmap
+import pathlib
+import re
+from typing import Any, Iterator, Optional
+
+from .decoders import JsonDecoder, StdlibJsonDecoder
+
+# skips everything up to the next bracket outside of a string literal; stops at the opening quote of an
+# unterminated string or at the end of the buffer
+_SKIP_TO_BRACKET_RE = re.compile(rb'(?:[^"\[\]{}]+|"(?:[^"\\]|\\.)*")*', re.DOTALL)
+_STRING_RE = re.compile(rb'"(?:[^"\\]|\\.)*"', re.DOTALL)
+_BARE_SCALAR_RE = re.compile(rb'[^\s\[\]{}"]+')
+_WHITESPACE_RE = re.compile(rb"\s*")
+
+_OPENING_BRACKETS = frozenset(b"[{")
+_CLOSING_BRACKETS = frozenset(b"]}")
+_QUOTE = ord('"')
+
+# processed pages are released from the process' resident set after this many bytes
+_RELEASE_PAGES_EVERY = 64 * 1024 * 1024
+
+
+def skip_container(buf: bytes, start: int) -> int:
+    """Offset right after the JSON object or array starting at the offset; its contents are not validated"""
+    pos = start
+    size = len(buf)
+    depth = 0
+    while True:
+        pos = _SKIP_TO_BRACKET_RE.match(buf, pos).end()  # type: ignore
+        if pos >= size:
+            raise ValueError(f"Truncated JSON document at offset {start}")
+        char = buf[pos]
+        if char in _OPENING_BRACKETS:
+            depth += 1
+        elif char in _CLOSING_BRACKETS:
+            depth -= 1
+        else:
+            raise ValueError(f"Unterminated string at offset {pos}")
+        pos += 1
+        if depth == 0:
+            return pos
+
+
+def iter_document_spans(buf: bytes) -> Iterator[tuple[int, int]]:
+    """Finds (start, end) offsets of JSON documents written back-to-back into a buffer (e.g. mmap object)
+
+    Only document boundaries are located here, the documents themselves are not validated
+    """
+    pos = _WHITESPACE_RE.match(buf, 0).end()  # type: ignore
+    size = len(buf)
+    while pos < size:
+        start = pos
+        first_char = buf[pos]
+        if first_char in _OPENING_BRACKETS:
+            pos = skip_container(buf, pos)
+        elif first_char == _QUOTE:
+            match = _STRING_RE.match(buf, pos)
+            if match is None:
+                raise ValueError(f"Unterminated string at offset {pos}")
+            pos = match.end()
+        else:
+            match = _BARE_SCALAR_RE.match(buf, pos)
+            if match is None:
+                raise ValueError(f"Unexpected character at offset {pos}: {chr(first_char)!r}")
+            pos = match.end()
+        yield start, pos
+        pos = _WHITESPACE_RE.match(buf, pos).end()  # type: ignore
+
+
+def iter_concatenated_json_documents(path: pathlib.Path, decoder: Optional[JsonDecoder] = None) -> Iterator[Any]:
+    """Memory-maps a file with JSON documents written back-to-back and decodes them one at a time
+
+    The file is never read or decoded as a whole, only each document's bytes are copied out of the mapping
+    """
+    decoder = decoder or StdlibJsonDecoder()
+    with open(path, "rb") as file:
+        if pathlib.Path(path).stat().st_size == 0:
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            can_madvise = hasattr(buf, "madvise")
+            if can_madvise:
+                buf.madvise(mmap.MADV_SEQUENTIAL)
+            released_until = 0
+            for start, end in iter_document_spans(buf):  # type: ignore
+                yield decoder.decode(buf[start:end])
+                if can_madvise and end - released_until > _RELEASE_PAGES_EVERY:
+                    released_until = end - end % mmap.PAGESIZE
+                    buf.madvise(mmap.MADV_DONTNEED, 0, released_until)
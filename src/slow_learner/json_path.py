@@ -0,0 +1,89 @@
+import re
+from typing import Any, Iterable, Iterator, Optional, Sequence, Union
+
+# a subset of JSONPath: $ root followed by .key, .*, [index], [*], ['key'] or ["key"] segments
+_SEGMENT_RE = re.compile(
+    r"""\.(?P<name>[^.\[\]]+)"""
+    + r"""|\[(?:(?P<index>-?\d+)|(?P<wildcard>\*)"""
+    + r"""|'(?P<single_quoted>(?:[^'\\]|\\.)*)'|"(?P<double_quoted>(?:[^"\\]|\\.)*)")\]"""
+)
+_ESCAPE_RE = re.compile(r"\\(.)")
+
+# path segment: dict key, list index or None for wildcard
+JsonPathSegment = Optional[Union[str, int]]
+
+
+def parse_json_path(expression: str) -> list[JsonPathSegment]:
+    if not expression.startswith("$"):
+        raise ValueError(f"JSONPath must start with $: {expression!r}")
+    segments: list[JsonPathSegment] = []
+    pos = 1
+    while pos < len(expression):
+        match = _SEGMENT_RE.match(expression, pos)
+        if match is None:
+            raise ValueError(f"Invalid JSONPath {expression!r} at position {pos}: {expression[pos:]!r}")
+        if match["name"] is not None:
+            segments.append(None if match["name"] == "*" else match["name"])
+        elif match["index"] is not None:
+            segments.append(int(match["index"]))
+        elif match["wildcard"] is not None:
+            segments.append(None)
+        else:
+            quoted = match["single_quoted"] if match["single_quoted"] is not None else match["double_quoted"]
+            segments.append(_ESCAPE_RE.sub(r"\1", quoted))
+        pos = match.end()
+    return segments
+
+
+class JsonPath:
+    """Parsed JSONPath selecting sub-values of a JSON document, e.g. $.data.items[*]
+
+    Only the basic subset is supported: child keys, list indices and wildcards, without filters, slices
+    or recursive descent
+    """
+
+    def __init__(self, expression: str) -> None:
+        self.expression = expression
+        self.segments = parse_json_path(expression)
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.expression!r})"
+
+    def _matches_segments(self, path_parts: Sequence[Union[str, int]]) -> bool:
+        for segment, part in zip(self.segments, path_parts):
+            if segment is not None and (segment != part or isinstance(segment, int) != isinstance(part, int)):
+                return False
+        return True
+
+    def covers(self, path_parts: Sequence[Union[str, int]]) -> bool:
+        """Whether the path (keys and indices from the root) matches this JSONPath or is inside a matching value"""
+        return len(self.segments) <= len(path_parts) and self._matches_segments(path_parts)
+
+    def may_match_below(self, path_parts: Sequence[Union[str, int]]) -> bool:
+        """Whether some values under the path (keys and indices from the root) may match this JSONPath"""
+        return len(path_parts) < len(self.segments) and self._matches_segments(path_parts)
+
+    def select(self, value: Any) -> Iterator[Any]:
+        """Yields all sub-values matching the path, in document order"""
+        yield from self._select(value, 0)
+
+    def _select(self, value: Any, segment_idx: int) -> Iterator[Any]:
+        if segment_idx == len(self.segments):
+            yield value
+            return
+        segment = self.segments[segment_idx]
+        if segment is None:
+            children: Iterable[Any]
+            if isinstance(value, dict):
+                children = value.values()
+            elif isinstance(value, (list, tuple)):
+                children = value
+            else:
+                return
+            for child in children:
+                yield from self._select(child, segment_idx + 1)
+        elif isinstance(segment, int):
+            if isinstance(value, (list, tuple)) and -len(value) <= segment < len(value):
+                yield from self._select(value[segment], segment_idx + 1)
+        elif isinstance(value, dict) and segment in value:
+            yield from self._select(value[segment], segment_idx + 1)
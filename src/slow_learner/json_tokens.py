@@ -0,0 +1,197 @@
+import json
+import re
+from json.decoder import scanstring  # type: ignore[attr-defined]
+from typing import TYPE_CHECKING, NoReturn, Union
+
+from .json_documents import skip_container
+from .learnt_types import LCollection, LearntType, LLiteral, LMapping, LNone, LType, LTypedDict
+from .unions import BucketedUnion
+
+if TYPE_CHECKING:
+    from .type_learner import TypeLearner
+
+_WHITESPACE_RE = re.compile(rb"[ \t\n\r]*")
+_STRING_RE = re.compile(rb'"([^"\\]*(?:\\.[^"\\]*)*)"', re.DOTALL)
+_NUMBER_RE = re.compile(rb"-?(?:0|[1-9][0-9]*)(\.[0-9]+)?([eE][-+]?[0-9]+)?")
+_ESCAPE_OR_NON_ASCII_RE = re.compile(rb"[\\\x80-\xff]")
+
+_OBJECT_START = ord("{")
+_OBJECT_END = ord("}")
+_ARRAY_START = ord("[")
+_ARRAY_END = ord("]")
+_QUOTE = ord('"')
+_COLON = ord(":")
+_COMMA = ord(",")
+_NUMBER_START = frozenset(b"-0123456789")
+# bare words accepted by json.loads with their python values' types
+_KEYWORDS: list[tuple[bytes, Union[bool, None, float]]] = [
+    (b"true", True),
+    (b"false", False),
+    (b"null", None),
+    (b"NaN", float("nan")),
+    (b"Infinity", float("inf")),
+    (b"-Infinity", float("-inf")),
+]
+
+
+class JsonTokenTypeLearner:
+    """Learns the type of a UTF-8 encoded JSON document from its tokens, the way TypeLearner learns the decoded value
+
+    Objects and arrays are never built: values are learnt as they are scanned and reduced on the fly. Only object
+    keys and scalars that may become literals are decoded; long strings, floats and subtrees that are not learnt
+    (too deep or excluded by path projection) are skipped without decoding, and are not validated either.
+    """
+
+    def __init__(self, learner: "TypeLearner", data: bytes) -> None:
+        self.learner = learner
+        self.data = data
+
+    def error(self, message: str, pos: int) -> NoReturn:
+        raise json.JSONDecodeError(message, bytes(self.data).decode("utf-8", errors="replace"), pos)
+
+    def skip_whitespace(self, pos: int) -> int:
+        return _WHITESPACE_RE.match(self.data, pos).end()  # type: ignore
+
+    def learn(self) -> LearntType:
+        lt, pos = self.learn_value(self.skip_whitespace(0), [])
+        pos = self.skip_whitespace(pos)
+        if pos != len(self.data):
+            self.error("Extra data", pos)
+        return lt
+
+    def learn_value(self, pos: int, path: list[Union[str, int]]) -> tuple[LearntType, int]:
+        if pos >= len(self.data):
+            self.error("Expecting value", pos)
+        char = self.data[pos]
+        if char == _QUOTE:
+            return self.learn_string(pos, path)
+        if char == _OBJECT_START or char == _ARRAY_START:
+            if len(path) > self.learner.max_recursive_type_depth:
+                return LType(dict if char == _OBJECT_START else list), self.skip_container(pos)
+            if char == _OBJECT_START:
+                return self.learn_object(pos, path)
+            return self.learn_array(pos, path)
+        if char in _NUMBER_START:
+            match = _NUMBER_RE.match(self.data, pos)
+            if match is not None:
+                if match[1] is not None or match[2] is not None:
+                    return LType(float), match.end()
+                return self.learn_scalar(int(match[0]), path), match.end()
+        for keyword, value in _KEYWORDS:
+            if self.data.startswith(keyword, pos):
+                return self.learn_scalar(value, path), pos + len(keyword)
+        self.error("Expecting value", pos)
+
+    def learn_scalar(self, value: Union[str, int, bool, None, float], path: list[Union[str, int]]) -> LearntType:
+        if value is None:
+            return LNone()
+        if isinstance(value, float):
+            return LType(float)
+        return LLiteral(value) if self.learner._literal_allowed(value, path) else LType(type(value))
+
+    def decode_string(self, match: "re.Match[bytes]") -> str:
+        raw = match[1]
+        if b"\\" not in raw:
+            return raw.decode("utf-8")
+        try:
+            return scanstring(raw.decode("utf-8") + '"', 0)[0]
+        except json.JSONDecodeError as e:
+            self.error(e.msg, match.start() + 1)
+
+    def learn_string(self, pos: int, path: list[Union[str, int]]) -> tuple[LearntType, int]:
+        match = _STRING_RE.match(self.data, pos)
+        if match is None:
+            self.error("Unterminated string starting at", pos)
+        if self.learner.max_literal_type_size <= 0 or (
+            # decoded strings are never longer than their raw bytes, and as long without escapes and non-ASCII chars
+            len(match[1]) > self.learner.max_literl_string_length
+            and _ESCAPE_OR_NON_ASCII_RE.search(match[1]) is None
+        ):
+            return LType(str), match.end()
+        return self.learn_scalar(self.decode_string(match), path), match.end()  # type: ignore
+
+    def skip_container(self, pos: int) -> int:
+        try:
+            return skip_container(self.data, pos)
+        except ValueError as e:
+            self.error(str(e), pos)
+
+    def skip_value(self, pos: int) -> tuple[type, int]:
+        """Skips the value, returning its python type"""
+        char = self.data[pos] if pos < len(self.data) else None
+        if char == _OBJECT_START or char == _ARRAY_START:
+            return (dict if char == _OBJECT_START else list), self.skip_container(pos)
+        if char == _QUOTE:
+            match = _STRING_RE.match(self.data, pos)
+            if match is None:
+                self.error("Unterminated string starting at", pos)
+            return str, match.end()
+        if char in _NUMBER_START:
+            match = _NUMBER_RE.match(self.data, pos)
+            if match is not None:
+                return (float if match[1] is not None or match[2] is not None else int), match.end()
+        for keyword, value in _KEYWORDS:
+            if self.data.startswith(keyword, pos):
+                return type(value), pos + len(keyword)
+        self.error("Expecting value", pos)
+
+    def learn_child(self, pos: int, path: list[Union[str, int]]) -> tuple[LearntType, int]:
+        if self.learner.path_projection and self.learner._excludes_path(path):
+            type_, end = self.skip_value(pos)
+            return self.learner._excluded_path_type(type_), end
+        return self.learn_value(pos, path)
+
+    def learn_object(self, pos: int, path: list[Union[str, int]]) -> tuple[LearntType, int]:
+        # later values of duplicate keys replace earlier ones but keep their position, as in decoded dicts
+        fields: dict[str, LearntType] = dict()
+        pos = self.skip_whitespace(pos + 1)
+        if pos < len(self.data) and self.data[pos] == _OBJECT_END:
+            pos += 1
+        else:
+            while True:
+                match = _STRING_RE.match(self.data, pos)
+                if match is None:
+                    self.error("Expecting property name enclosed in double quotes", pos)
+                key = self.decode_string(match)
+                pos = self.skip_whitespace(match.end())
+                if pos >= len(self.data) or self.data[pos] != _COLON:
+                    self.error("Expecting ':' delimiter", pos)
+                fields[key], pos = self.learn_child(self.skip_whitespace(pos + 1), path + [key])
+                pos = self.skip_whitespace(pos)
+                char = self.data[pos] if pos < len(self.data) else None
+                if char == _OBJECT_END:
+                    pos += 1
+                    break
+                if char != _COMMA:
+                    self.error("Expecting ',' delimiter", pos)
+                pos = self.skip_whitespace(pos + 1)
+        if self.learner.learn_typed_dicts:
+            return LTypedDict(fields), pos
+        return (
+            LMapping(
+                mapping_type=dict,
+                key_type=self.learner._reduce_simplifying(
+                    self.learner._learn_variable_type(key, _path=path + [key]) for key in fields
+                ),
+                value_type=self.learner._reduce_simplifying(fields.values()),
+            ),
+            pos,
+        )
+
+    def learn_array(self, pos: int, path: list[Union[str, int]]) -> tuple[LearntType, int]:
+        item_types = BucketedUnion(self.learner)
+        pos = self.skip_whitespace(pos + 1)
+        if pos < len(self.data) and self.data[pos] == _ARRAY_END:
+            return LCollection(list, item_types.to_learnt_type()), pos + 1
+        index = 0
+        while True:
+            item_type, pos = self.learn_child(pos, path + [index])
+            item_types.add(item_type)
+            index += 1
+            pos = self.skip_whitespace(pos)
+            char = self.data[pos] if pos < len(self.data) else None
+            if char == _ARRAY_END:
+                return LCollection(list, item_types.to_learnt_type()), pos + 1
+            if char != _COMMA:
+                self.error("Expecting ',' delimiter", pos)
+            pos = self.skip_whitespace(pos + 1)
@@ -1,7 +1,8 @@
+import hashlib
 from abc import ABC
 from collections.abc import Collection, Mapping
-from dataclasses import dataclass
-from typing import Any, Type
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional, Type
 
 
 class LearntType(ABC):
@@ -108,3 +109,174 @@ class LTypedDict(LearntType):
     def __str__(self) -> str:
         body_str = ", ".join('"' + key_name + '": ' + str(value_type) for key_name, value_type in self.fields.items())
         return f"TypedDict({{{body_str}}})"
+
+
+@dataclass
+class LSparseTypedDict(LearntType):
+    """TypedDict tracking key presence with counts instead of LMissingTypedDictKey members, for wide objects with
+    mostly optional keys; a key is required if it was present in all merged values"""
+
+    fields: dict[str, LearntType]
+    key_counts: dict[str, int]
+    total_count: int
+
+    @classmethod
+    def from_typed_dict(cls, ltd: LTypedDict) -> "LSparseTypedDict":
+        fields: dict[str, LearntType] = dict()
+        key_counts: dict[str, int] = dict()
+        for key, value_type in ltd.fields.items():
+            if isinstance(value_type, LUnion) and LMissingTypedDictKey() in value_type.member_types:
+                present_types = [m for m in value_type.member_types if not isinstance(m, LMissingTypedDictKey)]
+                fields[key] = present_types[0] if len(present_types) == 1 else LUnion(present_types)
+                key_counts[key] = 0
+            else:
+                fields[key] = value_type
+                key_counts[key] = 1
+        return LSparseTypedDict(fields, key_counts, total_count=1)
+
+    def is_required(self, key: str) -> bool:
+        return self.key_counts[key] >= self.total_count
+
+    def to_typed_dict(self) -> LTypedDict:
+        fields: dict[str, LearntType] = dict()
+        for key, value_type in self.fields.items():
+            if self.is_required(key):
+                fields[key] = value_type
+            else:
+                value_members = value_type.member_types if isinstance(value_type, LUnion) else [value_type]
+                fields[key] = LUnion([*value_members, LMissingTypedDictKey()])
+        return LTypedDict(fields)
+
+    def __str__(self) -> str:
+        return "Sparse" + str(self.to_typed_dict())
+
+
+@dataclass
+class LObject(LearntType):
+    """Instance of a structured class (dataclass, attrs class or pydantic model) learnt by its fields, which are
+    usually a TypedDict; only instances of the same class are merged"""
+
+    object_type: Type[Any]
+    fields: LearntType
+
+    def __str__(self) -> str:
+        return f"{self.object_type.__qualname__}({self.fields})"
+
+
+@dataclass
+class LRecursive(LearntType):
+    """Self-similar type, like a tree node, whose body refers to the type itself with LRecursiveRef-s
+
+    Anchor is the path shape (JSON path with [*] for indices) where the recursive type is rooted, e.g. "$.items[*]"
+    """
+
+    anchor: str
+    body: LearntType
+
+    def __str__(self) -> str:
+        return f"Recursive<{self.anchor}>({self.body})"
+
+
+@dataclass(frozen=True)
+class LRecursiveRef(LearntType):
+    """Reference to the enclosing LRecursive type with the same anchor"""
+
+    anchor: str
+    # name of the generated recursive type, only set while generating type definitions
+    type_name: Optional[str] = field(default=None, compare=False)
+
+    def __str__(self) -> str:
+        return f"<{self.anchor}>"
+
+
+def object_fields_suffix(object_type: type) -> str:
+    """JSON path suffix of object's fields, separating them from dicts and objects of other classes at the same path"""
+    return f"<{object_type.__qualname__}>"
+
+
+def child_types(lt: LearntType) -> list[tuple[str, LearntType]]:
+    """Direct children of a learnt type, each with a JSON path suffix leading to it (empty for union members)"""
+    if isinstance(lt, LUnion):
+        return [("", member) for member in lt.member_types]
+    if isinstance(lt, LTuple):
+        return [(f"[{idx}]", item_type) for idx, item_type in enumerate(lt.item_types)]
+    if isinstance(lt, LCollection):
+        return [("[*]", lt.item_type)]
+    if isinstance(lt, LMapping):
+        return [(".<key>", lt.key_type), (".*", lt.value_type)]
+    if isinstance(lt, (LTypedDict, LSparseTypedDict)):
+        return [("." + key, value_type) for key, value_type in lt.fields.items()]
+    if isinstance(lt, LObject):
+        return [(object_fields_suffix(lt.object_type), lt.fields)]
+    if isinstance(lt, LRecursive):
+        return [("", lt.body)]
+    return []
+
+
+def map_child_types(lt: LearntType, func: Callable[[LearntType], LearntType]) -> LearntType:
+    """Learnt type of the same kind with func applied to each of its direct children"""
+    if isinstance(lt, LUnion):
+        return LUnion([func(member) for member in lt.member_types])
+    if isinstance(lt, LTuple):
+        return LTuple([func(item_type) for item_type in lt.item_types])
+    if isinstance(lt, LCollection):
+        return LCollection(lt.collection_type, func(lt.item_type))
+    if isinstance(lt, LMapping):
+        return LMapping(lt.mapping_type, func(lt.key_type), func(lt.value_type))
+    if isinstance(lt, LTypedDict):
+        return LTypedDict({key: func(value_type) for key, value_type in lt.fields.items()})
+    if isinstance(lt, LSparseTypedDict):
+        return LSparseTypedDict(
+            {key: func(value_type) for key, value_type in lt.fields.items()}, dict(lt.key_counts), lt.total_count
+        )
+    if isinstance(lt, LObject):
+        return LObject(lt.object_type, func(lt.fields))
+    if isinstance(lt, LRecursive):
+        return LRecursive(lt.anchor, func(lt.body))
+    return lt
+
+
+def learnt_type_size(lt: LearntType) -> int:
+    """Total number of nodes in a learnt type tree"""
+    return 1 + sum(learnt_type_size(child) for _, child in child_types(lt))
+
+
+def learnt_type_fingerprint(lt: LearntType, _memo: Optional[dict[int, bytes]] = None) -> bytes:
+    """Structural hash of a learnt type, insensitive to the order of union members
+
+    Memo maps node ids to their fingerprints and is only valid while the tree is alive and unchanged
+    """
+    memo = _memo if _memo is not None else dict()
+    fingerprint = memo.get(id(lt))
+    if fingerprint is not None:
+        return fingerprint
+    hash_ = hashlib.blake2b(type(lt).__name__.encode(), digest_size=16)
+    if isinstance(lt, LLiteral):
+        hash_.update(f"{type(lt.value).__module__}.{type(lt.value).__qualname__}:{lt.value!r}".encode())
+    elif isinstance(lt, LType):
+        hash_.update(f"{lt.type_.__module__}.{lt.type_.__qualname__}".encode())
+    elif isinstance(lt, LCollection):
+        hash_.update(f"{lt.collection_type.__module__}.{lt.collection_type.__qualname__}".encode())
+    elif isinstance(lt, LMapping):
+        hash_.update(f"{lt.mapping_type.__module__}.{lt.mapping_type.__qualname__}".encode())
+    elif isinstance(lt, LObject):
+        hash_.update(f"{lt.object_type.__module__}.{lt.object_type.__qualname__}".encode())
+    elif isinstance(lt, (LRecursive, LRecursiveRef)):
+        hash_.update(lt.anchor.encode())
+        if isinstance(lt, LRecursiveRef) and lt.type_name is not None:
+            hash_.update(b"=" + lt.type_name.encode())
+    if isinstance(lt, LUnion):
+        for member_fingerprint in sorted(learnt_type_fingerprint(member, memo) for member in lt.member_types):
+            hash_.update(member_fingerprint)
+    else:
+        for suffix, child in child_types(lt):
+            if isinstance(lt, LSparseTypedDict) and not lt.is_required(suffix[1:]):
+                # only key's requiredness matters for the structure, not the exact counts
+                suffix += "?"
+            encoded_suffix = suffix.encode()
+            hash_.update(len(encoded_suffix).to_bytes(8, "little"))
+            hash_.update(encoded_suffix)
+            hash_.update(learnt_type_fingerprint(child, memo))
+    fingerprint = hash_.digest()
+    memo[id(lt)] = fingerprint
+    return fingerprint
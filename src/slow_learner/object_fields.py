@@ -0,0 +1,39 @@
+import dataclasses
+import functools
+import operator
+import sys
+from typing import Any, Callable, Optional
+
+# field names of a structured class and a getter returning values of these fields from its instance, as a tuple
+ObjectFields = tuple[tuple[str, ...], Callable[[Any], tuple[Any, ...]]]
+
+
+def _field_names(cls: type) -> Optional[tuple[str, ...]]:
+    if dataclasses.is_dataclass(cls):
+        return tuple(field.name for field in dataclasses.fields(cls))
+    attrs_attributes = getattr(cls, "__attrs_attrs__", None)
+    if attrs_attributes is not None:
+        return tuple(attribute.name for attribute in attrs_attributes)
+    pydantic = sys.modules.get("pydantic")
+    if pydantic is not None and issubclass(cls, pydantic.BaseModel):
+        model_fields = cls.model_fields if hasattr(cls, "model_fields") else getattr(cls, "__fields__")  # pydantic v1
+        return tuple(model_fields)
+    return None
+
+
+def object_fields(cls: type) -> Optional[ObjectFields]:
+    """Fields of dataclass, attrs or pydantic model class, None for other classes; introspected once per class"""
+    return _object_fields(cls)
+
+
+@functools.lru_cache(maxsize=1024)
+def _object_fields(cls: type) -> Optional[ObjectFields]:
+    names = _field_names(cls)
+    if names is None:
+        return None
+    if len(names) == 1:
+        getter = operator.attrgetter(names[0])
+        return names, lambda obj: (getter(obj),)
+    if not names:
+        return names, lambda obj: ()
+    return names, operator.attrgetter(*names)
@@ -0,0 +1,389 @@
+from collections import Counter, defaultdict
+from typing import Any, Optional
+
+from .learnt_types import (
+    LCollection,
+    LearntType,
+    LLiteral,
+    LMapping,
+    LMissingTypedDictKey,
+    LNone,
+    LObject,
+    LRecursive,
+    LRecursiveRef,
+    LSparseTypedDict,
+    LTuple,
+    LType,
+    LTypedDict,
+    LUnion,
+    object_fields_suffix,
+)
+from .subtyping import is_subtype_or_equal
+
+
+def occurrence_kind(lt: LearntType) -> Optional[tuple[Any, ...]]:
+    """Key grouping learnt types that end up in the same union member after simplification"""
+    if isinstance(lt, LNone):
+        return ("none",)
+    if isinstance(lt, LLiteral):
+        return ("type", type(lt.value))
+    if isinstance(lt, LType):
+        return ("type", lt.type_)
+    if isinstance(lt, LTuple):
+        return ("tuple", len(lt.item_types))
+    if isinstance(lt, LCollection):
+        return ("collection", lt.collection_type)
+    if isinstance(lt, LMapping):
+        return ("mapping", lt.mapping_type)
+    if isinstance(lt, (LTypedDict, LSparseTypedDict, LRecursive)):
+        return ("mapping", dict)
+    if isinstance(lt, LObject):
+        return ("object", lt.object_type)
+    if isinstance(lt, LRecursiveRef):
+        return ("recursive", lt.anchor)
+    return None
+
+
+def _update_last_stamps(stamps: dict[Any, float], other_stamps: dict[Any, float]) -> None:
+    for key, stamp in other_stamps.items():
+        stamps[key] = max(stamps.get(key, stamp), stamp)
+
+
+def _unwrap_recursive(lt: LearntType) -> LearntType:
+    # recursive type's body is counted as if it was in its place
+    return lt.body if isinstance(lt, LRecursive) else lt
+
+
+class OccurrenceCounter:
+    """Counts how often each union member, typed dict key and literal value was observed, by JSON path
+
+    Paths are taken from the learnt type rather than from observed values, so the number of counters is bounded
+    by the learnt type size. Values are counted once per containing value, e.g. list items' types are counted
+    once per list.
+
+    If observations are counted with stamps (observation indices or times), the last stamp of each counter is kept as
+    well, so that union members, keys and literals not seen for a while can be forgotten.
+    """
+
+    def __init__(self, max_tracked_literals: int) -> None:
+        self.kinds: defaultdict[str, Counter[tuple[Any, ...]]] = defaultdict(Counter)
+        # typed dict path -> number of times each key was present
+        self.keys: defaultdict[str, Counter[str]] = defaultdict(Counter)
+        # (path, literal type) -> literal value counts; None after more values than can be literals were seen
+        self.literals: dict[tuple[str, type], Optional[Counter[Any]]] = dict()
+        self.max_tracked_literals = max_tracked_literals
+        # last stamps of the counters above
+        self.kinds_last_seen: defaultdict[str, dict[tuple[Any, ...], float]] = defaultdict(dict)
+        self.keys_last_seen: defaultdict[str, dict[str, float]] = defaultdict(dict)
+        self.literals_last_seen: defaultdict[tuple[str, type], dict[Any, float]] = defaultdict(dict)
+        # typed dict path -> last stamp at which each key of the learnt typed dict was missing from an observed one
+        self.keys_last_missing: defaultdict[str, dict[str, float]] = defaultdict(dict)
+
+    def count(self, observed: LearntType, learnt: LearntType, path: str = "$", stamp: Optional[float] = None) -> None:
+        """Counts observed value's type after it was merged into the learnt type"""
+        learnt_members = [
+            _unwrap_recursive(m) for m in (learnt.member_types if isinstance(learnt, LUnion) else [learnt])
+        ]
+        observed_members = [
+            _unwrap_recursive(m) for m in (observed.member_types if isinstance(observed, LUnion) else [observed])
+        ]
+        for observed_member in observed_members:
+            kind = occurrence_kind(observed_member)
+            if kind is None:
+                continue
+            self.kinds[path][kind] += 1
+            if stamp is not None:
+                self.kinds_last_seen[path][kind] = stamp
+            if isinstance(observed_member, LLiteral):
+                self._count_literal(path, observed_member.value, stamp)
+
+            learnt_member = next((m for m in learnt_members if occurrence_kind(m) == kind), None)
+            if learnt_member is None:
+                continue  # absorbed by a wider type, nothing to recurse into
+            if isinstance(observed_member, LTuple) and isinstance(learnt_member, LTuple):
+                for idx, (observed_item, learnt_item) in enumerate(
+                    zip(observed_member.item_types, learnt_member.item_types)
+                ):
+                    self.count(observed_item, learnt_item, f"{path}[{idx}]", stamp)
+            elif isinstance(observed_member, LCollection) and isinstance(learnt_member, LCollection):
+                self.count(observed_member.item_type, learnt_member.item_type, path + "[*]", stamp)
+            elif isinstance(observed_member, LObject) and isinstance(learnt_member, LObject):
+                fields_path = path + object_fields_suffix(observed_member.object_type)
+                self.count(observed_member.fields, learnt_member.fields, fields_path, stamp)
+            elif isinstance(observed_member, LTypedDict) and isinstance(learnt_member, (LTypedDict, LSparseTypedDict)):
+                for key, value_type in observed_member.fields.items():
+                    self.keys[path][key] += 1
+                    if key in learnt_member.fields:
+                        self.count(value_type, learnt_member.fields[key], path + "." + key, stamp)
+                if stamp is not None:
+                    keys_last_seen = self.keys_last_seen[path]
+                    keys_last_missing = self.keys_last_missing[path]
+                    for key in observed_member.fields:
+                        if key not in keys_last_seen:
+                            # a new key was missing from all typed dicts observed before
+                            keys_last_missing.setdefault(key, stamp)
+                        keys_last_seen[key] = stamp
+                    for key in learnt_member.fields:
+                        if key not in observed_member.fields:
+                            keys_last_missing[key] = stamp
+            elif isinstance(learnt_member, LMapping):
+                if path in self.keys:
+                    self._migrate_demoted_typed_dict(path)
+                if isinstance(observed_member, LTypedDict):
+                    for value_type in observed_member.fields.values():
+                        self.count(value_type, learnt_member.value_type, path + ".*", stamp)
+                elif isinstance(observed_member, LMapping):
+                    self.count(observed_member.key_type, learnt_member.key_type, path + ".<key>", stamp)
+                    self.count(observed_member.value_type, learnt_member.value_type, path + ".*", stamp)
+
+    def _count_literal(self, path: str, value: Any, stamp: Optional[float] = None) -> None:
+        literals_key = (path, type(value))
+        if literals_key not in self.literals:
+            self.literals[literals_key] = Counter()
+        literal_counts = self.literals[literals_key]
+        if literal_counts is None:
+            return
+        literal_counts[value] += 1
+        if stamp is not None:
+            self.literals_last_seen[literals_key][value] = stamp
+        if len(literal_counts) > self.max_tracked_literals:
+            self.literals[literals_key] = None
+            self.literals_last_seen.pop(literals_key, None)
+
+    def _migrate_demoted_typed_dict(self, path: str) -> None:
+        """Moves counters from typed dict keys' paths to the value path of the mapping it was demoted to"""
+        value_path = path + ".*"
+        for key in self.keys.pop(path):
+            key_path = path + "." + key
+
+            def migrated(old_path: str) -> Optional[str]:
+                if old_path == key_path or old_path.startswith((key_path + ".", key_path + "[", key_path + "<")):
+                    return value_path + old_path[len(key_path) :]
+                return None
+
+            for old_path in list(self.kinds):
+                new_path = migrated(old_path)
+                if new_path is not None:
+                    self.kinds[new_path].update(self.kinds.pop(old_path))
+            for old_path in list(self.keys):
+                new_path = migrated(old_path)
+                if new_path is not None:
+                    self.keys[new_path].update(self.keys.pop(old_path))
+            for old_path, literal_type in list(self.literals):
+                new_path = migrated(old_path)
+                if new_path is not None:
+                    old_counts = self.literals.pop((old_path, literal_type))
+                    new_counts = self.literals.get((new_path, literal_type), Counter())
+                    if old_counts is None or new_counts is None:
+                        self.literals[(new_path, literal_type)] = None
+                        self.literals_last_seen.pop((old_path, literal_type), None)
+                        self.literals_last_seen.pop((new_path, literal_type), None)
+                    else:
+                        self.literals[(new_path, literal_type)] = new_counts + old_counts
+            path_stamps: tuple[defaultdict[str, dict[Any, float]], ...] = (
+                self.kinds_last_seen,
+                self.keys_last_seen,
+                self.keys_last_missing,
+            )
+            for stamps in path_stamps:
+                for old_path in list(stamps):
+                    new_path = migrated(old_path)
+                    if new_path is not None:
+                        _update_last_stamps(stamps[new_path], stamps.pop(old_path))
+            for old_path, literal_type in list(self.literals_last_seen):
+                new_path = migrated(old_path)
+                if new_path is not None:
+                    _update_last_stamps(
+                        self.literals_last_seen[(new_path, literal_type)],
+                        self.literals_last_seen.pop((old_path, literal_type)),
+                    )
+        for stamps in (self.keys_last_seen, self.keys_last_missing):
+            stamps.pop(path, None)
+
+    def support(self, lt: LearntType, path: str) -> Optional[int]:
+        """Number of observations supporting union member at a given path; None if it is not tracked"""
+        kinds = self.kinds.get(path)
+        if kinds is None:
+            return None
+        if isinstance(lt, LLiteral):
+            literal_counts = self.literals.get((path, type(lt.value)))
+            if literal_counts is not None:
+                return literal_counts[lt.value]
+        if isinstance(lt, (LLiteral, LType)):
+            return sum(
+                count for kind, count in kinds.items() if kind[0] == "type" and is_subtype_or_equal(LType(kind[1]), lt)
+            )
+        kind = occurrence_kind(lt)
+        if kind is None:
+            return None
+        return kinds[kind]
+
+    def last_seen(self, lt: LearntType, path: str) -> Optional[float]:
+        """Last stamp of an observation of union member at a given path; None if it is not tracked"""
+        stamps = self.kinds_last_seen.get(path)
+        if stamps is None:
+            return None
+        if isinstance(lt, LLiteral):
+            literal_stamps = self.literals_last_seen.get((path, type(lt.value)))
+            if literal_stamps is not None:
+                return literal_stamps.get(lt.value)
+        if isinstance(lt, (LLiteral, LType)):
+            return max(
+                (
+                    stamp
+                    for kind, stamp in stamps.items()
+                    if kind[0] == "type" and is_subtype_or_equal(LType(kind[1]), lt)
+                ),
+                default=None,
+            )
+        kind = occurrence_kind(lt)
+        if kind is None:
+            return None
+        return stamps.get(kind)
+
+    def forget(self, lt: LearntType, min_stamp: float, path: str = "$") -> LearntType:
+        """Drops union members, typed dict keys and literals last seen before min_stamp, never all of them, and then
+        their counters
+        """
+        forgotten = self._forget_learnt_type(lt, min_stamp, path)
+        self._forget_counters(min_stamp)
+        return forgotten
+
+    def _forget_learnt_type(self, lt: LearntType, min_stamp: float, path: str) -> LearntType:
+        if isinstance(lt, LSparseTypedDict):
+            lt = lt.to_typed_dict()
+        if isinstance(lt, LRecursive):
+            return LRecursive(lt.anchor, self._forget_learnt_type(lt.body, min_stamp, path))
+        if isinstance(lt, LUnion):
+            live_members: list[LearntType] = []
+            for member in lt.member_types:
+                last_seen = self.last_seen(member, path)
+                if last_seen is None or last_seen >= min_stamp:
+                    live_members.append(member)
+            if not live_members:
+                live_members = lt.member_types
+            forgotten_members = [self._forget_learnt_type(member, min_stamp, path) for member in live_members]
+            return forgotten_members[0] if len(forgotten_members) == 1 else LUnion(forgotten_members)
+        if isinstance(lt, LTypedDict):
+            if path not in self.keys_last_seen:
+                return LTypedDict(
+                    {key: self._forget_learnt_type(vt, min_stamp, path + "." + key) for key, vt in lt.fields.items()}
+                )
+            keys_last_seen = self.keys_last_seen[path]
+            keys_last_missing = self.keys_last_missing.get(path, dict())
+            live_keys = [key for key in lt.fields if keys_last_seen.get(key, min_stamp) >= min_stamp] or list(lt.fields)
+            live_fields: dict[str, LearntType] = dict()
+            for key in live_keys:
+                value_type = lt.fields[key]
+                last_missing = keys_last_missing.get(key)
+                if (
+                    isinstance(value_type, LUnion)
+                    and key in keys_last_seen
+                    and (last_missing is None or last_missing < min_stamp)
+                ):
+                    required_value_types = [
+                        m for m in value_type.member_types if not isinstance(m, LMissingTypedDictKey)
+                    ]
+                    if required_value_types:
+                        value_type = LUnion(required_value_types)
+                live_fields[key] = self._forget_learnt_type(value_type, min_stamp, path + "." + key)
+            return LTypedDict(live_fields)
+        if isinstance(lt, LTuple):
+            return LTuple(
+                [
+                    self._forget_learnt_type(item_type, min_stamp, f"{path}[{idx}]")
+                    for idx, item_type in enumerate(lt.item_types)
+                ]
+            )
+        if isinstance(lt, LCollection):
+            return LCollection(lt.collection_type, self._forget_learnt_type(lt.item_type, min_stamp, path + "[*]"))
+        if isinstance(lt, LObject):
+            fields_path = path + object_fields_suffix(lt.object_type)
+            return LObject(lt.object_type, self._forget_learnt_type(lt.fields, min_stamp, fields_path))
+        if isinstance(lt, LMapping):
+            return LMapping(
+                lt.mapping_type,
+                self._forget_learnt_type(lt.key_type, min_stamp, path + ".<key>"),
+                self._forget_learnt_type(lt.value_type, min_stamp, path + ".*"),
+            )
+        return lt
+
+    def _forget_counters(self, min_stamp: float) -> None:
+        for path, kind_stamps in list(self.kinds_last_seen.items()):
+            for kind in [kind for kind, stamp in kind_stamps.items() if stamp < min_stamp]:
+                del kind_stamps[kind]
+                self.kinds[path].pop(kind, None)
+            if not kind_stamps:
+                del self.kinds_last_seen[path]
+                self.kinds.pop(path, None)
+        for path, key_stamps in list(self.keys_last_seen.items()):
+            for key in [key for key, stamp in key_stamps.items() if stamp < min_stamp]:
+                del key_stamps[key]
+                self.keys[path].pop(key, None)
+            if not key_stamps:
+                del self.keys_last_seen[path]
+                self.keys.pop(path, None)
+        for path, missing_key_stamps in list(self.keys_last_missing.items()):
+            for key in [key for key, stamp in missing_key_stamps.items() if stamp < min_stamp]:
+                del missing_key_stamps[key]
+            if not missing_key_stamps:
+                del self.keys_last_missing[path]
+        for literals_key, literal_stamps in list(self.literals_last_seen.items()):
+            literal_counts = self.literals.get(literals_key)
+            for value in [value for value, stamp in literal_stamps.items() if stamp < min_stamp]:
+                del literal_stamps[value]
+                if literal_counts is not None:
+                    literal_counts.pop(value, None)
+            if not literal_stamps:
+                del self.literals_last_seen[literals_key]
+                self.literals.pop(literals_key, None)
+
+    def prune(self, lt: LearntType, min_support: int, path: str = "$") -> LearntType:
+        """Drops union members and typed dict keys observed less than min_support times; never drops all of them"""
+        if isinstance(lt, LSparseTypedDict):
+            lt = lt.to_typed_dict()
+        if isinstance(lt, LRecursive):
+            return LRecursive(lt.anchor, self.prune(lt.body, min_support, path))
+        if isinstance(lt, LUnion):
+            supported_members: list[LearntType] = []
+            for member in lt.member_types:
+                support = self.support(member, path)
+                if support is None or support >= min_support:
+                    supported_members.append(member)
+            if not supported_members:
+                supported_members = lt.member_types
+            pruned_members = [self.prune(member, min_support, path) for member in supported_members]
+            return pruned_members[0] if len(pruned_members) == 1 else LUnion(pruned_members)
+        if isinstance(lt, LTypedDict):
+            if path not in self.kinds:
+                return LTypedDict({key: self.prune(vt, min_support, path + "." + key) for key, vt in lt.fields.items()})
+            dicts_count = self.kinds[path][("mapping", dict)]
+            key_counts = self.keys.get(path, Counter())
+            supported_keys = [key for key in lt.fields if key_counts[key] >= min_support] or list(lt.fields)
+            pruned_fields: dict[str, LearntType] = dict()
+            for key in supported_keys:
+                value_type = lt.fields[key]
+                if isinstance(value_type, LUnion) and dicts_count - key_counts[key] < min_support:
+                    required_value_types = [
+                        m for m in value_type.member_types if not isinstance(m, LMissingTypedDictKey)
+                    ]
+                    if required_value_types:
+                        value_type = LUnion(required_value_types)
+                pruned_fields[key] = self.prune(value_type, min_support, path + "." + key)
+            return LTypedDict(pruned_fields)
+        if isinstance(lt, LTuple):
+            return LTuple(
+                [self.prune(item_type, min_support, f"{path}[{idx}]") for idx, item_type in enumerate(lt.item_types)]
+            )
+        if isinstance(lt, LCollection):
+            return LCollection(lt.collection_type, self.prune(lt.item_type, min_support, path + "[*]"))
+        if isinstance(lt, LObject):
+            fields_path = path + object_fields_suffix(lt.object_type)
+            return LObject(lt.object_type, self.prune(lt.fields, min_support, fields_path))
+        if isinstance(lt, LMapping):
+            return LMapping(
+                lt.mapping_type,
+                self.prune(lt.key_type, min_support, path + ".<key>"),
+                self.prune(lt.value_type, min_support, path + ".*"),
+            )
+        return lt
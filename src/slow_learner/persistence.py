@@ -0,0 +1,52 @@
+import contextlib
+import os
+import pathlib
+import pickle
+import tempfile
+import zlib
+from typing import IO, Any, Iterator, TextIO, cast
+
+# umask of the process, read once on import since it can only be read by setting it
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+@contextlib.contextmanager
+def _open_replacing(path: pathlib.Path, mode: str) -> Iterator[IO[Any]]:
+    path = pathlib.Path(path)
+    fd, temp_name = tempfile.mkstemp(dir=path.parent, prefix=path.name + ".", suffix=".tmp")
+    try:
+        # temporary files are only readable by the owner, unlike files created with open()
+        os.chmod(temp_name, 0o666 & ~_UMASK)
+        with os.fdopen(fd, mode) as file:
+            yield file
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_name, path)
+    except BaseException:
+        os.unlink(temp_name)
+        raise
+
+
+@contextlib.contextmanager
+def open_atomically(path: pathlib.Path) -> Iterator[TextIO]:
+    """Text file that replaces the file at path once written without an error, and is removed on error, so that
+    the file is never left half-written"""
+    with _open_replacing(path, "w") as file:
+        yield cast(TextIO, file)
+
+
+def write_atomically(data: bytes, path: pathlib.Path) -> None:
+    """Atomically replaces the file with the data, so that it's never left half-written"""
+    with _open_replacing(path, "wb") as file:
+        file.write(data)
+
+
+def save_compressed_pickle(obj: Any, path: pathlib.Path) -> None:
+    """Atomically replaces the file with compressed pickle of the object, so that it's never left half-written"""
+    write_atomically(zlib.compress(pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)), path)
+
+
+def load_compressed_pickle(path: pathlib.Path) -> Any:
+    """Loads the object saved with save_compressed_pickle; only load files written by yourself, unpickling runs code"""
+    return pickle.loads(zlib.decompress(pathlib.Path(path).read_bytes()))
@@ -0,0 +1,191 @@
+import collections
+import collections.abc
+import hashlib
+import logging
+import pathlib
+from typing import Any, Callable, Hashable, Iterator, Optional, TextIO
+
+from .persistence import load_compressed_pickle, save_compressed_pickle
+from .type_learner import TypeLearner, write_types_module
+from .typedef_generation import PythonVersion
+
+logger = logging.getLogger(__name__)
+
+
+def default_type_name(key: Hashable) -> str:
+    """Joins tuple keys' parts with underscores, e.g. ("users", "GET", 200) -> users_GET_200"""
+    if isinstance(key, tuple):
+        return "_".join(str(part) for part in key)
+    return str(key)
+
+
+class _SnapshotLearners(collections.abc.Mapping):
+    """Registry's learners by type name, reading spilled ones from their snapshots without making them resident"""
+
+    def __init__(self, registry: "TypeLearnerRegistry", keys_by_type_name: dict[str, Hashable]) -> None:
+        self.registry = registry
+        self.keys_by_type_name = keys_by_type_name
+
+    def __getitem__(self, type_name: str) -> TypeLearner:
+        return self.registry._peek(self.keys_by_type_name[type_name])
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.keys_by_type_name)
+
+    def __len__(self) -> int:
+        return len(self.keys_by_type_name)
+
+
+class TypeLearnerRegistry:
+    """Type learners by key (e.g. a (service, endpoint, status code) tuple), with at most max_resident of them in
+    memory; least recently used learners are spilled to compressed pickle snapshots in spill_dir and loaded back
+    when their keys are used again
+
+    With max_resident_bytes, least recently used learners are also spilled while the total size of resident ones
+    exceeds it. A learner's size is that of its last snapshot on disk, i.e. a compressed pickle, so it's a proxy
+    for its memory footprint: learners that were not snapshotted yet count as empty, and changed ones by their
+    previous snapshot.
+
+    Learners are created with learner_options as keyword arguments. Snapshots of learners that were not changed
+    since they were loaded are not rewritten. The index of keys is written by flush(), also called on exiting the
+    registry's context, so that the registry can be reopened from the same directory. Not thread-safe.
+    """
+
+    INDEX_FILE = "index.pickle.z"
+
+    def __init__(
+        self,
+        spill_dir: pathlib.Path,
+        max_resident: int = 1000,
+        learner_options: Optional[dict[str, Any]] = None,
+        max_resident_bytes: Optional[int] = None,
+    ) -> None:
+        if max_resident < 1:
+            raise ValueError(f"max_resident must be positive, got {max_resident}")
+        if max_resident_bytes is not None and max_resident_bytes < 1:
+            raise ValueError(f"max_resident_bytes must be positive, got {max_resident_bytes}")
+        self.spill_dir = pathlib.Path(spill_dir)
+        self.spill_dir.mkdir(parents=True, exist_ok=True)
+        self.max_resident = max_resident
+        self.max_resident_bytes = max_resident_bytes
+        self.learner_options = learner_options or dict()
+        # snapshot file names of all known keys, in order of their creation
+        self._snapshot_names: dict[Hashable, str] = dict()
+        self._resident: collections.OrderedDict[Hashable, TypeLearner] = collections.OrderedDict()
+        # keys with up-to-date snapshots on disk
+        self._snapshotted: set[Hashable] = set()
+        # sizes of resident learners' last snapshots and their total, for max_resident_bytes
+        self._resident_sizes: dict[Hashable, int] = dict()
+        self.resident_bytes = 0
+        # loads and spills counts, to size max_resident
+        self.loads = 0
+        self.spills = 0
+        index_path = self.spill_dir / self.INDEX_FILE
+        if index_path.exists():
+            self._snapshot_names = load_compressed_pickle(index_path)
+            self._snapshotted = set(self._snapshot_names)
+            logger.info(f"Loaded index of {len(self._snapshot_names)} learner(s) from {self.spill_dir}")
+
+    def __len__(self) -> int:
+        return len(self._snapshot_names)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._snapshot_names
+
+    def keys(self) -> list[Hashable]:
+        return list(self._snapshot_names)
+
+    @property
+    def resident_keys(self) -> list[Hashable]:
+        """Keys of learners in memory, from the least to the most recently used"""
+        return list(self._resident)
+
+    def _snapshot_path(self, key: Hashable) -> pathlib.Path:
+        return self.spill_dir / self._snapshot_names[key]
+
+    def _load(self, key: Hashable) -> TypeLearner:
+        self.loads += 1
+        return load_compressed_pickle(self._snapshot_path(key))
+
+    def _set_resident_size(self, key: Hashable, size: int) -> None:
+        self.resident_bytes += size - self._resident_sizes.get(key, 0)
+        self._resident_sizes[key] = size
+
+    def _is_over_budget(self) -> bool:
+        if len(self._resident) > self.max_resident:
+            return True
+        # the most recently used learner is kept resident even if it alone is over the budget
+        return (
+            self.max_resident_bytes is not None
+            and self.resident_bytes > self.max_resident_bytes
+            and len(self._resident) > 1
+        )
+
+    def _peek(self, key: Hashable) -> TypeLearner:
+        """Learner of a known key, read from its snapshot if it's spilled, without changing resident learners"""
+        learner = self._resident.get(key)
+        return learner if learner is not None else self._load(key)
+
+    def learner(self, key: Hashable) -> TypeLearner:
+        """Learner of the key, loaded or created if needed; it's considered changed and is resaved when spilled"""
+        learner = self._resident.get(key)
+        if learner is not None:
+            self._resident.move_to_end(key)
+        elif key in self._snapshot_names:
+            learner = self._load(key)
+            self._resident[key] = learner
+            self._set_resident_size(key, self._snapshot_path(key).stat().st_size)
+        else:
+            # keys with the same repr are told apart by the number of keys created before them
+            digest = hashlib.blake2b(repr(key).encode(), digest_size=16).hexdigest()
+            self._snapshot_names[key] = f"{digest}-{len(self._snapshot_names)}.pickle.z"
+            learner = TypeLearner(**self.learner_options)
+            self._resident[key] = learner
+        self._snapshotted.discard(key)
+        while self._is_over_budget():
+            spilled_key, spilled_learner = self._resident.popitem(last=False)
+            self._spill(spilled_key, spilled_learner)
+            self.resident_bytes -= self._resident_sizes.pop(spilled_key, 0)
+        return learner
+
+    def _spill(self, key: Hashable, learner: TypeLearner) -> None:
+        if key not in self._snapshotted:
+            save_compressed_pickle(learner, self._snapshot_path(key))
+            self._snapshotted.add(key)
+            self.spills += 1
+            self._set_resident_size(key, self._snapshot_path(key).stat().st_size)
+
+    def observe(self, key: Hashable, value: Any) -> None:
+        self.learner(key).observe(value)
+
+    def observe_many(self, key: Hashable, values: Any) -> None:
+        self.learner(key).observe_many(values)
+
+    def observe_json_bytes(self, key: Hashable, data: bytes) -> None:
+        self.learner(key).observe_json_bytes(data)
+
+    def flush(self) -> None:
+        """Saves snapshots of changed resident learners and the index of keys, keeping learners in memory"""
+        for key, learner in self._resident.items():
+            self._spill(key, learner)
+        save_compressed_pickle(self._snapshot_names, self.spill_dir / self.INDEX_FILE)
+
+    def write_types_module(
+        self,
+        file: TextIO,
+        doc: str,
+        type_name: Callable[[Hashable], str] = default_type_name,
+        target_version: PythonVersion = PythonVersion.PY38,
+    ) -> None:
+        """Writes types learnt for all keys into a single module (see write_types_module), named with type_name;
+        spilled learners are read one at a time, so that resident memory stays bounded"""
+        keys_by_type_name = {type_name(key): key for key in self._snapshot_names}
+        if len(keys_by_type_name) != len(self._snapshot_names):
+            raise ValueError("Type names of different keys clash")
+        write_types_module(file, _SnapshotLearners(self, keys_by_type_name), doc, target_version)
+
+    def __enter__(self) -> "TypeLearnerRegistry":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.flush()
@@ -0,0 +1,254 @@
+import errno
+import json
+import logging
+import pathlib
+import signal
+import socket
+import socketserver
+import stat
+import threading
+import urllib.parse
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Optional
+
+from .persistence import load_compressed_pickle, save_compressed_pickle
+from .type_learner import TypeLearner
+from .typedef_generation import PythonVersion
+
+logger = logging.getLogger(__name__)
+
+
+class LearnerServer:
+    """Named type learners kept in memory between requests; each learner is used by one request at a time"""
+
+    def __init__(
+        self, learner_options: Optional[dict[str, Any]] = None, checkpoint_path: Optional[pathlib.Path] = None
+    ):
+        self.learner_options = learner_options or dict()
+        self.checkpoint_path = checkpoint_path
+        self.learners: dict[str, TypeLearner] = dict()
+        if checkpoint_path is not None and checkpoint_path.exists():
+            self.learners = load_compressed_pickle(checkpoint_path)
+            logger.info(f"Loaded {len(self.learners)} learner(s) from {checkpoint_path}")
+        self._locks: dict[str, threading.Lock] = {name: threading.Lock() for name in self.learners}
+        self._registry_lock = threading.Lock()
+
+    def _get(self, name: str, create: bool) -> Optional[tuple[TypeLearner, threading.Lock]]:
+        with self._registry_lock:
+            learner = self.learners.get(name)
+            if learner is None:
+                if not create:
+                    return None
+                learner = TypeLearner(**self.learner_options)
+                self.learners[name] = learner
+                self._locks[name] = threading.Lock()
+            return learner, self._locks[name]
+
+    def observe(self, name: str, values: list[Any]) -> int:
+        """Observes values with the named learner, creating it if needed; returns its total observed values count"""
+        learner, lock = self._get(name, create=True)  # type: ignore
+        with lock:
+            learner.observe_many(values)
+            return learner.observed_values
+
+    def generate_type_definition(self, name: str, type_name: str, target_version: PythonVersion) -> Optional[str]:
+        found = self._get(name, create=False)
+        if found is None:
+            return None
+        learner, lock = found
+        with lock:
+            return learner.generate_type_definition(
+                type_name, doc=f"Learnt by slow-learner server as {name!r}", target_version=target_version
+            )
+
+    def observed_values(self) -> dict[str, int]:
+        with self._registry_lock:
+            return {name: learner.observed_values for name, learner in self.learners.items()}
+
+    def delete(self, name: str) -> bool:
+        with self._registry_lock:
+            self._locks.pop(name, None)
+            return self.learners.pop(name, None) is not None
+
+    def checkpoint(self) -> None:
+        if self.checkpoint_path is None:
+            return
+        with self._registry_lock:
+            locks = [self._locks[name] for name in sorted(self._locks)]
+            for lock in locks:
+                lock.acquire()
+            try:
+                save_compressed_pickle(self.learners, self.checkpoint_path)
+            finally:
+                for lock in locks:
+                    lock.release()
+        logger.info(f"Saved {len(self.learners)} learner(s) to {self.checkpoint_path}")
+
+
+class LearnerRequestHandler(BaseHTTPRequestHandler):
+    """JSON API over named learners:
+
+    - GET /learners -- observed values count by learner name
+    - POST /learners/<name>/observe -- observe values from a JSON array in the request body
+    - GET /learners/<name>/typedef?type_name=...&target_version=10 -- generated type definition module
+    - DELETE /learners/<name>
+    - POST /checkpoint -- save learners to the checkpoint file
+    """
+
+    def address_string(self) -> str:
+        # clients connected to a Unix socket have no address
+        if isinstance(self.client_address, tuple):
+            return str(self.client_address[0])
+        return "unix-socket"
+
+    @property
+    def learner_server(self) -> LearnerServer:
+        return self.server.learner_server  # type: ignore
+
+    def _send(self, status: HTTPStatus, body: Any, content_type: str = "application/json") -> None:
+        data = (body if isinstance(body, str) else json.dumps(body)).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type + "; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, status: HTTPStatus, message: str) -> None:
+        self._send(status, {"error": message})
+
+    def _route(self) -> tuple[list[str], dict[str, str]]:
+        url = urllib.parse.urlsplit(self.path)
+        parts = [urllib.parse.unquote(part) for part in url.path.strip("/").split("/")]
+        return parts, dict(urllib.parse.parse_qsl(url.query))
+
+    def do_GET(self) -> None:
+        parts, query = self._route()
+        if parts == ["learners"]:
+            self._send(HTTPStatus.OK, self.learner_server.observed_values())
+        elif len(parts) == 3 and parts[0] == "learners" and parts[2] == "typedef":
+            try:
+                target_version = PythonVersion(int(query.get("target_version", PythonVersion.PY38)))
+            except ValueError:
+                self._send_error(HTTPStatus.BAD_REQUEST, f"Unsupported target version: {query['target_version']}")
+                return
+            try:
+                typedef = self.learner_server.generate_type_definition(
+                    parts[1], query.get("type_name", parts[1]), target_version
+                )
+            except RuntimeError as e:
+                self._send_error(HTTPStatus.CONFLICT, str(e))
+                return
+            if typedef is None:
+                self._send_error(HTTPStatus.NOT_FOUND, f"No learner named {parts[1]!r}")
+            else:
+                self._send(HTTPStatus.OK, typedef, content_type="text/x-python")
+        else:
+            self._send_error(HTTPStatus.NOT_FOUND, f"Unknown path: {self.path}")
+
+    def do_POST(self) -> None:
+        parts, _ = self._route()
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if len(parts) == 3 and parts[0] == "learners" and parts[2] == "observe":
+            try:
+                values = json.loads(body)
+            except ValueError as e:
+                self._send_error(HTTPStatus.BAD_REQUEST, f"Invalid JSON: {e}")
+                return
+            if not isinstance(values, list):
+                self._send_error(HTTPStatus.BAD_REQUEST, "Request body must be a JSON array of values to observe")
+                return
+            try:
+                observed_values = self.learner_server.observe(parts[1], values)
+            except Exception as e:
+                logger.exception(f"Error observing values with learner {parts[1]!r}")
+                self._send_error(HTTPStatus.INTERNAL_SERVER_ERROR, f"Error observing values: {e!r}")
+                return
+            self._send(HTTPStatus.OK, {"observed": len(values), "observed_values": observed_values})
+        elif parts == ["checkpoint"]:
+            self.learner_server.checkpoint()
+            self._send(HTTPStatus.OK, {"learners": len(self.learner_server.learners)})
+        else:
+            self._send_error(HTTPStatus.NOT_FOUND, f"Unknown path: {self.path}")
+
+    def do_DELETE(self) -> None:
+        parts, _ = self._route()
+        if len(parts) == 2 and parts[0] == "learners":
+            if self.learner_server.delete(parts[1]):
+                self._send(HTTPStatus.OK, {"deleted": parts[1]})
+            else:
+                self._send_error(HTTPStatus.NOT_FOUND, f"No learner named {parts[1]!r}")
+        else:
+            self._send_error(HTTPStatus.NOT_FOUND, f"Unknown path: {self.path}")
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Unix socket server removing the socket file left by a server that is no longer running before binding, and
+    its own socket file on closing"""
+
+    daemon_threads = True
+    # server_close() is also called when binding fails, when the socket file isn't this server's to remove
+    socket_bound = False
+
+    def server_bind(self) -> None:
+        _remove_stale_unix_socket(pathlib.Path(self.server_address))  # type: ignore
+        super().server_bind()
+        self.socket_bound = True
+
+    def server_close(self) -> None:
+        super().server_close()
+        if self.socket_bound:
+            pathlib.Path(self.server_address).unlink(missing_ok=True)  # type: ignore
+            self.socket_bound = False
+
+
+def _remove_stale_unix_socket(path: pathlib.Path) -> None:
+    """Removes the socket file if nothing is listening on it; other files are kept, failing the bind"""
+    try:
+        if not stat.S_ISSOCK(path.stat().st_mode):
+            return
+    except FileNotFoundError:
+        return
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(str(path))
+        except ConnectionRefusedError:
+            logger.info(f"Removing stale socket {path}")
+            path.unlink(missing_ok=True)
+            return
+    raise OSError(errno.EADDRINUSE, f"Another server is listening on {path}")
+
+
+def make_http_server(
+    learner_server: LearnerServer, host: str = "127.0.0.1", port: int = 0, unix_socket: Optional[pathlib.Path] = None
+) -> socketserver.BaseServer:
+    """Creates a threading HTTP server on a Unix socket, if given, or on a host and port"""
+    httpd: socketserver.BaseServer
+    if unix_socket is not None:
+        httpd = ThreadingUnixHTTPServer(str(unix_socket), LearnerRequestHandler)
+    else:
+        httpd = ThreadingHTTPServer((host, port), LearnerRequestHandler)
+    httpd.learner_server = learner_server  # type: ignore
+    return httpd
+
+
+def serve(
+    learner_server: LearnerServer, host: str = "127.0.0.1", port: int = 0, unix_socket: Optional[pathlib.Path] = None
+) -> None:
+    """Serves until interrupted or terminated, then checkpoints the learners"""
+    httpd = make_http_server(learner_server, host, port, unix_socket)
+
+    def shutdown(signum: int, frame: Any) -> None:
+        # shutdown() blocks until serve_forever() returns, so it can't be called from the serving thread
+        threading.Thread(target=httpd.shutdown).start()
+
+    previous_sigterm_handler = signal.signal(signal.SIGTERM, shutdown)
+    logger.info(f"Serving on {unix_socket or httpd.server_address}")  # type: ignore
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        signal.signal(signal.SIGTERM, previous_sigterm_handler)
+        httpd.server_close()
+        learner_server.checkpoint()
@@ -1,13 +1,41 @@
 import logging
+from typing import Optional, Union
 
-from .learnt_types import LCollection, LearntType, LLiteral, LMapping, LTuple, LType, LTypedDict, LUnion
+from .learnt_types import (
+    LCollection,
+    LearntType,
+    LLiteral,
+    LMapping,
+    LMissingTypedDictKey,
+    LObject,
+    LSparseTypedDict,
+    LTuple,
+    LType,
+    LTypedDict,
+    LUnion,
+)
 
 logger = logging.getLogger(__name__)
 
 
+def _typed_dict_value_type(lt: Union[LTypedDict, LSparseTypedDict], key: str) -> Optional[LearntType]:
+    """Key's value type as in the LTypedDict form of the typed dict, without converting a whole sparse typed dict"""
+    value_type = lt.fields.get(key)
+    if value_type is None or isinstance(lt, LTypedDict) or lt.is_required(key):
+        return value_type
+    members = value_type.member_types if isinstance(value_type, LUnion) else [value_type]
+    return LUnion([*members, LMissingTypedDictKey()])
+
+
 def is_subtype(maybe_sub: LearntType, maybe_super: LearntType) -> bool:
     if maybe_sub == maybe_super:
         return False
+    if isinstance(maybe_super, LType) and maybe_super.type_ is object:
+        # object is the top type, so that a union generalized to it doesn't grow again with later observations
+        return not isinstance(maybe_sub, LMissingTypedDictKey)
+    typed_dict_types = (LTypedDict, LSparseTypedDict)
+    if isinstance(maybe_sub, typed_dict_types) and not isinstance(maybe_super, (*typed_dict_types, LUnion)):
+        return False  # e.g. a typed dict is never a subtype of None or of a scalar type
     try:
         if isinstance(maybe_sub, LType) and isinstance(maybe_super, LType):
             # special cases in mypy, see https://github.com/python/typing/issues/48
@@ -38,14 +66,21 @@ def is_subtype(maybe_sub: LearntType, maybe_super: LearntType) -> bool:
                 and maybe_sub.key_type == maybe_super.value_type
                 and issubclass(maybe_sub.mapping_type, maybe_super.mapping_type)
             )
-        if isinstance(maybe_sub, LTypedDict) and isinstance(maybe_super, LTypedDict):
-            for super_key, super_value_type in maybe_super.fields.items():
+        if isinstance(maybe_sub, typed_dict_types) and isinstance(maybe_super, typed_dict_types):
+            # sparse typed dicts are compared by their keys' value types, building only the ones that are compared
+            for super_key in maybe_super.fields:
+                sub_value_type = _typed_dict_value_type(maybe_sub, super_key)
+                super_value_type = _typed_dict_value_type(maybe_super, super_key)
                 if not (
-                    super_key in maybe_sub.fields and is_subtype_or_equal(maybe_sub.fields[super_key], super_value_type)
+                    sub_value_type is not None
+                    and super_value_type is not None
+                    and is_subtype_or_equal(sub_value_type, super_value_type)
                 ):
                     return False
             else:
                 return True
+        if isinstance(maybe_sub, LObject) and isinstance(maybe_super, LObject):
+            return maybe_sub.object_type is maybe_super.object_type and is_subtype(maybe_sub.fields, maybe_super.fields)
         if isinstance(maybe_sub, LUnion):
             return all(is_subtype(member, maybe_super) for member in maybe_sub.member_types)
         if isinstance(maybe_super, LUnion):
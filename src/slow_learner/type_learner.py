@@ -1,12 +1,29 @@
 import collections.abc
+import concurrent.futures
+import io
 import itertools
+import json
 import logging
 import pathlib
+import random
 import re
+import sys
+import time
+from dataclasses import dataclass, field
 from enum import Enum
-from functools import reduce
-from typing import Any, Iterable, Optional, Union, cast
+from typing import Any, Callable, Iterable, Mapping, Optional, Sequence, TextIO, Union, cast
 
+from .columns import (
+    ColumnSummary,
+    column_lists,
+    numpy_array,
+    numpy_array_item_type,
+    rows_count,
+    summarize_columns,
+)
+from .item_scanning import ItemScanPolicy
+from .json_path import JsonPath
+from .json_tokens import JsonTokenTypeLearner
 from .learnt_types import (
     LCollection,
     LearntType,
@@ -14,19 +31,91 @@ from .learnt_types import (
     LMapping,
     LMissingTypedDictKey,
     LNone,
+    LObject,
+    LRecursive,
+    LRecursiveRef,
+    LSparseTypedDict,
     LTuple,
     LType,
     LTypedDict,
     LUnion,
+    child_types,
+    learnt_type_fingerprint,
+    learnt_type_size,
+    map_child_types,
 )
+from .object_fields import object_fields
+from .occurrences import OccurrenceCounter
+from .persistence import open_atomically
 from .subtyping import is_subtype, is_subtype_or_equal
-from .typedef_generation import PythonVersion, generate_typedef_rhs, new_type_name
-from .utils import group_and_process, to_json_path
+from .typedef_generation import (
+    PythonVersion,
+    StreamingTypedefs,
+    TypedefCache,
+    TypedefNamespace,
+    generate_typedef_rhs,
+    join_union_typedefs,
+    new_type_name,
+    render_types_module,
+)
+from .typedef_parsing import parse_typedef_module
+from .unions import BucketedUnion
+from .utils import to_json_path, to_json_path_shape
 
 logger = logging.getLogger(__name__)
 
 
+@dataclass
+class _RecursionContext:
+    """State of recursive types detection while learning a single value"""
+
+    # paths and keys of enclosing dicts that may become anchors of recursive types, outermost first
+    frames: list[tuple[list[Union[str, int]], set[str]]] = field(default_factory=list)
+    # learnt types of self-similar dicts found under anchors that are not learnt yet, by anchor path shape
+    bodies: dict[str, list[LearntType]] = field(default_factory=dict)
+
+
+# values of the discriminator field that route observed values to sub-learners
+DiscriminatorTag = Union[str, int]
+
+
+def _observe_batch(learner: "TypeLearner", values: list[Any]) -> "TypeLearner":
+    """Module-level so that it can be run in a process pool; returns the learner since it is a copy there"""
+    for value in values:
+        learner.observe(value)
+    return learner
+
+
+# returned by checks that do not apply to the checked value
+_NOT_CHECKED = object()
+
+# learnt type versions are unique within the process, also across learners and unpickled copies of them
+_learnt_type_versions = itertools.count()
+
+
+def _has_literals(lt: LearntType) -> bool:
+    return isinstance(lt, LLiteral) or any(_has_literals(child) for _, child in child_types(lt))
+
+
+def _same_kind_variants(union: LUnion) -> list[list[LearntType]]:
+    """Union members that may be merged into one type: tuples and collections, typed dicts, objects and mappings"""
+    containers: list[LearntType] = [m for m in union.member_types if isinstance(m, (LTuple, LCollection))]
+    dict_likes: list[LearntType] = [
+        m for m in union.member_types if isinstance(m, (LTypedDict, LSparseTypedDict, LObject, LMapping))
+    ]
+    return [containers, dict_likes]
+
+
+def _without_missing_key(lt: LearntType) -> LearntType:
+    if isinstance(lt, LUnion) and LMissingTypedDictKey() in lt.member_types:
+        members = [m for m in lt.member_types if not isinstance(m, LMissingTypedDictKey)]
+        return members[0] if len(members) == 1 else LUnion(members)
+    return lt
+
+
 class TypeLearner:
+    MAX_CACHED_TYPEDEFS = 8
+
     def __init__(
         self,
         max_literal_type_size: int = 10,
@@ -35,28 +124,201 @@ class TypeLearner:
         max_typed_dict_size: int = 100,
         max_recursive_type_depth: int = 10,
         no_literal_patterns: Optional[list[str]] = None,
+        max_learnt_type_size: Optional[int] = None,
+        size_check_every: int = 10,
+        track_occurrences: bool = False,
+        min_support: int = 0,
+        prune_every: Optional[int] = None,
+        sparse_typed_dicts: bool = False,
+        discriminator: Optional[str] = None,
+        detect_recursive_types: bool = False,
+        min_recursive_key_similarity: float = 0.5,
+        window_size: Optional[int] = None,
+        window_seconds: Optional[float] = None,
+        forget_every: int = 100,
+        item_scan_policy: Optional[ItemScanPolicy] = None,
+        seed_type: Optional[LearntType] = None,
+        include_paths: Optional[list[str]] = None,
+        exclude_paths: Optional[list[str]] = None,
+        opaque_excluded_paths: bool = False,
+        merge_memo_size: int = 0,
+        learn_object_fields: bool = False,
     ) -> None:
-        self.learnt_type: Optional[LearntType] = None
+        if window_size is not None and window_seconds is not None:
+            raise ValueError("Learning window can be bounded either by observations count or by time, not both")
+        if size_check_every < 1:
+            raise ValueError(f"size_check_every must be positive, got {size_check_every}")
+        self._learnt_type: Optional[LearntType] = None
+        self._learnt_type_version = next(_learnt_type_versions)
         self.observed_values = 0
         self.max_literal_type_size = max_literal_type_size
         self.max_literl_string_length = max_literal_string_length
         self.max_typed_dict_size = max_typed_dict_size
         self.learn_typed_dicts = learn_typed_dicts
+        # merged typed dicts are represented with LSparseTypedDict, which is much faster for wide objects
+        self.sparse_typed_dicts = sparse_typed_dicts
         self.max_recursive_type_depth = max_recursive_type_depth
+        # self-similar dicts (e.g. tree nodes) are learnt as recursive types instead of being expanded level by level
+        # up to max_recursive_type_depth; dicts are self-similar when the share of keys they have in common with
+        # the enclosing dict (Jaccard index) is at least min_recursive_key_similarity
+        self.detect_recursive_types = detect_recursive_types
+        self.min_recursive_key_similarity = min_recursive_key_similarity
         self.no_literal_patterns = [re.compile(patt) for patt in no_literal_patterns or []]
+        # instances of dataclasses, attrs classes and pydantic models are learnt per class as typed dicts of their
+        # fields instead of opaque types, reading the fields directly with accessors cached per class
+        self.learn_object_fields = learn_object_fields
+        # learnt type is generalized when it has more nodes than that, generalizations are recorded by JSON path;
+        # nodes are counted every size_check_every merges of observed types and before generating type definitions
+        self.max_learnt_type_size = max_learnt_type_size
+        self.size_check_every = size_check_every
+        self._merges_since_size_check = 0
+        self.generalized_paths: dict[str, str] = dict()
+        # union members, typed dict keys and literals observed less than min_support times are pruned from the
+        # generated type definition and, if prune_every is set, from the learnt type every prune_every observations
+        self.min_support = min_support
+        self.prune_every = prune_every
+        # in windowed mode, union members, typed dict keys, literals and discriminator tags that were not observed
+        # within the last window_size observations or window_seconds seconds are forgotten every forget_every
+        # observations, so the learnt type follows the current schema rather than the full history
+        self.window_size = window_size
+        self.window_seconds = window_seconds
+        self.forget_every = forget_every
+        self._tags_last_seen: dict[Optional[DiscriminatorTag], float] = dict()
+        # items of large collections and mappings are sampled once their type is stable, sampled containers are
+        # counted by JSON path shape
+        self.item_scan_policy = item_scan_policy
+        self.sampled_paths: collections.Counter[str] = collections.Counter()
+        self._item_sampling_random = random.Random(item_scan_policy.seed if item_scan_policy is not None else None)
+        self.occurrences: Optional[OccurrenceCounter] = (
+            OccurrenceCounter(max_tracked_literals=max_literal_type_size)
+            if track_occurrences or min_support > 0 or self.windowed
+            else None
+        )
+        # dicts with str or int value in the discriminator field are learnt by independent sub-learners, one per
+        # value (tag); the generated type is a union of per-tag types, other values are learnt by this learner
+        self.discriminator = discriminator
+        self.sub_learners: dict[DiscriminatorTag, TypeLearner] = dict()
+        # values under paths matching exclude patterns or not leading to include patterns (JSONPath expressions)
+        # are not learnt and typed as Any or, with opaque_excluded_paths, as their python type; decisions are cached
+        # by path pattern: keys and indices not named by any pattern at their position are replaced by their type,
+        # so that the cache size is bounded by the patterns rather than by the data
+        self.include_paths = [JsonPath(expression) for expression in include_paths or []]
+        self.exclude_paths = [JsonPath(expression) for expression in exclude_paths or []]
+        self.opaque_excluded_paths = opaque_excluded_paths
+        self.path_projection = bool(self.include_paths or self.exclude_paths)
+        self._projection_named_parts: list[set[Union[str, int]]] = []
+        for json_path in self.include_paths + self.exclude_paths:
+            for idx, segment in enumerate(json_path.segments):
+                if idx == len(self._projection_named_parts):
+                    self._projection_named_parts.append(set())
+                if isinstance(segment, int) and segment < 0:
+                    raise ValueError(
+                        f"Negative indices are not supported in included and excluded paths: {json_path.expression}"
+                    )
+                if segment is not None:
+                    self._projection_named_parts[idx].add(segment)
+        self._excluded_paths_cache: dict[tuple[Union[str, int, type], ...], bool] = dict()
+        # merges of observed types into the learnt type are memoized by both types' fingerprints (and settings affecting
+        # simplification), keeping up to merge_memo_size most recently used results; recurring document shapes are
+        # then merged without simplifying again. Sparse typed dicts are merged in place, so they are never memoized
+        self.merge_memo_size = merge_memo_size
+        self.merge_memo_hits = 0
+        self.merge_memo_misses = 0
+        self._merge_memo: collections.OrderedDict[tuple[bytes, bytes, tuple], tuple[LearntType, bytes]] = (
+            collections.OrderedDict()
+        )
+        self._fingerprinted_learnt_type: Optional[tuple[LearntType, bytes]] = None
+        # once seeded with a known type, observed values are checked against the learnt type first and only
+        # the parts deviating from it are learnt and merged
+        self.seeded = False
+        if seed_type is not None:
+            self.seed(seed_type)
+        # generated typedefs are cached by learnt types' versions, so that regenerating them is cheap; typedefs of
+        # typed dicts are reused by their fingerprints when the learnt type changes
+        self._typedef_cache = TypedefCache()
+        self._generated_typedefs: dict[
+            tuple[tuple[tuple[Optional[DiscriminatorTag], int], ...], int, str, PythonVersion],
+            tuple[str, frozenset[tuple[str, str]], dict[str, str]],
+        ] = dict()
+
+    def __getstate__(self) -> dict[str, Any]:
+        # generated typedef and merge caches are cheap to rebuild and may be large, so they are not pickled
+        state = self.__dict__.copy()
+        del state["_typedef_cache"]
+        del state["_generated_typedefs"]
+        del state["_merge_memo"]
+        del state["_fingerprinted_learnt_type"]
+        return state
 
-    def _learn_variable_type(self, var: Any, _path: Optional[list[Union[str, int]]] = None) -> LearntType:
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._typedef_cache = TypedefCache()
+        self._generated_typedefs = dict()
+        self._merge_memo = collections.OrderedDict()
+        self._fingerprinted_learnt_type = None
+        self._learnt_type_version = next(_learnt_type_versions)
+
+    def _spawn_sub_learner(self) -> "TypeLearner":
+        return TypeLearner(
+            max_literal_type_size=self.max_literal_type_size,
+            max_literal_string_length=self.max_literl_string_length,
+            learn_typed_dicts=self.learn_typed_dicts,
+            max_typed_dict_size=self.max_typed_dict_size,
+            max_recursive_type_depth=self.max_recursive_type_depth,
+            no_literal_patterns=[patt.pattern for patt in self.no_literal_patterns],
+            max_learnt_type_size=self.max_learnt_type_size,
+            size_check_every=self.size_check_every,
+            track_occurrences=self.occurrences is not None,
+            min_support=self.min_support,
+            prune_every=self.prune_every,
+            sparse_typed_dicts=self.sparse_typed_dicts,
+            detect_recursive_types=self.detect_recursive_types,
+            min_recursive_key_similarity=self.min_recursive_key_similarity,
+            window_size=self.window_size,
+            window_seconds=self.window_seconds,
+            forget_every=self.forget_every,
+            item_scan_policy=self.item_scan_policy,
+            include_paths=[json_path.expression for json_path in self.include_paths],
+            exclude_paths=[json_path.expression for json_path in self.exclude_paths],
+            opaque_excluded_paths=self.opaque_excluded_paths,
+            merge_memo_size=self.merge_memo_size,
+            learn_object_fields=self.learn_object_fields,
+        )
+
+    def _discriminator_tag(self, value: Any) -> Optional[DiscriminatorTag]:
+        if self.discriminator is None or not isinstance(value, dict):
+            return None
+        tag = value.get(self.discriminator)
+        if isinstance(tag, str) or (isinstance(tag, int) and not isinstance(tag, bool)):
+            return tag
+        return None
+
+    def _sub_learner(self, tag: DiscriminatorTag) -> "TypeLearner":
+        sub_learner = self.sub_learners.get(tag)
+        if sub_learner is None:
+            sub_learner = self._spawn_sub_learner()
+            self.sub_learners[tag] = sub_learner
+        return sub_learner
+
+    def _learn_variable_type(
+        self,
+        var: Any,
+        _path: Optional[list[Union[str, int]]] = None,
+        _recursion: Optional["_RecursionContext"] = None,
+        _reanchored: bool = False,
+    ) -> LearntType:
         path = _path or []
+        recursion = _recursion
+        if recursion is None and self.detect_recursive_types:
+            recursion = _RecursionContext()
+        numpy = sys.modules.get("numpy")
+        if numpy is not None and isinstance(var, numpy.generic):
+            var = var.item()  # numpy scalars are learnt as their python counterparts
         # simple basic types learning
         if var is None:
             return LNone()
         if isinstance(var, (int, str, bytes, bool, Enum)):
-            json_path = to_json_path(path)
-            if (
-                self.max_literal_type_size > 0
-                and not any(no_literal_pattern.match(json_path) for no_literal_pattern in self.no_literal_patterns)
-                and not (isinstance(var, str) and len(var) > self.max_literl_string_length)
-            ):
+            if self._literal_allowed(var, path):
                 return LLiteral(var)
             else:
                 return LType(type(var))
@@ -66,273 +328,1084 @@ class TypeLearner:
             return LType(type(var))
         if isinstance(var, tuple):
             return LTuple(
-                item_types=[self._learn_variable_type(item, _path=path + [index]) for index, item in enumerate(var)]
+                item_types=[self._learn_child_type(item, path + [index], recursion) for index, item in enumerate(var)]
             )
         if isinstance(var, collections.abc.Mapping):
+            if (
+                self.item_scan_policy is not None
+                and len(var) > self.item_scan_policy.stable_items
+                and self._learnt_as_mapping(var)
+            ):
+                return self._learn_scanned_mapping(var, path, recursion)
+            is_recursion_frame = (
+                recursion is not None
+                and self.learn_typed_dicts
+                and isinstance(var, dict)
+                and all(isinstance(k, str) for k in var)
+            )
+            if is_recursion_frame and not _reanchored:
+                recursive_ref = self._learn_self_similar_dict(var, path, recursion)  # type: ignore
+                if recursive_ref is not None:
+                    return recursive_ref
+            if is_recursion_frame:
+                recursion.frames.append((path, set(var)))  # type: ignore
             learnt_value_type_by_key: dict[Any, LearntType] = {
-                k: self._learn_variable_type(v, _path=path + [k]) for k, v in var.items()
+                k: self._learn_child_type(v, path + [k], recursion) for k, v in var.items()
             }
+            if is_recursion_frame:
+                recursion.frames.pop()  # type: ignore
             learnt_key_types = [self._learn_variable_type(k, _path=path + [k]) for k in learnt_value_type_by_key.keys()]
             if (
                 self.learn_typed_dicts
                 and isinstance(var, dict)
                 and all(is_subtype_or_equal(kt, LType(str)) for kt in learnt_key_types)
             ):
-                return LTypedDict(learnt_value_type_by_key)
+                typed_dict = LTypedDict(learnt_value_type_by_key)
+                if is_recursion_frame and not _reanchored:
+                    anchor = to_json_path_shape(path)
+                    self_similar_bodies = recursion.bodies.pop(anchor, None)  # type: ignore
+                    if self_similar_bodies:
+                        return LRecursive(anchor, self._reduce_simplifying([typed_dict, *self_similar_bodies]))
+                return typed_dict
             else:
                 return LMapping(
                     mapping_type=type(var),
                     key_type=self._reduce_simplifying(learnt_key_types),
                     value_type=self._reduce_simplifying(learnt_value_type_by_key.values()),
                 )
+        if numpy is not None and isinstance(var, numpy.ndarray):
+            # arrays of any shape are typed by their elements, which are all of the dtype
+            return LCollection(numpy.ndarray, item_type=LType(numpy_array_item_type(var)))
         if isinstance(var, collections.abc.Collection):
+            if self.item_scan_policy is not None and len(var) > self.item_scan_policy.stable_items:
+                items = var if isinstance(var, collections.abc.Sequence) else list(var)
+                return LCollection(
+                    type(var),
+                    item_type=self._scan_item_types(
+                        len(items),
+                        lambda index: self._learn_child_type(items[index], path + [index], recursion),
+                        path,
+                    ),
+                )
             learnt_item_types = [
-                self._learn_variable_type(item, _path=path + [index]) for index, item in enumerate(var)
+                self._learn_child_type(item, path + [index], recursion) for index, item in enumerate(var)
             ]
             return LCollection(
                 type(var),
                 item_type=self._reduce_simplifying(learnt_item_types),
             )
 
+        if self.learn_object_fields:
+            fields = object_fields(type(var))
+            if fields is not None:
+                names, getter = fields
+                return LObject(
+                    type(var),
+                    LTypedDict(
+                        {
+                            name: self._learn_child_type(value, path + [name], recursion)
+                            for name, value in zip(names, getter(var))
+                        }
+                    ),
+                )
+
         # opaque type as a fallback
         return LType(type_=type(var))
 
-    def _reduce_simplifying(self, lts: Iterable[LearntType]) -> LearntType:
-        if not lts:
-            return LUnion([])
-        return reduce(lambda lt1, lt2: self._simplify_learnt_type(LUnion([lt1, lt2])), lts)
+    def _learn_deviating_type(
+        self, var: Any, expected: LearntType, path: list[Union[str, int]]
+    ) -> Optional[LearntType]:
+        """None if merging the value's type into the expected type would not change it, otherwise the value's learnt
+        type with conforming parts replaced by the expected ones, so that only deviating parts are learnt
 
-    def _simplify_learnt_type(self, lt: LearntType) -> LearntType:
-        lt_prev = lt
-        while True:
-
-            # flattening union type (Union[Union[str, int], bytes] => Union[str, int, bytes])
-            if isinstance(lt, LUnion):
-                flat_members: list[LearntType] = []
-                for member_type in lt.member_types:
-                    if isinstance(member_type, LUnion):
-                        flat_members.extend(member_type.member_types)
-                    else:
-                        flat_members.append(member_type)
-                lt = LUnion(flat_members)
-
-            # deduplicating union types (Union[str, str, int] => Union[str, int])
-            if isinstance(lt, LUnion):
-                # can't use set because there's no hashability guarantee
-                dedup_member_types: list[LearntType] = []
-                for member in lt.member_types:
-                    if member not in dedup_member_types:
-                        dedup_member_types.append(member)
-                lt = LUnion(dedup_member_types)
-
-            # replacing exhaustive bool literal union with bool type (Union[Literal[True], Literal[False], ...] -> Union[bool, ...])
-            if isinstance(lt, LUnion):
-                literal_true = LLiteral(True)
-                literal_false = LLiteral(False)
-                if literal_true in lt.member_types and literal_false in lt.member_types:
-                    lt = LUnion(
-                        [m for m in lt.member_types if m != literal_true and m != literal_false] + [LType(bool)]
+        Collections and mappings whose items' literals may exceed the literal type size limit are learnt as a whole,
+        since conforming items count toward the limit too. Conforming nested containers are still checked one by
+        one, so literals accumulated only across their items (e.g. in the items of sibling lists) are not counted.
+        """
+        members = expected.member_types if isinstance(expected, LUnion) else [expected]
+        excluded = bool(path) and self._excludes_path(path)
+        if len(path) <= self.max_recursive_type_depth and not excluded:
+            if isinstance(var, tuple):
+                expected_tuple = next(
+                    (m for m in members if isinstance(m, LTuple) and len(m.item_types) == len(var)), None
+                )
+                if expected_tuple is not None:
+                    item_types = [
+                        self._learn_deviating_type(item, item_type, path + [index])
+                        for index, (item, item_type) in enumerate(zip(var, expected_tuple.item_types))
+                    ]
+                    if all(item_type is None for item_type in item_types):
+                        return None
+                    return LTuple(
+                        [
+                            expected_item_type if item_type is None else item_type
+                            for item_type, expected_item_type in zip(item_types, expected_tuple.item_types)
+                        ]
                     )
-
-            # generalizing too large unions of literals (Literal[1, 2, 3, ...] => int)
-            if isinstance(lt, LUnion):
-                literal_members: list[LLiteral] = []
-                other_members: list[LearntType] = []
-                for member in lt.member_types:
-                    if isinstance(member, LLiteral):
-                        literal_members.append(member)
-                    else:
-                        other_members.append(member)
-                if len(literal_members) > self.max_literal_type_size:
-                    simple_type_members = [LType(type(lm.value)) for lm in literal_members]
-                    lt = self._simplify_learnt_type(LUnion(simple_type_members + other_members))
-
-            # merge same-length tuples in a union (tuple[str, int] | tuple[float, bool] => tuple[str | float, int | bool])
-            if isinstance(lt, LUnion):
-
-                def generalize_same_length_tuples(lts: list[LearntType]) -> list[LearntType]:
-                    if not lts or not all(isinstance(lt, LTuple) for lt in lts):
-                        return lts
-                    union_tuples = cast(list[LTuple], lts)
-                    result_tuple = union_tuples[0]
-                    for member in union_tuples:
-                        for idx in range(len(result_tuple.item_types)):
-                            result_tuple.item_types[idx] = self._simplify_learnt_type(
-                                LUnion([result_tuple.item_types[idx], member.item_types[idx]])
-                            )
-                    return [result_tuple]
-
-                lt = LUnion(
-                    member_types=group_and_process(
-                        lt.member_types,
-                        group_key=lambda lt: len(lt.item_types) if isinstance(lt, LTuple) else None,
-                        group_processor=generalize_same_length_tuples,
+            elif isinstance(var, collections.abc.Mapping):
+                deviating_type = self._learn_deviating_mapping_type(var, members, path)
+                if deviating_type is not _NOT_CHECKED:
+                    return deviating_type
+            elif (
+                self.learn_object_fields and self.learn_typed_dicts and (fields := object_fields(type(var))) is not None
+            ):
+                # object's fields are checked as a shallow dict against the fields of the same class' objects
+                expected_object = next(
+                    (m for m in members if isinstance(m, LObject) and m.object_type is type(var)), None
+                )
+                if expected_object is not None:
+                    names, getter = fields
+                    deviating_type = self._learn_deviating_mapping_type(
+                        dict(zip(names, getter(var))),
+                        (
+                            expected_object.fields.member_types
+                            if isinstance(expected_object.fields, LUnion)
+                            else [expected_object.fields]
+                        ),
+                        path,
                     )
+                    if deviating_type is not _NOT_CHECKED:
+                        return None if deviating_type is None else LObject(type(var), deviating_type)
+            elif (
+                isinstance(var, collections.abc.Collection)
+                and not isinstance(var, (str, bytes))
+                and not numpy_array(var)
+            ):
+                expected_collection = next(
+                    (m for m in members if isinstance(m, LCollection) and m.collection_type is type(var)), None
                 )
-
-            # merging same-type collections (list[int] | list[str] -> list[int | str])
-            if isinstance(lt, LUnion):
-
-                def merge_same_type_collections(lts: list[LearntType]) -> list[LearntType]:
-                    if not lts or not all(isinstance(lt, LCollection) for lt in lts):
-                        return lts
-                    union_learnt_collections = cast(list[LCollection], lts)
-                    return [
-                        LCollection(
-                            collection_type=union_learnt_collections[0].collection_type,
-                            item_type=self._simplify_learnt_type(
-                                LUnion([collection.item_type for collection in union_learnt_collections])
-                            ),
+                if expected_collection is not None:
+                    deviating_item_types = [
+                        item_type
+                        for index, item in enumerate(var)
+                        if (
+                            item_type := self._learn_deviating_type(item, expected_collection.item_type, path + [index])
                         )
+                        is not None
                     ]
+                    if any(_has_literals(item_type) for item_type in deviating_item_types) or (
+                        self._exceeds_literal_type_size(enumerate(var), path)
+                    ):
+                        # conforming items' literals count toward the literal type size limit as well, so the
+                        # collection is learnt as a whole
+                        return self._learn_variable_type(var, _path=path)
+                    if not deviating_item_types:
+                        return None
+                    return LCollection(type(var), self._reduce_simplifying(deviating_item_types))
+        lt = self._excluded_path_type(type(var)) if excluded else self._learn_variable_type(var, _path=path)
+        if isinstance(lt, LUnion) and not lt.member_types:
+            return None  # Any (nothing learnt) is absorbed by any type
+        if isinstance(lt, LLiteral):
+            # literals are compared with their types, since e.g. True == 1
+            literal_key = (type(lt.value), lt.value)
+            if any(isinstance(m, LLiteral) and (type(m.value), m.value) == literal_key for m in members) or any(
+                isinstance(m, LType) and is_subtype(lt, m) for m in members
+            ):
+                return None
+        elif isinstance(lt, (LNone, LType, LCollection)) and any(is_subtype_or_equal(lt, m) for m in members):
+            return None
+        return lt
+
+    def _exceeds_literal_type_size(
+        self, keyed_items: Iterable[tuple[Union[str, int], Any]], path: list[Union[str, int]]
+    ) -> bool:
+        """Whether there are more distinct items learnt as literals than a literal type may have"""
+        literal_items: set[tuple[type, Any]] = set()
+        for key, item in keyed_items:
+            if isinstance(item, (int, str, bytes, bool, Enum)) and self._literal_allowed(item, path + [key]):
+                literal_items.add((type(item), item))
+                if len(literal_items) > self.max_literal_type_size:
+                    return True
+        return False
 
-                lt = LUnion(
-                    member_types=group_and_process(
-                        lt.member_types,
-                        group_key=lambda lt: lt.collection_type if isinstance(lt, LCollection) else None,
-                        group_processor=merge_same_type_collections,
+    def _learn_deviating_mapping_type(
+        self, var: collections.abc.Mapping, members: list[LearntType], path: list[Union[str, int]]
+    ) -> Any:
+        """Like _learn_deviating_type, but returns _NOT_CHECKED if there's no expected typed dict or mapping"""
+        learnt_as_typed_dict = self.learn_typed_dicts and isinstance(var, dict) and all(isinstance(k, str) for k in var)
+        if learnt_as_typed_dict:
+            expected_typed_dict = next((m for m in members if isinstance(m, (LTypedDict, LSparseTypedDict))), None)
+            if expected_typed_dict is not None:
+                fields: dict[str, LearntType] = dict()
+                deviates = isinstance(expected_typed_dict, LSparseTypedDict)  # key counts are merged anyway
+                for key, value in var.items():
+                    expected_value_type = expected_typed_dict.fields.get(key)
+                    if expected_value_type is None:
+                        fields[key] = self._learn_child_type(value, path + [key])
+                        deviates = True
+                        continue
+                    value_type = self._learn_deviating_type(value, expected_value_type, path + [key])
+                    if value_type is None:
+                        fields[key] = _without_missing_key(expected_value_type)
+                    else:
+                        fields[key] = value_type
+                        deviates = True
+                if not deviates and isinstance(expected_typed_dict, LTypedDict):
+                    deviates = any(
+                        key not in var
+                        and not (isinstance(value_type, LUnion) and LMissingTypedDictKey() in value_type.member_types)
+                        for key, value_type in expected_typed_dict.fields.items()
                     )
-                )
+                return LTypedDict(fields) if deviates else None
+        expected_mapping = next((m for m in members if isinstance(m, LMapping) and m.mapping_type is type(var)), None)
+        if expected_mapping is None:
+            return _NOT_CHECKED
+        deviating_key_types: list[LearntType] = []
+        deviating_value_types: list[LearntType] = []
+        if learnt_as_typed_dict and not is_subtype_or_equal(LType(str), expected_mapping.key_type):
+            # the typed dict would be demoted to a mapping with str keys, even if it's empty
+            deviating_key_types.append(LType(str))
+        for key, value in var.items():
+            if not learnt_as_typed_dict:
+                key_type = self._learn_deviating_type(key, expected_mapping.key_type, path + [key])
+                if key_type is not None:
+                    deviating_key_types.append(key_type)
+            value_type = self._learn_deviating_type(value, expected_mapping.value_type, path + [key])
+            if value_type is not None:
+                deviating_value_types.append(value_type)
+        if (
+            any(_has_literals(lt) for lt in itertools.chain(deviating_key_types, deviating_value_types))
+            or self._exceeds_literal_type_size(var.items(), path)
+            or (not learnt_as_typed_dict and self._exceeds_literal_type_size(((k, k) for k in var), path))
+        ):
+            # conforming keys' and values' literals count toward the literal type size limit as well, so the mapping
+            # is learnt as a whole
+            return self._learn_variable_type(var, _path=path)
+        if not deviating_key_types and not deviating_value_types:
+            return None
+        return LMapping(
+            type(var), self._reduce_simplifying(deviating_key_types), self._reduce_simplifying(deviating_value_types)
+        )
 
-            # merging typed dicts in a union
-            if isinstance(lt, LUnion):
-
-                def merge_typed_dicts(lts: list[LearntType]) -> list[LearntType]:
-                    if not lts or not all(isinstance(lt, LTypedDict) for lt in lts):
-                        return lts
-                    union_typed_dicts = cast(list[LTypedDict], lts)
-                    return [
-                        LTypedDict(
-                            {
-                                k: self._simplify_learnt_type(
-                                    LUnion([ltd.fields.get(k, LMissingTypedDictKey()) for ltd in union_typed_dicts])
-                                )
-                                for k in itertools.chain.from_iterable(lt.fields.keys() for lt in union_typed_dicts)
-                            }
-                        )
-                    ]
+    def _learn_child_type(
+        self, var: Any, path: list[Union[str, int]], recursion: Optional["_RecursionContext"] = None
+    ) -> LearntType:
+        """Learns the type of a dict value or a collection item, unless its path is excluded"""
+        if self.path_projection and self._excludes_path(path):
+            return self._excluded_path_type(type(var))
+        return self._learn_variable_type(var, _path=path, _recursion=recursion)
 
-                lt = LUnion(
-                    member_types=group_and_process(
-                        lt.member_types,
-                        group_key=lambda lt: 1 if isinstance(lt, LTypedDict) else 0,
-                        group_processor=merge_typed_dicts,
-                    )
+    def _excludes_path(self, path: list[Union[str, int]]) -> bool:
+        if not self.path_projection:
+            return False
+        # paths longer than the longest pattern are decided by their prefix
+        key = tuple(
+            part if part in named_parts else type(part) for part, named_parts in zip(path, self._projection_named_parts)
+        )
+        excluded = self._excluded_paths_cache.get(key)
+        if excluded is None:
+            excluded = any(json_path.covers(path) for json_path in self.exclude_paths) or (
+                bool(self.include_paths)
+                and not any(
+                    json_path.covers(path) or json_path.may_match_below(path) for json_path in self.include_paths
                 )
+            )
+            self._excluded_paths_cache[key] = excluded
+        return excluded
 
-            # demoting typed dicts to mappings if they are too large or if there are already regular mappings
-            def demote_typed_dict_to_mapping(lt: LearntType) -> LearntType:
-                if not isinstance(lt, LTypedDict):
-                    return lt
-                else:
-                    union_value_type = self._simplify_learnt_type(LUnion(list(lt.fields.values())))
-                    if isinstance(union_value_type, LUnion):
-                        union_value_type = LUnion(
-                            [vt for vt in union_value_type.member_types if vt != LMissingTypedDictKey()]
-                        )
-                    return LMapping(mapping_type=dict, key_type=LType(str), value_type=union_value_type)
-
-            if isinstance(lt, LUnion):
-                if any(
-                    isinstance(member, LMapping)
-                    or (isinstance(member, LTypedDict) and len(member.fields) > self.max_typed_dict_size)
-                    for member in lt.member_types
-                ):
-                    lt = LUnion([demote_typed_dict_to_mapping(member) for member in lt.member_types])
-
-            if isinstance(lt, LTypedDict) and len(lt.fields) > self.max_typed_dict_size:
-                lt = demote_typed_dict_to_mapping(lt)
-
-            # merging mappings in a union
-            if isinstance(lt, LUnion):
-
-                def merge_same_type_mappings(lts: list[LearntType]) -> list[LearntType]:
-                    if not lts or not all(isinstance(lt, LMapping) for lt in lts):
-                        return lts
-                    union_mappings = cast(list[LMapping], lts)
-                    return [
-                        LMapping(
-                            mapping_type=union_mappings[0].mapping_type,
-                            key_type=self._simplify_learnt_type(LUnion([m.key_type for m in union_mappings])),
-                            value_type=self._simplify_learnt_type(LUnion([m.value_type for m in union_mappings])),
-                        )
-                    ]
+    def _excluded_path_type(self, type_: type) -> LearntType:
+        if not self.opaque_excluded_paths:
+            return LUnion([])  # generated as Any
+        return LNone() if type_ is type(None) else LType(type_)
 
-                lt = LUnion(
-                    member_types=group_and_process(
-                        lt.member_types,
-                        group_key=lambda lt: lt.mapping_type if isinstance(lt, LMapping) else None,
-                        group_processor=merge_same_type_mappings,
-                    )
-                )
+    def _learnt_as_mapping(self, var: collections.abc.Mapping) -> bool:
+        """Whether the mapping's type will be a mapping rather than a typed dict, possibly after its demotion"""
+        return (
+            not self.learn_typed_dicts
+            or not isinstance(var, dict)
+            or len(var) > self.max_typed_dict_size
+            or not all(isinstance(k, str) for k in var)
+        )
 
-            # removing union members that are subtypes of other members (Union[str, int, bool] => Union[str, int])
-            # NOTE: this is done after merging everything
-            if isinstance(lt, LUnion):
-                lt = LUnion(
-                    [
-                        member
-                        for member in lt.member_types
-                        if not any(is_subtype(member, other_member) for other_member in lt.member_types)
-                    ]
+    def _learn_scanned_mapping(
+        self, var: collections.abc.Mapping, path: list[Union[str, int]], recursion: Optional["_RecursionContext"]
+    ) -> LMapping:
+        keys = list(var)
+
+        def learn_item(index: int) -> LearntType:
+            key = keys[index]
+            return LTuple(
+                [
+                    self._learn_variable_type(key, _path=path + [key]),
+                    self._learn_child_type(var[key], path + [key], recursion),
+                ]
+            )
+
+        key_type, value_type = cast(LTuple, self._scan_item_types(len(keys), learn_item, path)).item_types
+        if self.learn_typed_dicts and isinstance(var, dict) and is_subtype_or_equal(key_type, LType(str)):
+            # a large typed dict would be demoted to a mapping with str keys
+            return LMapping(mapping_type=dict, key_type=LType(str), value_type=value_type)
+        return LMapping(mapping_type=type(var), key_type=key_type, value_type=value_type)
+
+    def _scan_item_types(
+        self, items_count: int, learn_item: Callable[[int], LearntType], path: list[Union[str, int]]
+    ) -> LearntType:
+        """Learns items' types by index and reduces them, following the item scan policy: once the reduced type stays
+        unchanged for enough consecutive items, or enough items were scanned, only a sample of the remaining items is
+        learnt"""
+        policy = cast(ItemScanPolicy, self.item_scan_policy)
+        union = BucketedUnion(self)
+        # typed dicts may be merged in place, so changes are detected by fingerprint; fingerprinting walks the whole
+        # reduced type, so it's only done every check_every items
+        check_every = min(policy.check_every, policy.stable_items)
+        reduced_fingerprint: Optional[bytes] = None
+        # index of the item after which the reduced type was last seen changed
+        changed_at = 0
+        index = 0
+        while index < min(items_count, policy.max_scanned_items):
+            union.add(learn_item(index))
+            index += 1
+            if index % check_every == 0:
+                fingerprint = learnt_type_fingerprint(union.to_learnt_type())
+                if fingerprint != reduced_fingerprint:
+                    reduced_fingerprint = fingerprint
+                    changed_at = index
+                elif index - changed_at >= policy.stable_items:
+                    break
+        if index < items_count:
+            for sampled_index in policy.sampled_indices(index, items_count, self._item_sampling_random):
+                union.add(learn_item(sampled_index))
+            self.sampled_paths[to_json_path_shape(path)] += 1
+        return union.to_learnt_type()
+
+    def _learn_self_similar_dict(
+        self, var: dict[str, Any], path: list[Union[str, int]], recursion: "_RecursionContext"
+    ) -> Optional[LRecursiveRef]:
+        """If the dict is self-similar to an enclosing one, i.e. it has a container under the same key through which
+        it was reached from there (like replies of a comment) and enough keys in common with it, learns it at the
+        enclosing dict's (anchor's) path and returns a reference to the anchor; learnt bodies are merged into the
+        anchor's type when it's learnt"""
+        for frame_idx in reversed(range(len(recursion.frames))):
+            anchor_path, anchor_keys = recursion.frames[frame_idx]
+            key = path[len(anchor_path)]
+            if not (isinstance(key, str) and isinstance(var.get(key), (dict, list, tuple))):
+                continue
+            key_similarity = len(anchor_keys.intersection(var)) / len(anchor_keys.union(var))
+            if key_similarity >= self.min_recursive_key_similarity:
+                break
+        else:
+            return None
+        frames = recursion.frames
+        recursion.frames = frames[:frame_idx]
+        try:
+            body = self._learn_variable_type(var, _path=anchor_path, _recursion=recursion, _reanchored=True)
+        finally:
+            recursion.frames = frames
+        anchor = to_json_path_shape(anchor_path)
+        recursion.bodies.setdefault(anchor, []).append(body)
+        return LRecursiveRef(anchor)
+
+    def _literal_allowed(self, var: Any, path: list[Union[str, int]]) -> bool:
+        return (
+            self.max_literal_type_size > 0
+            and not (isinstance(var, str) and len(var) > self.max_literl_string_length)
+            and not any(no_literal_pattern.match(to_json_path(path)) for no_literal_pattern in self.no_literal_patterns)
+        )
+
+    def _learn_column_type(self, column: ColumnSummary) -> LearntType:
+        """Learns the type of the column's values as if they were observed one by one"""
+        path: list[Union[str, int]] = [column.name]
+        if column.scalar_type is None:
+            # learning each distinct value once, unhashable values are learnt every time
+            distinct_values: dict[Any, Any] = dict()
+            unhashable_values: list[Any] = []
+            for value in column.values or []:
+                try:
+                    distinct_values.setdefault((type(value), value), value)
+                except TypeError:
+                    unhashable_values.append(value)
+            values: Iterable[Any] = itertools.chain(distinct_values.values(), unhashable_values)
+            return self._reduce_simplifying(self._learn_variable_type(value, _path=path) for value in values)
+        member_types: list[LearntType]
+        if column.distinct_values is None:
+            member_types = [LType(column.scalar_type)]
+        else:
+            member_types = [self._learn_variable_type(value, _path=path) for value in column.distinct_values]
+        if column.has_nulls:
+            member_types.append(LNone())
+        return self._reduce_simplifying(member_types)
+
+    def _reduce_simplifying(self, lts: Iterable[LearntType]) -> LearntType:
+        union = BucketedUnion(self)
+        for lt in lts:
+            union.add(lt)
+        return union.to_learnt_type()
+
+    def _simplify_learnt_type(self, lt: LearntType) -> LearntType:
+        if isinstance(lt, LUnion):
+            return self._reduce_simplifying(lt.member_types)
+        if isinstance(lt, (LTypedDict, LSparseTypedDict)) and len(lt.fields) > self.max_typed_dict_size:
+            return self._demote_typed_dict_to_mapping(lt)
+        return lt
+
+    def _merge_typed_dicts(
+        self, ltd1: Union[LTypedDict, LSparseTypedDict], ltd2: Union[LTypedDict, LSparseTypedDict]
+    ) -> Union[LTypedDict, LSparseTypedDict]:
+        if self.sparse_typed_dicts or isinstance(ltd1, LSparseTypedDict) or isinstance(ltd2, LSparseTypedDict):
+            return self._merge_sparse_typed_dicts([ltd1, ltd2])
+        ltd1 = cast(LTypedDict, ltd1)
+        ltd2 = cast(LTypedDict, ltd2)
+        return LTypedDict(
+            {
+                k: self._simplify_learnt_type(
+                    LUnion([ltd1.fields.get(k, LMissingTypedDictKey()), ltd2.fields.get(k, LMissingTypedDictKey())])
                 )
+                for k in itertools.chain(ltd1.fields.keys(), (k for k in ltd2.fields.keys() if k not in ltd1.fields))
+            }
+        )
+
+    def _merge_sparse_typed_dicts(self, lts: Sequence[Union[LTypedDict, LSparseTypedDict]]) -> LSparseTypedDict:
+        """Merges typed dicts into the first one, made sparse, in place, so that merging costs proportionally to the
+        number of keys in the other typed dicts, not in the accumulated one
 
-            # recursing into union members
-            # if isinstance(lt, LUnion):
-            # lt = LUnion([self._simplify_learnt_type(m) for m in lt.member_types])
+        Value types of each key are collected from all typed dicts and simplified at once, with keys in the order of
+        their first appearance, so that the result is the same as merging regular typed dicts.
+        """
+        first = lts[0]
+        value_types_by_key: dict[str, list[LearntType]] = dict()
+        if isinstance(first, LSparseTypedDict):
+            accumulator = first
+        else:
+            accumulator = LSparseTypedDict.from_typed_dict(first)
+            # fields of a typed dict that was not merged before may be not simplified yet
+            value_types_by_key = {key: [value_type] for key, value_type in accumulator.fields.items()}
+        for other in lts[1:]:
+            other_sparse = other if isinstance(other, LSparseTypedDict) else LSparseTypedDict.from_typed_dict(other)
+            for key, value_type in other_sparse.fields.items():
+                value_types = value_types_by_key.get(key)
+                if value_types is None:
+                    existing_value_type = accumulator.fields.get(key)
+                    value_types = [] if existing_value_type is None else [existing_value_type]
+                    value_types_by_key[key] = value_types
+                value_types.append(value_type)
+                accumulator.key_counts[key] = accumulator.key_counts.get(key, 0) + other_sparse.key_counts[key]
+            accumulator.total_count += other_sparse.total_count
+        for key, value_types in value_types_by_key.items():
+            accumulator.fields[key] = self._reduce_simplifying(value_types)
+        return accumulator
+
+    def _demote_typed_dict_to_mapping(self, lt: LearntType) -> LearntType:
+        if not isinstance(lt, (LTypedDict, LSparseTypedDict)):
+            return lt
+        else:
+            union_value_type = self._simplify_learnt_type(LUnion(list(lt.fields.values())))
+            if isinstance(union_value_type, LUnion):
+                union_value_type = LUnion([vt for vt in union_value_type.member_types if vt != LMissingTypedDictKey()])
+            return LMapping(mapping_type=dict, key_type=LType(str), value_type=union_value_type)
 
-            # simplifying trivial unions (Union[T] -> T)
-            if isinstance(lt, LUnion):
-                if len(lt.member_types) == 1:
-                    lt = lt.member_types[0]
+    def _replace_simplifying(self, lt: LearntType, target: LearntType, replacement: LearntType) -> LearntType:
+        """Replaces target node in the learnt type tree, re-simplifying all nodes on the path to it"""
+        if lt is target:
+            return replacement
+        changed = False
 
-            if lt == lt_prev:
-                return lt  # the last iteration was noop - postprocessing done
+        def replace_child(child: LearntType) -> LearntType:
+            nonlocal changed
+            new_child = self._replace_simplifying(child, target, replacement)
+            if new_child is not child:
+                changed = True
+            return new_child
+
+        new_lt = map_child_types(lt, replace_child)
+        return self._simplify_learnt_type(new_lt) if changed else lt
+
+    def _next_generalization(self, lt: LearntType) -> Optional[tuple[str, LearntType, LearntType, str]]:
+        """Finds the most significant generalization step for the learnt type tree, in order of preference:
+
+        - typed dict with the most keys is demoted to mapping
+        - union with the most literals has them replaced with their types
+        - union with the most variants of the same kind has them merged: tuples and collections into a collection
+          of all their items, typed dicts, objects and mappings into a typed dict with optional keys (or a mapping)
+        - as a last resort, the largest union is replaced with object type (keeping typed dict key optional, if needed)
+        """
+        typed_dicts: list[tuple[int, int, str, Union[LTypedDict, LSparseTypedDict]]] = []
+        literal_unions: list[tuple[int, int, str, LUnion]] = []
+        mergeable_unions: list[tuple[int, int, str, LUnion]] = []
+        unions: list[tuple[int, int, str, LUnion]] = []
+
+        def visit(lt: LearntType, path: str) -> int:
+            size = 1 + sum(visit(child, path + suffix) for suffix, child in child_types(lt))
+            if isinstance(lt, (LTypedDict, LSparseTypedDict)):
+                typed_dicts.append((len(lt.fields), size, path, lt))
+            elif isinstance(lt, LUnion):
+                literals_count = sum(1 for member in lt.member_types if isinstance(member, LLiteral))
+                if literals_count > 1:
+                    literal_unions.append((literals_count, size, path, lt))
+                mergeable_count = sum(len(variants) for variants in _same_kind_variants(lt) if len(variants) > 1)
+                if mergeable_count:
+                    mergeable_unions.append((mergeable_count, size, path, lt))
+                if sum(1 for member in lt.member_types if not isinstance(member, LMissingTypedDictKey)) > 1:
+                    unions.append((len(lt.member_types), size, path, lt))
+            return size
+
+        visit(lt, "$")
+
+        def most_significant(candidates: list[tuple[int, int, str, Any]]) -> tuple[int, int, str, Any]:
+            # ties are broken by path to keep generalization deterministic
+            return min(candidates, key=lambda c: (-c[0], -c[1], c[2]))
+
+        if typed_dicts:
+            keys_count, _, path, typed_dict = most_significant(typed_dicts)
+            return (
+                path,
+                typed_dict,
+                self._demote_typed_dict_to_mapping(typed_dict),
+                f"typed dict with {keys_count} key(s) demoted to mapping",
+            )
+        if literal_unions:
+            literals_count, _, path, union = most_significant(literal_unions)
+            return (
+                path,
+                union,
+                self._simplify_learnt_type(
+                    LUnion([LType(type(m.value)) if isinstance(m, LLiteral) else m for m in union.member_types])
+                ),
+                f"{literals_count} literal(s) generalized to their types",
+            )
+        if mergeable_unions:
+            variants_count, _, path, union = most_significant(mergeable_unions)
+            merged_members = list(union.member_types)
+            for variants in _same_kind_variants(union):
+                if len(variants) > 1:
+                    merged_members = [m for m in merged_members if all(m is not v for v in variants)]
+                    merged_members.append(self._merge_same_kind_variants(variants))
+            return (
+                path,
+                union,
+                self._simplify_learnt_type(LUnion(merged_members)),
+                f"{variants_count} variant(s) of union of {len(union.member_types)} type(s) merged by kind",
+            )
+        if unions:
+            members_count, _, path, union = most_significant(unions)
+            missing_key_members = [m for m in union.member_types if isinstance(m, LMissingTypedDictKey)]
+            return (
+                path,
+                union,
+                self._simplify_learnt_type(LUnion([LType(object), *missing_key_members])),
+                f"union of {members_count} type(s) generalized to object as a last resort",
+            )
+        return None
+
+    def _merge_same_kind_variants(self, variants: list[LearntType]) -> LearntType:
+        """Merges union variants of the same kind (see _same_kind_variants) into one type"""
+        if all(isinstance(v, (LTuple, LCollection)) for v in variants):
+            item_types = [
+                item_type
+                for v in variants
+                for item_type in (v.item_types if isinstance(v, LTuple) else [cast(LCollection, v).item_type])
+            ]
+            # variable-length tuples are typed as sequences, as LCollection(tuple, ...) would be a 1-tuple
+            collection_types = {
+                collections.abc.Sequence if isinstance(v, LTuple) else cast(LCollection, v).collection_type
+                for v in variants
+            }
+            return LCollection(
+                collection_type=collection_types.pop() if len(collection_types) == 1 else collections.abc.Collection,
+                item_type=self._reduce_simplifying(item_types),
+            )
+        merged = self._reduce_simplifying([v.fields if isinstance(v, LObject) else v for v in variants])
+        if isinstance(merged, LUnion):
+            # mappings of different types
+            mappings = cast(list[LMapping], merged.member_types)
+            return LMapping(
+                mapping_type=cast(type, collections.abc.Mapping),
+                key_type=self._reduce_simplifying([m.key_type for m in mappings]),
+                value_type=self._reduce_simplifying([m.value_type for m in mappings]),
+            )
+        return merged
+
+    def _fit_size_budget(self) -> None:
+        self._merges_since_size_check = 0
+        if self.learnt_type is None or self.max_learnt_type_size is None:
+            return
+        while learnt_type_size(self.learnt_type) > self.max_learnt_type_size:
+            generalization = self._next_generalization(self.learnt_type)
+            if generalization is None:
+                return  # nothing left to generalize, the budget is too tight for this type
+            path, target, replacement, description = generalization
+            self.learnt_type = self._replace_simplifying(self.learnt_type, target, replacement)
+            self.generalized_paths[path] = description
+            logger.info(f"Learnt type is over the size budget, generalized {path}: {description}")
+
+    def _merge_observed_type(self, lt: LearntType) -> None:
+        if self.learnt_type is None:
+            self.learnt_type = self._simplify_learnt_type(lt)
+        elif self.merge_memo_size > 0 and not self.sparse_typed_dicts:
+            self.learnt_type = self._merge_memoized(self.learnt_type, lt)
+        else:
+            self.learnt_type = self._simplify_learnt_type(LUnion([self.learnt_type, lt]))
+        self._merges_since_size_check += 1
+        if self._merges_since_size_check >= self.size_check_every:
+            self._fit_size_budget()
+
+    def _merge_memoized(self, learnt_type: LearntType, lt: LearntType) -> LearntType:
+        if self._fingerprinted_learnt_type is None or self._fingerprinted_learnt_type[0] is not learnt_type:
+            self._fingerprinted_learnt_type = (learnt_type, learnt_type_fingerprint(learnt_type))
+        settings = (self.max_literal_type_size, self.max_typed_dict_size, self.learn_typed_dicts)
+        key = (self._fingerprinted_learnt_type[1], learnt_type_fingerprint(lt), settings)
+        memoized = self._merge_memo.get(key)
+        if memoized is not None:
+            self._merge_memo.move_to_end(key)
+            self.merge_memo_hits += 1
+        else:
+            merged = self._simplify_learnt_type(LUnion([learnt_type, lt]))
+            memoized = (merged, learnt_type_fingerprint(merged))
+            self._merge_memo[key] = memoized
+            if len(self._merge_memo) > self.merge_memo_size:
+                self._merge_memo.popitem(last=False)
+            self.merge_memo_misses += 1
+        self._fingerprinted_learnt_type = memoized
+        return memoized[0]
+
+    def seed(self, lt: LearntType) -> None:
+        """Merges a known type into the learnt type; with a discriminator, typed dicts with a literal tag in the
+        discriminator field seed the tag's sub-learner
+
+        Seeded learners check observed values against the learnt type and only learn the parts that deviate from it.
+        Conformance checks are skipped with occurrence tracking, recursive types detection or an item scan policy,
+        which all need the complete learnt type of each value.
+        """
+        untagged_members: list[LearntType] = []
+        for member in lt.member_types if isinstance(lt, LUnion) else [lt]:
+            tag = self._seed_tag(member)
+            if tag is None:
+                untagged_members.append(member)
             else:
-                lt_prev = lt  # running next iteration
+                self._sub_learner(tag).seed(member)
+        if untagged_members:
+            self._merge_observed_type(self._reduce_simplifying(untagged_members))
+            self.seeded = True
+
+    def seed_from_module(self, source: str, type_name: str, namespace: Optional[dict[str, Any]] = None) -> None:
+        """Seeds the learner with a type definition from a module generated by TypeLearner, see parse_typedef_module"""
+        self.seed(parse_typedef_module(source, type_name, namespace))
+
+    def _seed_tag(self, lt: LearntType) -> Optional[DiscriminatorTag]:
+        if self.discriminator is None or not isinstance(lt, LTypedDict):
+            return None
+        tag_type = lt.fields.get(self.discriminator)
+        if isinstance(tag_type, LLiteral):
+            return self._discriminator_tag({self.discriminator: tag_type.value})
+        return None
+
+    def _checks_conformance(self) -> bool:
+        return (
+            self.seeded
+            and self.learnt_type is not None
+            and self.occurrences is None
+            and not self.detect_recursive_types
+            and self.item_scan_policy is None
+        )
+
+    @property
+    def learnt_type(self) -> Optional[LearntType]:
+        return self._learnt_type
+
+    @learnt_type.setter
+    def learnt_type(self, lt: Optional[LearntType]) -> None:
+        # learnt types may be changed in place (e.g. sparse typed dicts), so the version changes on every assignment
+        self._learnt_type = lt
+        self._learnt_type_version = next(_learnt_type_versions)
+
+    @property
+    def _merges_batches(self) -> bool:
+        """Whether merging the type learnt from a batch by a fresh learner gives the same state as observing it"""
+        return (
+            self.occurrences is None
+            and not self.windowed
+            and self.max_learnt_type_size is None
+            and not self.seeded
+            and (self.item_scan_policy is None or not self.item_scan_policy.random_sampling)
+        )
+
+    @property
+    def windowed(self) -> bool:
+        return self.window_size is not None or self.window_seconds is not None
+
+    def _stamp(self) -> float:
+        """Current position on the learning window's scale: observation index or time"""
+        return time.time() if self.window_seconds is not None else self.observed_values
+
+    def _window_start(self) -> float:
+        if self.window_seconds is not None:
+            return time.time() - self.window_seconds
+        return self.observed_values - cast(int, self.window_size)
 
     def observe(self, value: Any) -> None:
-        lt = self._learn_variable_type(value)
-        if self.learnt_type is None:
-            self.learnt_type = lt
+        tag = self._discriminator_tag(value)
+        stamp = self._stamp() if self.windowed else None
+        if stamp is not None:
+            self._tags_last_seen[tag] = stamp
+        if tag is not None:
+            self._sub_learner(tag).observe(value)
+        elif self._checks_conformance():
+            deviating_type = self._learn_deviating_type(value, cast(LearntType, self.learnt_type), [])
+            if deviating_type is not None:
+                self._merge_observed_type(deviating_type)
         else:
-            self.learnt_type = LUnion([self.learnt_type, lt])
-        self.learnt_type = self._simplify_learnt_type(self.learnt_type)
+            self._merge_value_type(self._learn_variable_type(value), stamp)
+        self._count_observation(tagged=tag is not None)
+
+    def _merge_value_type(self, lt: LearntType, stamp: Optional[float]) -> None:
+        self._merge_observed_type(lt)
+        if self.occurrences is not None:
+            self.occurrences.count(lt, cast(LearntType, self.learnt_type), stamp=stamp)
+
+    def _count_observation(self, tagged: bool) -> None:
         self.observed_values += 1
+        if not tagged and self.prune_every and self.observed_values % self.prune_every == 0:
+            self.prune()
+        if self.windowed and self.observed_values % self.forget_every == 0:
+            self.forget()
+
+    def observe_json_bytes(self, data: bytes) -> None:
+        """Observes a JSON document, giving the same result as observe(json.loads(data))
+
+        UTF-8 encoded documents are learnt from their tokens without building python objects, only decoding object
+        keys and potential literals. Parts of the document that are not learnt (too deep or excluded by path
+        projection) and long strings are not validated. With a discriminator, seeding, recursive types detection
+        or an item scan policy, the document is decoded and observed as usual.
+        """
+        if (
+            self.discriminator is not None
+            or self._checks_conformance()
+            or self.detect_recursive_types
+            or self.item_scan_policy is not None
+            or json.detect_encoding(data) != "utf-8"
+        ):
+            self.observe(json.loads(data))
+            return
+        stamp = self._stamp() if self.windowed else None
+        if stamp is not None:
+            self._tags_last_seen[None] = stamp
+        self._merge_value_type(JsonTokenTypeLearner(self, data).learn(), stamp)
+        self._count_observation(tagged=False)
+
+    def observe_columns(self, columns: Any) -> None:
+        """Observes rows of a columnar dataset: numpy structured (or masked) array, pyarrow table or record batch,
+        or a mapping of column names to equal-length sequences
+
+        Each column's type is learnt at once from its dtype or schema and its distinct values, giving the same result
+        as observing each row as a dict (with nulls as None). With occurrence tracking, a discriminator, path projection
+        or without typed dict learning, rows are observed one by one instead. Otherwise, each call is a single merge
+        for the size budget.
+        """
+        rows = rows_count(columns)
+        if (
+            self.occurrences is not None
+            or self.discriminator is not None
+            or self.path_projection
+            or not self.learn_typed_dicts
+            or (isinstance(columns, collections.abc.Mapping) and not all(isinstance(name, str) for name in columns))
+        ):
+            lists = column_lists(columns)
+            for row in zip(*lists.values()):
+                self.observe(dict(zip(lists.keys(), row)))
+            return
+        if rows == 0:
+            return
+        summaries = summarize_columns(columns, max_distinct=self.max_literal_type_size)
+        self._merge_observed_type(LTypedDict({column.name: self._learn_column_type(column) for column in summaries}))
+        self.observed_values += rows
+
+    def observe_many(self, values: Iterable[Any], executor: Optional[concurrent.futures.Executor] = None) -> None:
+        """Observes values in order; with an executor, values routed to different sub-learners are observed in
+        parallel, giving the same result as observing them one by one unless literal or typed dict size limits are
+        reached, which makes the result depend on the order in which values are learnt
+
+        Only the batches are sent to the executor, each learnt by a fresh learner with the same settings; their learnt
+        types are merged into the sub-learners, so a process pool may be used. Sub-learners whose state can't be merged
+        this way (occurrence tracking, learning window, size budget, seeding or random item sampling) are sent along
+        with their batches and replaced with the ones returned from the executor.
+        """
+        if executor is None or self.discriminator is None:
+            for value in values:
+                self.observe(value)
+            return
+        batches: dict[DiscriminatorTag, list[Any]] = dict()
+        untagged_values: list[Any] = []
+        for value in values:
+            tag = self._discriminator_tag(value)
+            if tag is None:
+                untagged_values.append(value)
+            else:
+                batches.setdefault(tag, []).append(value)
+        futures: dict[DiscriminatorTag, concurrent.futures.Future[TypeLearner]] = dict()
+        for tag, batch in batches.items():
+            sub_learner = self._sub_learner(tag)
+            batch_learner = self._spawn_sub_learner() if sub_learner._merges_batches else sub_learner
+            futures[tag] = executor.submit(_observe_batch, batch_learner, batch)
+        for value in untagged_values:
+            self.observe(value)
+        for tag, future in futures.items():
+            batch_learner = future.result()
+            sub_learner = self.sub_learners[tag]
+            if sub_learner._merges_batches:
+                if batch_learner.learnt_type is not None:
+                    sub_learner._merge_observed_type(batch_learner.learnt_type)
+                sub_learner.observed_values += batch_learner.observed_values
+                sub_learner.sampled_paths.update(batch_learner.sampled_paths)
+            else:
+                self.sub_learners[tag] = batch_learner
+            self.observed_values += len(batches[tag])
+        if self.windowed:
+            # tags are stamped once per batch
+            stamp = self._stamp()
+            for tag in batches:
+                self._tags_last_seen[tag] = stamp
+            self.forget()
+
+    def _pruned_learnt_type(self) -> Optional[LearntType]:
+        if self.learnt_type is None or self.occurrences is None or self.min_support <= 0:
+            return self.learnt_type
+        return self.occurrences.prune(self.learnt_type, self.min_support)
+
+    def prune(self) -> None:
+        """Drops union members, typed dict keys and literals observed less than min_support times"""
+        self.learnt_type = self._pruned_learnt_type()
+        for sub_learner in self.sub_learners.values():
+            sub_learner.prune()
+
+    def forget(self) -> None:
+        """Drops union members, typed dict keys, literals and discriminator tags not observed within the learning
+        window; never drops everything
+        """
+        if not self.windowed:
+            return
+        window_start = self._window_start()
+        stale_tags = [tag for tag, stamp in self._tags_last_seen.items() if stamp < window_start]
+        if len(stale_tags) < len(self._tags_last_seen):
+            for tag in stale_tags:
+                del self._tags_last_seen[tag]
+                if tag is None:
+                    self.learnt_type = None
+                    self.occurrences = OccurrenceCounter(max_tracked_literals=self.max_literal_type_size)
+                else:
+                    del self.sub_learners[tag]
+        if self.learnt_type is not None and self.occurrences is not None:
+            self.learnt_type = self.occurrences.forget(self.learnt_type, window_start)
+        for sub_learner in self.sub_learners.values():
+            sub_learner.forget()
+
+    def _tagged_learnt_types(self) -> list[tuple[Optional[DiscriminatorTag], LearntType]]:
+        """Pruned learnt types of sub-learners by their tags, followed by this learner's own type (tagged None)
+
+        Discriminator field of each sub-learner's type is narrowed down to its tag's literal
+        """
+        tagged_learnt_types: list[tuple[Optional[DiscriminatorTag], LearntType]] = []
+        for tag, sub_learner in self.sub_learners.items():
+            if sub_learner._merges_since_size_check > 0:
+                sub_learner._fit_size_budget()
+            sub_learnt_type = sub_learner._pruned_learnt_type()
+            if sub_learnt_type is not None:
+                tagged_learnt_types.append((tag, self._with_discriminator_literal(sub_learnt_type, tag)))
+        if self._merges_since_size_check > 0:
+            self._fit_size_budget()
+        learnt_type = self._pruned_learnt_type()
+        if learnt_type is not None:
+            tagged_learnt_types.append((None, learnt_type))
+        return tagged_learnt_types
+
+    def _with_discriminator_literal(self, lt: LearntType, tag: DiscriminatorTag) -> LearntType:
+        if isinstance(lt, LUnion):
+            return LUnion([self._with_discriminator_literal(member, tag) for member in lt.member_types])
+        if isinstance(lt, LSparseTypedDict):
+            lt = lt.to_typed_dict()
+        if isinstance(lt, LTypedDict) and self.discriminator in lt.fields:
+            return LTypedDict({**lt.fields, self.discriminator: LLiteral(tag)})
+        return lt
 
     def generate_type_definition(
         self, type_name: str, doc: str, target_version: PythonVersion = PythonVersion.PY38
     ) -> str:
         type_name = new_type_name(type_name, {})
-        if self.learnt_type is None:
-            raise RuntimeError("Unable to generate type definition before at least one value is observed")
+        typedef_rhs, imports, dependency_typedefs = self._generate_typedefs_cached(
+            self._tagged_learnt_types_to_generate(), type_name, target_version
+        )
+        return render_types_module(
+            self._definition_header(doc, target_version), imports, dependency_typedefs, {type_name: typedef_rhs}
+        )
+
+    def write_type_definition(
+        self, file: TextIO, type_name: str, doc: str, target_version: PythonVersion = PythonVersion.PY38
+    ) -> None:
+        """Streams the same text as generate_type_definition gives to a file, without keeping it in memory"""
+        type_name = new_type_name(type_name, {})
+        tagged_learnt_types = self._tagged_learnt_types_to_generate()
         imports: set[tuple[str, str]] = set()
-        dependency_typedefs: dict[str, str] = dict()
-        typedef_rhs = generate_typedef_rhs(self.learnt_type, type_name, target_version, imports, dependency_typedefs)
-        text_blocks: list[str] = []
+        with StreamingTypedefs(reserved_names={type_name}) as typedefs:
+            typedef_rhs = self._generate_typedefs(
+                tagged_learnt_types, type_name, target_version, imports, typedefs, use_cache=False
+            )
+            typedefs.write_module(file, self._definition_header(doc, target_version), imports, {type_name: typedef_rhs})
+
+    def _tagged_learnt_types_to_generate(self) -> list[tuple[Optional[DiscriminatorTag], LearntType]]:
+        tagged_learnt_types = self._tagged_learnt_types()
+        if not tagged_learnt_types:
+            raise RuntimeError("Unable to generate type definition before at least one value is observed")
+        return tagged_learnt_types
 
-        text_blocks.append(
-            '"""\n'
-            + f"This file contains {target_version}+ type definitions generated by {self.__class__.__qualname__} "
+    def _definition_header(self, doc: str, target_version: PythonVersion) -> str:
+        return (
+            f"This file contains {target_version}+ type definitions generated by {self.__class__.__qualname__} "
             + f"from {self.observed_values} observed value(s)\n\n"
             + f"{doc}\n"
-            + '"""'
+            + self._generalized_paths_doc()
+        )
+
+    def _generate_typedefs_cached(
+        self,
+        tagged_learnt_types: list[tuple[Optional[DiscriminatorTag], LearntType]],
+        type_name: str,
+        target_version: PythonVersion,
+    ) -> tuple[str, set[tuple[str, str]], dict[str, str]]:
+        key = (
+            tuple((tag, sub_learner._learnt_type_version) for tag, sub_learner in self.sub_learners.items()),
+            self._learnt_type_version,
+            type_name,
+            target_version,
         )
+        cached = self._generated_typedefs.get(key)
+        if cached is None:
+            imports: set[tuple[str, str]] = set()
+            dependency_typedefs: dict[str, str] = TypedefNamespace(reserved_names={type_name})
+            typedef_rhs = self._generate_typedefs(
+                tagged_learnt_types, type_name, target_version, imports, dependency_typedefs
+            )
+            if len(self._generated_typedefs) >= self.MAX_CACHED_TYPEDEFS:
+                self._generated_typedefs.clear()
+            cached = (typedef_rhs, frozenset(imports), dependency_typedefs)
+            self._generated_typedefs[key] = cached
+        typedef_rhs, imports_, dependency_typedefs = cached
+        return typedef_rhs, set(imports_), dict(dependency_typedefs)
 
-        imports_block: list[str] = []
-        for module, value in sorted(sorted(imports, key=lambda m_v: m_v[0]), key=lambda m_v: m_v[1]):
-            imports_block.append(f"from {module} import {value}")
-        text_blocks.append("\n".join(imports_block))
+    def _generate_typedefs(
+        self,
+        tagged_learnt_types: list[tuple[Optional[DiscriminatorTag], LearntType]],
+        type_name: str,
+        target_version: PythonVersion,
+        imports: set[tuple[str, str]],
+        dependency_typedefs: dict[str, str],
+        use_cache: bool = True,
+    ) -> str:
+        """Generates typedefs into dependency typedefs, which should have the type name reserved; returns its RHS"""
+        cache = self._typedef_cache if use_cache else None
+        if cache is not None:
+            cache.start_pass()
+        try:
+            if len(tagged_learnt_types) == 1 and tagged_learnt_types[0][0] is None:
+                return generate_typedef_rhs(
+                    tagged_learnt_types[0][1], type_name, target_version, imports, dependency_typedefs, cache
+                )
+            else:
+                return self._generate_tagged_union_typedef(
+                    tagged_learnt_types, type_name, target_version, imports, dependency_typedefs, cache
+                )
+        finally:
+            if cache is not None:
+                cache.finish_pass()
 
-        text_blocks.extend(dependency_typedefs.values())
+    def _generate_tagged_union_typedef(
+        self,
+        tagged_learnt_types: list[tuple[Optional[DiscriminatorTag], LearntType]],
+        type_name: str,
+        target_version: PythonVersion,
+        imports: set[tuple[str, str]],
+        dependency_typedefs: dict[str, str],
+        cache: Optional[TypedefCache],
+    ) -> str:
+        """Union of per-tag types named after their tags (e.g. EventUserCreated), untagged type goes last"""
+        member_typedefs: list[str] = []
+        for tag, lt in tagged_learnt_types:
+            member_name = type_name + "Untagged" if tag is None else f"{type_name}_{tag}"
+            member_typedefs.append(
+                generate_typedef_rhs(
+                    lt,
+                    new_type_name(member_name, dependency_typedefs),
+                    target_version,
+                    imports,
+                    dependency_typedefs,
+                    cache,
+                )
+            )
+        return join_union_typedefs(member_typedefs, False, target_version, imports)
 
-        if typedef_rhs != type_name:
-            text_blocks.append(f"{type_name} = {typedef_rhs}")
-        return "\n\n\n".join(text_blocks)
+    def _generalized_paths_doc(self, type_name: Optional[str] = None) -> str:
+        generalized_paths = [f"- {path}: {description}" for path, description in self.generalized_paths.items()]
+        for tag, sub_learner in self.sub_learners.items():
+            generalized_paths.extend(
+                f"- {path} ({self.discriminator}={tag!r}): {description}"
+                for path, description in sub_learner.generalized_paths.items()
+            )
+        sampled_paths = [f"- {path}: {count} time(s)" for path, count in self.sampled_paths.items()]
+        for tag, sub_learner in self.sub_learners.items():
+            sampled_paths.extend(
+                f"- {path} ({self.discriminator}={tag!r}): {count} time(s)"
+                for path, count in sub_learner.sampled_paths.items()
+            )
+        type_name_prefix = f"{type_name} " if type_name else ""
+        doc = ""
+        if generalized_paths:
+            doc += (
+                f"\n{type_name_prefix}Generalized to fit in {self.max_learnt_type_size} nodes:\n"
+                + "\n".join(generalized_paths)
+                + "\n"
+            )
+        if sampled_paths:
+            doc += f"\n{type_name_prefix}Learnt from sampled items:\n" + "\n".join(sampled_paths) + "\n"
+        return doc
 
     def save_type_definition(
         self, filename: pathlib.Path, type_name: str, doc: str, target_version: PythonVersion = PythonVersion.PY38
     ):
+        """Writes the type definition to a new file, which is only created if the definition was fully generated"""
         if filename.exists():
             raise FileExistsError(str(filename))
-        filename.write_text(self.generate_type_definition(type_name, doc, target_version))
+        with open_atomically(filename) as file:
+            self.write_type_definition(file, type_name, doc, target_version)
+
+
+def generate_types_module(
+    learners: dict[str, TypeLearner], doc: str, target_version: PythonVersion = PythonVersion.PY38
+) -> str:
+    """Generates a single module with types learnt by several learners, keyed by type names
+
+    Types share the import block and dependency typedefs, whose names never clash with each other or with the types
+    """
+    buffer = io.StringIO()
+    write_types_module(buffer, learners, doc, target_version)
+    return buffer.getvalue()
+
+
+def write_types_module(
+    file: TextIO,
+    learners: Mapping[str, TypeLearner],
+    doc: str,
+    target_version: PythonVersion = PythonVersion.PY38,
+) -> None:
+    """Streams the module generate_types_module gives to a file, without keeping it in memory
+
+    Learners are looked up one at a time and only once, so the mapping may load them lazily
+    """
+    normalized_type_names = {type_name: new_type_name(type_name, {}) for type_name in learners}
+    if len(set(normalized_type_names.values())) != len(normalized_type_names):
+        raise ValueError(f"Type names clash after normalization: {list(learners)}")
+    imports: set[tuple[str, str]] = set()
+    with StreamingTypedefs(reserved_names=normalized_type_names.values()) as typedefs:
+        typedef_rhs_by_type_name: dict[str, str] = dict()
+        observed_values_doc = ""
+        generalized_paths_doc = ""
+        for original_type_name, type_name in normalized_type_names.items():
+            learner = learners[original_type_name]
+            tagged_learnt_types = learner._tagged_learnt_types()
+            if not tagged_learnt_types:
+                raise RuntimeError(f"Unable to generate {type_name} type definition, no values were observed")
+            typedef_rhs_by_type_name[type_name] = learner._generate_typedefs(
+                tagged_learnt_types, type_name, target_version, imports, typedefs, use_cache=False
+            )
+            observed_values_doc += f"- {type_name} from {learner.observed_values} observed value(s)\n"
+            generalized_paths_doc += learner._generalized_paths_doc(type_name)
+
+        header = f"This file contains {target_version}+ type definitions generated by {TypeLearner.__qualname__}:\n"
+        header += observed_values_doc + f"\n{doc}\n" + generalized_paths_doc
+        typedefs.write_module(file, header, imports, typedef_rhs_by_type_name)
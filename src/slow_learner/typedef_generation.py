@@ -1,10 +1,12 @@
 import collections
 import keyword
-import random
 import re
-import string
+import shutil
 import sys
+import tempfile
+from dataclasses import dataclass
 from enum import IntEnum
+from typing import Any, Iterable, Optional, TextIO
 
 from .learnt_types import (
     LCollection,
@@ -13,10 +15,17 @@ from .learnt_types import (
     LMapping,
     LMissingTypedDictKey,
     LNone,
+    LObject,
+    LRecursive,
+    LRecursiveRef,
+    LSparseTypedDict,
     LTuple,
     LType,
     LTypedDict,
     LUnion,
+    child_types,
+    learnt_type_fingerprint,
+    map_child_types,
 )
 
 
@@ -41,7 +50,54 @@ def capitalize_first_letter(s: str) -> str:
         return s
 
 
+class TypedefNamespace(dict):
+    """Dependency typedefs by name, also treating reserved names (e.g. top-level types') as taken; keeps the next
+    numeric suffix for each taken name, so that new names are allocated in constant time and deterministically"""
+
+    def __init__(self, reserved_names: Iterable[str] = (), *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.reserved_names = set(reserved_names)
+        self.next_suffixes: dict[str, int] = dict()
+
+    def __contains__(self, name: object) -> bool:
+        return name in self.reserved_names or super().__contains__(name)
+
+
+class StreamingTypedefs(TypedefNamespace):
+    """Typedef namespace that spools typedefs to a temporary file in the order they are generated (i.e. dependencies
+    first), keeping only their names in memory"""
+
+    def __init__(self, reserved_names: Iterable[str] = ()) -> None:
+        super().__init__(reserved_names)
+        self._body = tempfile.TemporaryFile("w+", encoding="utf-8")
+
+    def __setitem__(self, name: str, typedef: str) -> None:
+        self._body.write("\n\n\n" + typedef)
+        super().__setitem__(name, "")
+
+    def write_module(
+        self, file: TextIO, header: str, imports: set[tuple[str, str]], typedef_rhs_by_name: dict[str, str]
+    ) -> None:
+        """Writes the same text as render_types_module would for these typedefs"""
+        file.write('"""\n' + header + '"""\n\n\n' + imports_block(imports))
+        self._body.seek(0)
+        shutil.copyfileobj(self._body, file)
+        for type_name, typedef_rhs in typedef_rhs_by_name.items():
+            if typedef_rhs != type_name:
+                file.write(f"\n\n\n{type_name} = {typedef_rhs}")
+
+    def close(self) -> None:
+        self._body.close()
+
+    def __enter__(self) -> "StreamingTypedefs":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+
 def new_type_name(name: str, dependency_typedefs: dict[str, str]) -> str:
+    """Turns the name into a CamelCase identifier; if it's already taken, adds a numeric suffix to it"""
     name = "".join([capitalize_first_letter(m.group()) for m in re.finditer(r"[A-Za-z0-9]+", name)])
     if not name.isidentifier():
         name = "_" + name
@@ -49,10 +105,88 @@ def new_type_name(name: str, dependency_typedefs: dict[str, str]) -> str:
         name = "GeneratedType"
     if name not in dependency_typedefs:
         return name
-    while True:
-        name += random.choice(string.ascii_uppercase)
-        if name not in dependency_typedefs:
-            return name
+    next_suffixes = dependency_typedefs.next_suffixes if isinstance(dependency_typedefs, TypedefNamespace) else {}
+    suffix = next_suffixes.get(name, 2)
+    while f"{name}{suffix}" in dependency_typedefs:
+        suffix += 1
+    next_suffixes[name] = suffix + 1
+    return f"{name}{suffix}"
+
+
+def imports_block(imports: set[tuple[str, str]]) -> str:
+    imports_lines: list[str] = []
+    for module, value in sorted(sorted(imports, key=lambda m_v: m_v[0]), key=lambda m_v: m_v[1]):
+        imports_lines.append(f"from {module} import {value}")
+    return "\n".join(imports_lines)
+
+
+def render_types_module(
+    header: str, imports: set[tuple[str, str]], dependency_typedefs: dict[str, str], typedef_rhs_by_name: dict[str, str]
+) -> str:
+    """Module text with a header docstring, imports, dependency typedefs and top-level type aliases"""
+    text_blocks: list[str] = ['"""\n' + header + '"""', imports_block(imports)]
+    text_blocks.extend(dependency_typedefs.values())
+    for type_name, typedef_rhs in typedef_rhs_by_name.items():
+        if typedef_rhs != type_name:
+            text_blocks.append(f"{type_name} = {typedef_rhs}")
+    return "\n\n\n".join(text_blocks)
+
+
+def join_union_typedefs(
+    member_typedefs: list[str], optional: bool, target_version: PythonVersion, imports: set[tuple[str, str]]
+) -> str:
+    """Union of non-None member typedefs, optionally with None"""
+    if target_version >= PythonVersion.PY310:
+        return " | ".join(member_typedefs + ["None"] if optional else member_typedefs)
+    if len(member_typedefs) > 1:
+        imports.add(("typing", "Union"))
+        union_body = "Union[" + ", ".join(member_typedefs) + "]"
+    else:
+        union_body = member_typedefs[0]
+    if optional:
+        imports.add(("typing", "Optional"))
+        return "Optional[" + union_body + "]"
+    else:
+        return union_body
+
+
+# numpy scalar types of arrays' elements by their python counterparts, with the number of their type parameters
+_NUMPY_SCALAR_TYPE_NAMES: dict[type, tuple[str, int]] = {
+    bool: ("bool_", 0),
+    int: ("integer", 1),
+    float: ("floating", 1),
+    complex: ("complexfloating", 2),
+    str: ("str_", 0),
+    bytes: ("bytes_", 0),
+    object: ("object_", 0),
+}
+
+
+def _is_numpy_array_type(type_: type) -> bool:
+    return type_.__module__ == "numpy" and type_.__name__ == "ndarray"
+
+
+def generate_ndarray_typedef(item_lt: LearntType, target_version: PythonVersion, imports: set[tuple[str, str]]) -> str:
+    """NDArray annotation with the numpy scalar type corresponding to learnt item type, e.g. NDArray[floating[Any]]"""
+    imports.add(("numpy.typing", "NDArray"))
+    scalar_typedefs: list[str] = []
+    for member_lt in item_lt.member_types if isinstance(item_lt, LUnion) else [item_lt]:
+        if isinstance(member_lt, LType) and member_lt.type_.__module__ == "numpy":
+            name, params_count = member_lt.type_.__name__, 0
+        elif isinstance(member_lt, LType) and member_lt.type_ in _NUMPY_SCALAR_TYPE_NAMES:
+            name, params_count = _NUMPY_SCALAR_TYPE_NAMES[member_lt.type_]
+        else:
+            name, params_count = "generic", 0
+        imports.add(("numpy", name))
+        if params_count and target_version >= PythonVersion.PY39:  # numpy types are subscriptable since Python 3.9
+            imports.add(("typing", "Any"))
+            name += "[" + ", ".join(["Any"] * params_count) + "]"
+        if name not in scalar_typedefs:
+            scalar_typedefs.append(name)
+    if not scalar_typedefs:  # nothing learnt
+        imports.add(("typing", "Any"))
+        scalar_typedefs.append("Any")
+    return f"NDArray[{join_union_typedefs(scalar_typedefs, False, target_version, imports)}]"
 
 
 def generate_typedef_rhs(
@@ -61,8 +195,12 @@ def generate_typedef_rhs(
     target_version: PythonVersion,
     imports: set[tuple[str, str]],
     dependency_typedefs: dict[str, str],
+    cache: Optional["TypedefCache"] = None,
 ) -> str:
     # preprocessing types before typedef generation
+    # deriving required and not required keys of sparse typed dict
+    if isinstance(lt, LSparseTypedDict):
+        lt = lt.to_typed_dict()
     # demoting empty typed dict to dict[Any, Any]
     if isinstance(lt, LTypedDict) and not lt.fields:
         lt = LMapping(dict, key_type=LUnion([]), value_type=LUnion([]))
@@ -81,42 +219,30 @@ def generate_typedef_rhs(
         non_none_member_types = [m for m in lt.member_types if not isinstance(m, LNone)]
         if not non_none_member_types:
             return str(LNone())
-        member_types_in_body = lt.member_types if target_version >= PythonVersion.PY310 else non_none_member_types
-        if len(member_types_in_body) > 1:
-            member_typedefs_in_body = [
+        if len(non_none_member_types) > 1:
+            member_typedefs = [
                 generate_typedef_rhs(
                     member_lt,
                     new_type_name(type_name + f"Variant{member_idx + 1}", dependency_typedefs),
                     target_version,
                     imports,
                     dependency_typedefs,
+                    cache,
                 )
-                for member_idx, member_lt in enumerate(member_types_in_body)
+                for member_idx, member_lt in enumerate(non_none_member_types)
             ]
         else:
-            member_typedefs_in_body = [
+            member_typedefs = [
                 generate_typedef_rhs(
-                    member_types_in_body[0],
+                    non_none_member_types[0],
                     new_type_name(type_name, dependency_typedefs),
                     target_version,
                     imports,
                     dependency_typedefs,
+                    cache,
                 )
             ]
-        if target_version >= PythonVersion.PY310:
-            union_body = " | ".join(member_typedefs_in_body)
-        else:
-            imports.add(("typing", "Union"))
-            union_body = (
-                "Union[" + ", ".join(member_typedefs_in_body) + "]"
-                if len(member_typedefs_in_body) > 1
-                else member_typedefs_in_body[0]
-            )
-            if non_none_member_types != lt.member_types:
-                imports.add(("typing", "Optional"))
-                return "Optional[" + union_body + "]"
-            else:
-                return union_body
+        return join_union_typedefs(member_typedefs, non_none_member_types != lt.member_types, target_version, imports)
     elif isinstance(lt, LTuple):
         if target_version >= PythonVersion.PY39:
             tuple_type = "tuple"
@@ -133,11 +259,14 @@ def generate_typedef_rhs(
                     target_version,
                     imports,
                     dependency_typedefs,
+                    cache,
                 )
                 for item_idx, item_lt in enumerate(lt.item_types)
             )
             + "]"
         )
+    elif isinstance(lt, LCollection) and _is_numpy_array_type(lt.collection_type):
+        return generate_ndarray_typedef(lt.item_type, target_version, imports)
     elif isinstance(lt, LCollection):
         if target_version >= PythonVersion.PY39 and hasattr(lt.collection_type, "__class_getitem__"):
             # i.e. the type is a generic, see https://docs.python.org/3/library/stdtypes.html#generic-alias-type
@@ -160,6 +289,7 @@ def generate_typedef_rhs(
             target_version,
             imports,
             dependency_typedefs,
+            cache,
         )
         return f"{collection_typedef}[{item_typedef}]"
     elif isinstance(lt, LMapping):
@@ -185,6 +315,7 @@ def generate_typedef_rhs(
             target_version,
             imports,
             dependency_typedefs,
+            cache,
         )
         value_typedef = generate_typedef_rhs(
             lt.value_type,
@@ -192,66 +323,185 @@ def generate_typedef_rhs(
             target_version,
             imports,
             dependency_typedefs,
+            cache,
         )
         return f"{mapping_typedef}[{key_typedef}, {value_typedef}]"
+    elif isinstance(lt, LObject):
+        # objects' fields are generated as a TypedDict named after their class, unless it's a top-level type
+        if type_name not in getattr(dependency_typedefs, "reserved_names", ()):
+            type_name = new_type_name(capitalize_first_letter(lt.object_type.__name__), dependency_typedefs)
+        return generate_typedef_rhs(lt.fields, type_name, target_version, imports, dependency_typedefs, cache)
+    elif isinstance(lt, LRecursive):
+        body = lt.body.to_typed_dict() if isinstance(lt.body, LSparseTypedDict) else lt.body
+        if not (isinstance(body, LTypedDict) and body.fields):
+            # references to a non-TypedDict recursive type are generated as Any
+            return generate_typedef_rhs(body, type_name, target_version, imports, dependency_typedefs, cache)
+        # references are resolved to the type name, which is a part of their fingerprint, so the body is cached
+        # by the name it's generated with and is recorded among the definitions of the typed dicts enclosing it
+        resolved_body = resolve_recursive_refs(body, lt.anchor, type_name)
+        if not isinstance(resolved_body, LTypedDict):
+            raise TypeError(f"Recursive type's body is not a typed dict after resolving references: {resolved_body}")
+        if cache is not None:
+            return cache.generate_typed_dict(resolved_body, type_name, target_version, imports, dependency_typedefs)
+        return generate_typed_dict_typedef(resolved_body, type_name, target_version, imports, dependency_typedefs)
+    elif isinstance(lt, LRecursiveRef):
+        if lt.type_name is None:
+            imports.add(("typing", "Any"))
+            return "Any"
+        return lt.type_name
     elif isinstance(lt, LTypedDict):
-        imports.add(("typing", "TypedDict"))
-        not_required_keys: set[str] = set()
-        field_types_to_generate: dict[str, LearntType] = dict()
-        for key, value_lt in lt.fields.items():
-            if isinstance(value_lt, LUnion):
-                non_missing_members = [
-                    mlt for mlt in value_lt.member_types if not isinstance(mlt, LMissingTypedDictKey)
-                ]
-                if non_missing_members == value_lt.member_types:
-                    field_types_to_generate[key] = value_lt
-                else:
-                    field_types_to_generate[key] = LUnion(non_missing_members)
-                    not_required_keys.add(key)
-            else:
-                field_types_to_generate[key] = value_lt
+        if cache is not None:
+            return cache.generate_typed_dict(lt, type_name, target_version, imports, dependency_typedefs)
+        return generate_typed_dict_typedef(lt, type_name, target_version, imports, dependency_typedefs, cache)
 
-        use_class_notation = all(
-            key.isidentifier() and not keyword.iskeyword(key) and not keyword.issoftkeyword(key)
-            for key in field_types_to_generate
-        )
-        use_total_false = False
-        if not_required_keys:
-            if not_required_keys == set(field_types_to_generate.keys()):
-                use_total_false = True
+    raise RuntimeError(f"Can't generate typedef RHS for {lt}, python version {target_version}")
+
+
+def resolve_recursive_refs(lt: LearntType, anchor: str, type_name: str) -> LearntType:
+    """Sets the name of the generated recursive type to all references to it"""
+    if isinstance(lt, LRecursiveRef) and lt.anchor == anchor:
+        return LRecursiveRef(anchor, type_name)
+    return map_child_types(lt, lambda child: resolve_recursive_refs(child, anchor, type_name))
+
+
+def has_forward_refs(lt: LearntType) -> bool:
+    """Whether the generated type may refer to a recursive type that is not yet defined"""
+    if isinstance(lt, LRecursiveRef):
+        return lt.type_name is not None
+    return any(has_forward_refs(child) for _, child in child_types(lt))
+
+
+def generate_typed_dict_typedef(
+    lt: LTypedDict,
+    type_name: str,
+    target_version: PythonVersion,
+    imports: set[tuple[str, str]],
+    dependency_typedefs: dict[str, str],
+    cache: Optional["TypedefCache"] = None,
+) -> str:
+    """Adds TypedDict definition to dependency typedefs, returns its name"""
+    imports.add(("typing", "TypedDict"))
+    not_required_keys: set[str] = set()
+    field_types_to_generate: dict[str, LearntType] = dict()
+    for key, value_lt in lt.fields.items():
+        if isinstance(value_lt, LUnion):
+            non_missing_members = [mlt for mlt in value_lt.member_types if not isinstance(mlt, LMissingTypedDictKey)]
+            if non_missing_members == value_lt.member_types:
+                field_types_to_generate[key] = value_lt
             else:
-                module = "typing" if target_version >= PythonVersion.PY311 else "typing_extensions"
-                imports.add((module, "NotRequired"))
-        typed_dict_def_lines: list[str] = []
-
-        field_typedefs: dict[str, str] = dict()
-        for key, value_lt in field_types_to_generate.items():
-            value_typedef = generate_typedef_rhs(
-                value_lt,
-                new_type_name(type_name + (key.capitalize() or "EmptyKey"), dependency_typedefs),
-                target_version,
-                imports,
-                dependency_typedefs,
-            )
-            if key in not_required_keys and not use_total_false:
-                value_typedef = f"NotRequired[{value_typedef}]"
-            field_typedefs[key] = value_typedef
-
-        if use_class_notation:
-            inheritance_args = ", total=False" if use_total_false else ""
-            typed_dict_def_lines.append(f"class {type_name}(TypedDict{inheritance_args}):")
-            for key, value_typedef in field_typedefs.items():
-                typed_dict_def_lines.append(f"    {key}: {value_typedef}")
+                field_types_to_generate[key] = LUnion(non_missing_members)
+                not_required_keys.add(key)
+        elif isinstance(value_lt, LMissingTypedDictKey):
+            # only missing or Any values were learnt for the key, e.g. with excluded paths or pruned members
+            field_types_to_generate[key] = LUnion([])
+            not_required_keys.add(key)
         else:
-            fields_arg = "{"
-            for key, value_typedef in field_typedefs.items():
-                fields_arg += f"{key!r}: {value_typedef}, "
-            fields_arg += "}"
-            args = [repr(type_name), fields_arg]
-            if use_total_false:
-                args.append("total=False")
-            typed_dict_def_lines = [f"{type_name} = TypedDict(" + ", ".join(args) + ")"]
-        dependency_typedefs[type_name] = "\n".join(typed_dict_def_lines)
-        return type_name
+            field_types_to_generate[key] = value_lt
 
-    raise RuntimeError(f"Can't generate typedef RHS for {lt}, python version {target_version}")
+    use_class_notation = all(
+        key.isidentifier() and not keyword.iskeyword(key) and not keyword.issoftkeyword(key)
+        for key in field_types_to_generate
+    )
+    use_total_false = False
+    if not_required_keys:
+        if not_required_keys == set(field_types_to_generate.keys()):
+            use_total_false = True
+        else:
+            module = "typing" if target_version >= PythonVersion.PY311 else "typing_extensions"
+            imports.add((module, "NotRequired"))
+    typed_dict_def_lines: list[str] = []
+
+    field_typedefs: dict[str, str] = dict()
+    for key, value_lt in field_types_to_generate.items():
+        value_typedef = generate_typedef_rhs(
+            value_lt,
+            new_type_name(type_name + (key.capitalize() or "EmptyKey"), dependency_typedefs),
+            target_version,
+            imports,
+            dependency_typedefs,
+            cache,
+        )
+        if has_forward_refs(value_lt):
+            # annotations are evaluated at runtime, so the ones with forward references are quoted as a whole
+            value_typedef = repr(value_typedef)
+        if key in not_required_keys and not use_total_false:
+            value_typedef = f"NotRequired[{value_typedef}]"
+        field_typedefs[key] = value_typedef
+
+    if use_class_notation:
+        inheritance_args = ", total=False" if use_total_false else ""
+        typed_dict_def_lines.append(f"class {type_name}(TypedDict{inheritance_args}):")
+        for key, value_typedef in field_typedefs.items():
+            typed_dict_def_lines.append(f"    {key}: {value_typedef}")
+    else:
+        fields_arg = "{"
+        for key, value_typedef in field_typedefs.items():
+            fields_arg += f"{key!r}: {value_typedef}, "
+        fields_arg += "}"
+        args = [repr(type_name), fields_arg]
+        if use_total_false:
+            args.append("total=False")
+        typed_dict_def_lines = [f"{type_name} = TypedDict(" + ", ".join(args) + ")"]
+    dependency_typedefs[type_name] = "\n".join(typed_dict_def_lines)
+    return type_name
+
+
+@dataclass(frozen=True)
+class _CachedTypedDictTypedef:
+    rhs: str
+    imports: frozenset[tuple[str, str]]
+    # definitions of the typed dict and all of its dependencies, in dependency order
+    typedefs: list[tuple[str, str]]
+
+
+class TypedefCache:
+    """Reuses generated definitions of typed dicts whose learnt types did not change since the previous generation
+
+    Typed dicts are looked up by their structural fingerprint, name and target version. The cache only holds
+    entries used in the latest generation pass.
+    """
+
+    def __init__(self) -> None:
+        self._entries: dict[tuple[bytes, str, PythonVersion], _CachedTypedDictTypedef] = dict()
+        self._used_entries: dict[tuple[bytes, str, PythonVersion], _CachedTypedDictTypedef] = dict()
+        self._fingerprints: dict[int, bytes] = dict()
+        self._pass_typedefs: list[tuple[str, str]] = []
+
+    def start_pass(self, fingerprints: Optional[dict[int, bytes]] = None) -> None:
+        """Must be called before each generation pass; fingerprints may be pre-computed for the generated tree"""
+        self._fingerprints = fingerprints if fingerprints is not None else dict()
+        self._used_entries = dict()
+        self._pass_typedefs = []
+
+    def finish_pass(self) -> None:
+        self._entries = self._used_entries
+        self._used_entries = dict()
+        self._fingerprints = dict()
+        self._pass_typedefs = []
+
+    def generate_typed_dict(
+        self,
+        lt: LTypedDict,
+        type_name: str,
+        target_version: PythonVersion,
+        imports: set[tuple[str, str]],
+        dependency_typedefs: dict[str, str],
+    ) -> str:
+        key = (learnt_type_fingerprint(lt, self._fingerprints), type_name, target_version)
+        entry = self._used_entries.get(key) or self._entries.get(key)
+        if entry is not None and not any(name in dependency_typedefs for name, _ in entry.typedefs):
+            dependency_typedefs.update(entry.typedefs)
+            self._pass_typedefs.extend(entry.typedefs)
+        else:
+            typedef_imports: set[tuple[str, str]] = set()
+            pass_typedefs_start = len(self._pass_typedefs)
+            rhs = generate_typed_dict_typedef(lt, type_name, target_version, typedef_imports, dependency_typedefs, self)
+            self._pass_typedefs.append((type_name, dependency_typedefs[type_name]))
+            entry = _CachedTypedDictTypedef(
+                rhs=rhs,
+                imports=frozenset(typedef_imports),
+                typedefs=self._pass_typedefs[pass_typedefs_start:],
+            )
+        self._used_entries[key] = entry
+        imports.update(entry.imports)
+        return entry.rhs
@@ -0,0 +1,245 @@
+import ast
+import builtins
+import collections
+import collections.abc
+import sys
+from typing import Any, Optional, Union
+
+from .learnt_types import (
+    LCollection,
+    LearntType,
+    LLiteral,
+    LMapping,
+    LMissingTypedDictKey,
+    LNone,
+    LRecursive,
+    LRecursiveRef,
+    LTuple,
+    LType,
+    LTypedDict,
+    LUnion,
+)
+
+# generic names used in generated type definitions, for all target versions
+_COLLECTION_TYPES: dict[str, type] = {
+    "list": list,
+    "List": list,
+    "set": set,
+    "Set": set,
+    "frozenset": frozenset,
+    "FrozenSet": frozenset,
+    "deque": collections.deque,
+    "Deque": collections.deque,
+    "Collection": collections.abc.Collection,
+}
+_MAPPING_TYPES: dict[str, type] = {
+    "dict": dict,
+    "Dict": dict,
+    "defaultdict": collections.defaultdict,
+    "DefaultDict": collections.defaultdict,
+    "OrderedDict": collections.OrderedDict,
+    "ChainMap": collections.ChainMap,
+    "Mapping": collections.abc.Mapping,
+}
+# numpy scalar types in generated NDArray annotations by their python counterparts' names
+_NUMPY_SCALAR_TYPES: dict[str, type] = {
+    "bool_": bool,
+    "integer": int,
+    "floating": float,
+    "complexfloating": complex,
+    "str_": str,
+    "bytes_": bytes,
+    "object_": object,
+}
+
+
+def _union(members: list[LearntType]) -> LearntType:
+    flat_members: list[LearntType] = []
+    for member in members:
+        for flat_member in member.member_types if isinstance(member, LUnion) else [member]:
+            if flat_member not in flat_members:
+                flat_members.append(flat_member)
+    return flat_members[0] if len(flat_members) == 1 else LUnion(flat_members)
+
+
+def _subscript_args(node: ast.expr) -> list[ast.expr]:
+    if isinstance(node, ast.Tuple):
+        return list(node.elts)
+    return [node]
+
+
+def _expr_name(node: ast.expr) -> Optional[str]:
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):  # e.g. typing.Any or collections.deque
+        return node.attr
+    return None
+
+
+class _TypedefModuleParser:
+    """Converts type definitions of a generated module back to learnt types, following references between them"""
+
+    def __init__(self, source: str, namespace: Optional[dict[str, type]]) -> None:
+        self.namespace = namespace or dict()
+        self.definitions: dict[str, Union[ast.ClassDef, ast.expr]] = dict()
+        for statement in ast.parse(source).body:
+            if isinstance(statement, ast.ClassDef):
+                self.definitions[statement.name] = statement
+            elif (
+                isinstance(statement, ast.Assign)
+                and len(statement.targets) == 1
+                and isinstance(statement.targets[0], ast.Name)
+            ):
+                self.definitions[statement.targets[0].id] = statement.value
+            elif isinstance(statement, ast.AnnAssign) and isinstance(statement.target, ast.Name) and statement.value:
+                self.definitions[statement.target.id] = statement.value  # e.g. T: TypeAlias = ...
+        # names being resolved, with path shapes they are resolved at, and names referred to from themselves
+        self.resolving: dict[str, str] = dict()
+        self.recursive_names: set[str] = set()
+
+    def parse_name(self, name: str, path: str) -> LearntType:
+        if name in self.resolving:
+            self.recursive_names.add(name)
+            return LRecursiveRef(self.resolving[name])
+        definition = self.definitions.get(name)
+        if definition is None:
+            return self.parse_opaque_name(name)
+        self.resolving[name] = path
+        try:
+            if isinstance(definition, ast.ClassDef):
+                lt = self.parse_typed_dict_class(definition, path)
+            else:
+                lt = self.parse_expr(definition, path)
+        finally:
+            del self.resolving[name]
+        if name in self.recursive_names:
+            self.recursive_names.discard(name)
+            return LRecursive(path, lt)
+        return lt
+
+    def parse_opaque_name(self, name: str) -> LearntType:
+        if name == "Any":
+            return LUnion([])  # nothing learnt, the way empty unions are generated
+        if name == "None":
+            return LNone()
+        if name in _COLLECTION_TYPES:
+            return LType(_COLLECTION_TYPES[name])
+        if name in _MAPPING_TYPES:
+            return LType(_MAPPING_TYPES[name])
+        type_ = self.namespace.get(name, getattr(builtins, name, None))
+        if not isinstance(type_, type):
+            raise ValueError(f"Unknown type name {name!r}, it can be passed in the namespace")
+        return LType(type_)
+
+    def parse_typed_dict_class(self, class_def: ast.ClassDef, path: str) -> LearntType:
+        if [_expr_name(base) for base in class_def.bases] != ["TypedDict"]:
+            raise ValueError(f"Only TypedDict classes are supported, got {class_def.name}")
+        total = all(
+            not (keyword.arg == "total" and isinstance(keyword.value, ast.Constant) and keyword.value.value is False)
+            for keyword in class_def.keywords
+        )
+        fields: dict[str, ast.expr] = dict()
+        for statement in class_def.body:
+            if isinstance(statement, ast.AnnAssign) and isinstance(statement.target, ast.Name):
+                fields[statement.target.id] = statement.annotation
+        return self.parse_typed_dict_fields(fields, total, path)
+
+    def parse_typed_dict_fields(self, fields: dict[str, ast.expr], total: bool, path: str) -> LearntType:
+        if not fields:
+            return LTypedDict(dict())
+        parsed_fields: dict[str, LearntType] = dict()
+        for key, annotation in fields.items():
+            required = total
+            if isinstance(annotation, ast.Constant) and isinstance(annotation.value, str):
+                annotation = ast.parse(annotation.value, mode="eval").body
+            if isinstance(annotation, ast.Subscript) and _expr_name(annotation.value) in ("NotRequired", "Required"):
+                required = _expr_name(annotation.value) == "Required"
+                annotation = annotation.slice
+            value_type = self.parse_expr(annotation, path + "." + key)
+            parsed_fields[key] = value_type if required else _union([value_type, LMissingTypedDictKey()])
+        return LTypedDict(parsed_fields)
+
+    def parse_expr(self, node: ast.expr, path: str) -> LearntType:
+        if isinstance(node, ast.Constant):
+            if node.value is None:
+                return LNone()
+            if isinstance(node.value, str):  # quoted forward reference
+                return self.parse_expr(ast.parse(node.value, mode="eval").body, path)
+        elif isinstance(node, (ast.Name, ast.Attribute)):
+            return self.parse_name(_expr_name(node), path)  # type: ignore
+        elif isinstance(node, ast.BinOp) and isinstance(node.op, ast.BitOr):
+            return _union([self.parse_expr(node.left, path), self.parse_expr(node.right, path)])
+        elif isinstance(node, ast.Subscript):
+            return self.parse_subscript(_expr_name(node.value), _subscript_args(node.slice), path)
+        elif isinstance(node, ast.Call) and _expr_name(node.func) == "TypedDict":
+            return self.parse_functional_typed_dict(node, path)
+        raise ValueError(f"Unsupported type expression: {ast.unparse(node)}")
+
+    def parse_subscript(self, name: Optional[str], args: list[ast.expr], path: str) -> LearntType:
+        if name == "Literal":
+            return _union([LLiteral(ast.literal_eval(arg)) for arg in args])
+        if name == "Union":
+            return _union([self.parse_expr(arg, path) for arg in args])
+        if name == "Optional":
+            return _union([self.parse_expr(args[0], path), LNone()])
+        if name in ("tuple", "Tuple"):
+            if any(isinstance(arg, ast.Constant) and arg.value is Ellipsis for arg in args):
+                raise ValueError("Variable-length tuples are not supported")
+            return LTuple([self.parse_expr(arg, path + "[*]") for arg in args])
+        if name in _COLLECTION_TYPES and len(args) == 1:
+            return LCollection(_COLLECTION_TYPES[name], self.parse_expr(args[0], path + "[*]"))
+        if name == "NDArray" and len(args) == 1:
+            numpy = sys.modules.get("numpy")
+            if numpy is None:
+                raise ValueError("NDArray types can only be parsed with numpy imported")
+            return LCollection(numpy.ndarray, self.parse_ndarray_item_type(args[0]))
+        if name in _MAPPING_TYPES and len(args) == 2:
+            return LMapping(
+                _MAPPING_TYPES[name], self.parse_expr(args[0], path + ".<key>"), self.parse_expr(args[1], path + ".*")
+            )
+        raise ValueError(f"Unsupported generic type: {name}[{', '.join(ast.unparse(arg) for arg in args)}]")
+
+    def parse_ndarray_item_type(self, node: ast.expr) -> LearntType:
+        """Python counterpart of NDArray's numpy scalar type, e.g. float for floating[Any]"""
+        if isinstance(node, ast.Subscript) and _expr_name(node.value) == "Union":
+            return _union([self.parse_ndarray_item_type(arg) for arg in _subscript_args(node.slice)])
+        if isinstance(node, ast.BinOp) and isinstance(node.op, ast.BitOr):
+            return _union([self.parse_ndarray_item_type(node.left), self.parse_ndarray_item_type(node.right)])
+        if isinstance(node, ast.Subscript):
+            node = node.value  # e.g. floating[Any]
+        name = _expr_name(node)
+        if name == "Any":
+            return LUnion([])
+        if name in _NUMPY_SCALAR_TYPES:
+            return LType(_NUMPY_SCALAR_TYPES[name])
+        scalar_type = getattr(sys.modules["numpy"], name, None) if name is not None else None
+        if not (isinstance(scalar_type, type) and issubclass(scalar_type, sys.modules["numpy"].generic)):
+            raise ValueError(f"Unsupported NDArray scalar type: {ast.unparse(node)}")
+        return LType(scalar_type)
+
+    def parse_functional_typed_dict(self, call: ast.Call, path: str) -> LearntType:
+        if len(call.args) != 2 or not isinstance(call.args[1], ast.Dict):
+            raise ValueError(f"Unsupported TypedDict definition: {ast.unparse(call)}")
+        fields: dict[str, ast.expr] = dict()
+        for key, value in zip(call.args[1].keys, call.args[1].values):
+            if not (isinstance(key, ast.Constant) and isinstance(key.value, str)):
+                raise ValueError(f"Unsupported TypedDict definition: {ast.unparse(call)}")
+            fields[key.value] = value
+        total = all(
+            not (keyword.arg == "total" and isinstance(keyword.value, ast.Constant) and keyword.value.value is False)
+            for keyword in call.keywords
+        )
+        return self.parse_typed_dict_fields(fields, total, path)
+
+
+def parse_typedef_module(source: str, type_name: str, namespace: Optional[dict[str, Any]] = None) -> LearntType:
+    """Parses the learnt type of a type definition from a module generated by TypeLearner
+
+    Types referred to by name other than builtins and those defined in the module (e.g. enums or datetime) are looked
+    up in the namespace. Not all learnt types survive the round trip exactly: Any is parsed as an empty union and
+    mappings' value types do not tell the exact keys the values were found under.
+    """
+    parser = _TypedefModuleParser(source, namespace)
+    if type_name not in parser.definitions:
+        raise ValueError(f"Type {type_name!r} is not defined in the module")
+    return parser.parse_name(type_name, "$")
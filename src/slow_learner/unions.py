@@ -0,0 +1,198 @@
+from typing import TYPE_CHECKING, Any, Optional, Union
+
+from .learnt_types import (
+    LCollection,
+    LearntType,
+    LLiteral,
+    LMapping,
+    LObject,
+    LRecursive,
+    LSparseTypedDict,
+    LTuple,
+    LType,
+    LTypedDict,
+    LUnion,
+)
+from .subtyping import is_subtype
+
+if TYPE_CHECKING:
+    from .type_learner import TypeLearner
+
+
+class BucketedUnion:
+    """Union under construction with members kept in buckets by kind:
+
+    - literals by their type and value
+    - tuples by length
+    - collections and mappings by container type
+    - typed dicts (there may be only one)
+    - objects by their class
+    - recursive types by their anchors
+    - opaque types, None and everything else
+
+    Each added member is merged into its bucket in one step, so that adding members one by one gives the same result
+    as simplifying the union after each addition.
+    """
+
+    def __init__(self, learner: "TypeLearner") -> None:
+        self.learner = learner
+        self.opaque: list[LearntType] = []
+        self.literals: dict[tuple[type, Any], LLiteral] = dict()
+        self.tuples: dict[int, LTuple] = dict()
+        self.collections: dict[type, LCollection] = dict()
+        self.mappings: dict[type, LMapping] = dict()
+        self.typed_dict: Optional[Union[LTypedDict, LSparseTypedDict]] = None
+        self.objects: dict[type, LObject] = dict()
+        self.recursive: dict[str, LRecursive] = dict()
+
+    def add(self, lt: LearntType) -> None:
+        if isinstance(lt, LUnion):
+            for member in lt.member_types:
+                self.add(member)
+        elif isinstance(lt, LLiteral):
+            self._add_literal(lt)
+        elif isinstance(lt, LTuple):
+            self._add_tuple(lt)
+        elif isinstance(lt, LCollection):
+            self._add_collection(lt)
+        elif isinstance(lt, LMapping):
+            self._add_mapping(lt)
+        elif isinstance(lt, (LTypedDict, LSparseTypedDict)):
+            self._add_typed_dict(lt)
+        elif isinstance(lt, LObject):
+            self._add_object(lt)
+        elif isinstance(lt, LRecursive):
+            self._add_recursive(lt)
+        else:
+            self._add_opaque(lt)
+
+    def _add_opaque(self, lt: LearntType) -> None:
+        if lt not in self.opaque:
+            self.opaque.append(lt)
+            if self.literals:
+                self.literals = {key: literal for key, literal in self.literals.items() if not is_subtype(literal, lt)}
+
+    def _add_literal(self, literal: LLiteral) -> None:
+        if any(is_subtype(literal, opaque) for opaque in self.opaque):
+            return  # already covered by a wider type
+        try:
+            key = (type(literal.value), literal.value)
+            if key in self.literals:
+                return
+        except TypeError:
+            self._add_opaque(literal)  # unhashable literal value
+            return
+        self.literals[key] = literal
+
+        # replacing exhaustive bool literal union with bool type (Literal[True, False] -> bool)
+        if (bool, True) in self.literals and (bool, False) in self.literals:
+            del self.literals[(bool, True)]
+            del self.literals[(bool, False)]
+            self._add_opaque(LType(bool))
+
+        # generalizing too large unions of literals (Literal[1, 2, 3, ...] => int)
+        if len(self.literals) > self.learner.max_literal_type_size:
+            literals = list(self.literals.values())
+            self.literals.clear()
+            for literal in literals:
+                self._add_opaque(LType(type(literal.value)))
+
+    def _add_tuple(self, ltuple: LTuple) -> None:
+        # merging same-length tuples (tuple[str, int] | tuple[float, bool] => tuple[str | float, int | bool])
+        length = len(ltuple.item_types)
+        existing = self.tuples.get(length)
+        if existing is None:
+            self.tuples[length] = ltuple
+        else:
+            self.tuples[length] = LTuple(
+                [
+                    self.learner._simplify_learnt_type(LUnion([existing_item_type, item_type]))
+                    for existing_item_type, item_type in zip(existing.item_types, ltuple.item_types)
+                ]
+            )
+
+    def _add_collection(self, collection: LCollection) -> None:
+        # merging same-type collections (list[int] | list[str] -> list[int | str])
+        existing = self.collections.get(collection.collection_type)
+        if existing is None:
+            self.collections[collection.collection_type] = collection
+        else:
+            self.collections[collection.collection_type] = LCollection(
+                collection_type=collection.collection_type,
+                item_type=self.learner._simplify_learnt_type(LUnion([existing.item_type, collection.item_type])),
+            )
+
+    def _add_mapping(self, mapping: LMapping) -> None:
+        # typed dicts are demoted to mappings if there are regular mappings
+        if self.typed_dict is not None:
+            typed_dict = self.typed_dict
+            self.typed_dict = None
+            self._add_mapping(self.learner._demote_typed_dict_to_mapping(typed_dict))  # type: ignore
+        existing = self.mappings.get(mapping.mapping_type)
+        if existing is None:
+            self.mappings[mapping.mapping_type] = mapping
+        else:
+            self.mappings[mapping.mapping_type] = LMapping(
+                mapping_type=mapping.mapping_type,
+                key_type=self.learner._simplify_learnt_type(LUnion([existing.key_type, mapping.key_type])),
+                value_type=self.learner._simplify_learnt_type(LUnion([existing.value_type, mapping.value_type])),
+            )
+
+    def _add_typed_dict(self, typed_dict: Union[LTypedDict, LSparseTypedDict]) -> None:
+        if self.typed_dict is not None:
+            typed_dict = self.learner._merge_typed_dicts(self.typed_dict, typed_dict)
+        # demoting typed dicts to mappings if they are too large or if there are already regular mappings
+        if self.mappings or len(typed_dict.fields) > self.learner.max_typed_dict_size:
+            self.typed_dict = None
+            self._add_mapping(self.learner._demote_typed_dict_to_mapping(typed_dict))  # type: ignore
+        else:
+            self.typed_dict = typed_dict
+
+    def _add_object(self, obj: LObject) -> None:
+        # merging fields of the same class' objects, never with dicts or objects of other classes
+        existing = self.objects.get(obj.object_type)
+        if existing is None:
+            self.objects[obj.object_type] = obj
+        else:
+            self.objects[obj.object_type] = LObject(
+                obj.object_type, self.learner._simplify_learnt_type(LUnion([existing.fields, obj.fields]))
+            )
+
+    def _add_recursive(self, recursive: LRecursive) -> None:
+        existing = self.recursive.get(recursive.anchor)
+        if existing is None:
+            self.recursive[recursive.anchor] = recursive
+        else:
+            self.recursive[recursive.anchor] = LRecursive(
+                recursive.anchor, self.learner._simplify_learnt_type(LUnion([existing.body, recursive.body]))
+            )
+
+    def to_learnt_type(self) -> LearntType:
+        typed_dict = self.typed_dict
+        recursive_types = list(self.recursive.values())
+        if typed_dict is not None and len(recursive_types) == 1:
+            # the typed dict is a non-recursive instance of the same type, e.g. a tree node without children
+            recursive = recursive_types[0]
+            recursive_types = [
+                LRecursive(recursive.anchor, self.learner._simplify_learnt_type(LUnion([recursive.body, typed_dict])))
+            ]
+            typed_dict = None
+        members: list[LearntType] = [
+            *self.opaque,
+            *self.literals.values(),
+            *self.tuples.values(),
+            *self.collections.values(),
+            *self.mappings.values(),
+            *self.objects.values(),
+            *recursive_types,
+        ]
+        if typed_dict is not None:
+            members.append(typed_dict)
+
+        # removing union members that are subtypes of other members (Union[str, int, bool] => Union[str, int])
+        members = [member for member in members if not any(is_subtype(member, other) for other in members)]
+
+        # simplifying trivial unions (Union[T] -> T)
+        if len(members) == 1:
+            return members[0]
+        return LUnion(members)
@@ -0,0 +1,77 @@
+import random
+from typing import Any
+
+import pytest
+
+from slow_learner import TypeLearner
+from slow_learner.columns import summarize_columns
+from slow_learner.learnt_types import LNone, LType, LUnion
+
+
+def learn_rows(rows: list[dict[str, Any]], **kwargs: Any) -> TypeLearner:
+    tl = TypeLearner(**kwargs)
+    for row in rows:
+        tl.observe(row)
+    return tl
+
+
+def make_columns(rows_count: int) -> dict[str, list[Any]]:
+    random.seed(1312)
+    return {
+        "id": list(range(rows_count)),
+        "kind": [random.choice(["a", "b", "c"]) for _ in range(rows_count)],
+        "flag": [random.choice([True, False]) for _ in range(rows_count)],
+        "score": [random.random() for _ in range(rows_count)],
+        "small": [random.choice([0, 1, 2]) for _ in range(rows_count)],
+    }
+
+
+@pytest.mark.parametrize("kwargs", [{}, {"max_literal_type_size": 0}, {"no_literal_patterns": [r"\$\.kind"]}])
+def test_observe_columns_mapping(kwargs: dict[str, Any]):
+    columns = make_columns(100)
+    columns["nested"] = [{"x": i % 2} if i % 3 else None for i in range(100)]
+    columns["mixed"] = [random.choice([None, 1, 2.5, "a"]) for _ in range(100)]
+    columns["nullable"] = [random.choice([None, "abc", "x" * 100]) for _ in range(100)]
+    rows = [dict(zip(columns, values)) for values in zip(*columns.values())]
+    tl = TypeLearner(**kwargs)
+    tl.observe_columns(columns)
+    reference_tl = learn_rows(rows, **kwargs)
+    assert tl.observed_values == 100
+    assert tl.learnt_type == reference_tl.learnt_type
+
+
+def test_summarize_mapping_columns():
+    columns = {"id": [1, 2, None, 3], "small": [True, None, True], "score": [0.5, 1.5], "mixed": [1, 1.5]}
+    summaries = {summary.name: summary for summary in summarize_columns(columns, max_distinct=2)}
+    assert summaries["id"].scalar_type is int and summaries["id"].has_nulls
+    assert summaries["id"].distinct_values is None and summaries["id"].values is None
+    assert summaries["small"].scalar_type is bool and summaries["small"].distinct_values == [True]
+    assert summaries["score"].scalar_type is float and summaries["score"].distinct_values is None
+    assert summaries["mixed"].scalar_type is None and summaries["mixed"].values == [1, 1.5]
+
+
+def test_observe_columns_numpy():
+    numpy = pytest.importorskip("numpy")
+    columns = make_columns(1000)
+    records = numpy.rec.fromarrays(list(columns.values()), names=list(columns.keys()))
+    masked = numpy.ma.masked_array(records, mask=[(False, False, i % 7 == 0, False, False) for i in range(1000)])
+    tl = TypeLearner()
+    tl.observe_columns(records)
+    tl.observe_columns(masked)
+    reference_tl = learn_rows([dict(zip(columns, row)) for row in records.tolist() + masked.tolist()])
+    assert reference_tl.learnt_type.fields["flag"] == LUnion([LType(bool), LNone()])  # type: ignore
+    assert tl.learnt_type == reference_tl.learnt_type
+
+
+def test_observe_columns_arrow():
+    pyarrow = pytest.importorskip("pyarrow")
+    columns = make_columns(1000)
+    columns["small"] = [value if value else None for value in columns["small"]]
+    table = pyarrow.table(columns)
+    tl = TypeLearner()
+    for batch in table.to_batches(max_chunksize=300):
+        tl.observe_columns(batch)
+    tl.observe_columns(table)
+    reference_tl = learn_rows(table.to_pylist() * 2)
+    assert tl.observed_values == 2000
+    assert tl.learnt_type == reference_tl.learnt_type
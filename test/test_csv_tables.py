@@ -0,0 +1,60 @@
+import pathlib
+
+import pytest
+
+from slow_learner import TypeLearner
+from slow_learner.csv_tables import iter_csv_column_batches, parse_csv_scalar
+from slow_learner.learnt_types import LNone, LType, LTypedDict, LUnion
+
+
+def test_parse_csv_scalar():
+    assert [parse_csv_scalar(v) for v in ["", "true", "False", "12", "-3", "1.5", "1e3", "abc", " 1"]] == [
+        None,
+        True,
+        False,
+        12,
+        -3,
+        1.5,
+        1000.0,
+        "abc",
+        " 1",
+    ]
+    assert [parse_csv_scalar(v) for v in [".5", "2.", "-1E-2", "1_000", "nan", "inf", "-Infinity", " 1.5", "1e"]] == [
+        0.5,
+        2.0,
+        -0.01,
+        "1_000",
+        "nan",
+        "inf",
+        "-Infinity",
+        " 1.5",
+        "1e",
+    ]
+
+
+def test_csv_column_batches(tmp_path: pathlib.Path):
+    input_file = tmp_path / "input.csv"
+    input_file.write_text('id,name,score\n1,"a, quoted",1.5\n2,b\n3,c,\n4,"multi\nline",2\n5,a,3\n')
+    batches = list(iter_csv_column_batches(input_file, batch_size=2))
+    assert batches == [
+        {"id": [1, 2], "name": ["a, quoted", "b"], "score": [1.5, None]},
+        {"id": [3, 4], "name": ["c", "multi\nline"], "score": [None, 2]},
+        {"id": [5], "name": ["a"], "score": [3]},
+    ]
+    tl = TypeLearner(max_literal_type_size=3, no_literal_patterns=[r"\$\.name"])
+    for batch in batches:
+        tl.observe_columns(batch)
+    assert tl.learnt_type == LTypedDict(
+        {
+            "id": LType(int),
+            "name": LType(str),
+            "score": LUnion([LType(float), LNone()]),
+        }
+    )
+
+
+def test_csv_column_batches_repeated_names(tmp_path: pathlib.Path):
+    input_file = tmp_path / "input.csv"
+    input_file.write_text("id,name,id\n1,a,2\n")
+    with pytest.raises(ValueError, match=r"repeated column names: \['id'\]"):
+        list(iter_csv_column_batches(input_file, batch_size=2))
@@ -0,0 +1,33 @@
+import json
+
+import pytest
+
+from slow_learner import TypeLearner
+from slow_learner.decoders import DECODERS, get_decoder
+
+DOCUMENTS = [
+    {"int": 1, "float": 2.5, "str": "hello", "bool": True, "null": None, "list": [1, "a", {"nested": []}]},
+    {"int": 10**10, "float": -1e-10, "str": "привет", "list": []},
+    [1, 2, 3],
+]
+
+
+@pytest.mark.parametrize("decoder_name", list(DECODERS))
+def test_decoders_produce_same_learnt_types(decoder_name: str):
+    try:
+        decoder = get_decoder(decoder_name)
+    except ImportError:
+        pytest.skip(f"{decoder_name} is not installed")
+
+    reference_tl = TypeLearner()
+    tl = TypeLearner()
+    for document in DOCUMENTS:
+        encoded = json.dumps(document, ensure_ascii=False)
+        reference_tl.observe(json.loads(encoded))
+        tl.observe(decoder.decode(encoded.encode("utf-8") if decoder.accepts_bytes else encoded))
+    assert tl.learnt_type == reference_tl.learnt_type
+
+
+def test_unknown_decoder():
+    with pytest.raises(ValueError):
+        get_decoder("yaml")
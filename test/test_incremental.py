@@ -0,0 +1,94 @@
+import json
+import os
+import pathlib
+from unittest.mock import Mock
+
+import pytest
+from click.testing import CliRunner
+
+from slow_learner import TypeLearner, incremental
+from slow_learner.cli import cli
+from slow_learner.incremental import IncrementalState, iter_input_files
+
+
+def test_incremental_state(tmp_path: pathlib.Path):
+    data_dir = tmp_path / "data"
+    (data_dir / "nested").mkdir(parents=True)
+    paths = [data_dir / "1.json", data_dir / "nested" / "2.json"]
+    for path in paths:
+        path.write_text("{}")
+    assert list(iter_input_files([data_dir])) == paths
+
+    state = IncrementalState(tmp_path / "state", options={"patterns": ("a",)}, hash_contents=True)
+    assert state.load() is None
+    for path in paths:
+        assert not state.is_learnt(path)
+        state.record_learnt(path, state.file_entry(path))
+    tl = TypeLearner()
+    tl.observe({})
+    state.save({"T": tl})
+
+    state = IncrementalState(tmp_path / "state", options={"patterns": ["a"]}, hash_contents=True)
+    learners = state.load()
+    assert learners is not None and learners["T"].observed_values == 1
+    assert all(state.is_learnt(path) for path in paths)
+    os.utime(paths[0], ns=(0, 0))  # same contents
+    paths[1].write_text("[]")  # same size, other contents
+    os.utime(paths[1], ns=(0, 0))
+    assert state.is_learnt(paths[0])
+    assert not state.is_learnt(paths[1])
+    assert IncrementalState(tmp_path / "state", options={"patterns": ["b"]}).load() is None
+
+
+def test_cli_learn_incremental(tmp_path: pathlib.Path):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    (data_dir / "1.json").write_text(json.dumps({"a": 1}))
+    args = ["learn", "--type-name", "T", "--output-file", str(tmp_path / "T.py"), "--state-dir", str(tmp_path / "s")]
+    runner = CliRunner()
+    assert runner.invoke(cli, [*args, str(data_dir)]).exit_code == 0
+    (data_dir / "2.json").write_text(json.dumps({"a": 2, "b": None}))
+    result = runner.invoke(cli, [*args, str(data_dir)])
+    assert result.exit_code == 0
+    assert "learning 1 new or changed input file(s) of 2" in result.output
+    module = (tmp_path / "T.py").read_text()
+    assert "from 2 observed value(s)" in module
+    assert "b: NotRequired[None]" in module
+
+
+def test_incremental_state_interrupted_save(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch):
+    path = tmp_path / "1.json"
+    path.write_text("{}")
+    state = IncrementalState(tmp_path / "state", options={})
+    state.record_learnt(path, state.file_entry(path))
+    state.save({"T": TypeLearner()})
+
+    # interrupted after saving learners, before writing the manifest: learnt files are saved with the learners
+    path_2 = tmp_path / "2.json"
+    path_2.write_text("[]")
+    state.record_learnt(path_2, state.file_entry(path_2))
+    monkeypatch.setattr(incremental, "write_atomically", Mock(side_effect=KeyboardInterrupt))
+    with pytest.raises(KeyboardInterrupt):
+        state.save({"T": TypeLearner()})
+    state = IncrementalState(tmp_path / "state", options={})
+    assert state.load() is not None
+    assert state.is_learnt(path) and state.is_learnt(path_2)
+
+
+def test_cli_learn_incremental_seed_module(tmp_path: pathlib.Path):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    (data_dir / "1.json").write_text(json.dumps({"a": 1}))
+    seed_path = tmp_path / "Seed.py"
+    seed_path.write_text("from typing import TypedDict\n\nclass T(TypedDict):\n    a: int\n")
+    args = ["learn", "--type-name", "T", "--output-file", str(tmp_path / "T.py"), "--state-dir", str(tmp_path / "s")]
+    args += ["--seed-module", str(seed_path), str(data_dir)]
+    runner = CliRunner()
+    assert runner.invoke(cli, args).exit_code == 0
+    assert "learning 0 new or changed input file(s) of 1" in runner.invoke(cli, args).output
+
+    # types seeded from another module are learnt from scratch
+    seed_path.write_text("from typing import TypedDict\n\nclass T(TypedDict):\n    a: str\n")
+    result = runner.invoke(cli, args)
+    assert result.exit_code == 0 and "Loaded learnt types" not in result.output
+    assert "a: Union[str, Literal[1]]" in (tmp_path / "T.py").read_text()
@@ -0,0 +1,31 @@
+import json
+import pathlib
+from typing import Any
+
+import pytest
+
+from slow_learner.json_documents import iter_concatenated_json_documents
+
+
+@pytest.mark.parametrize(
+    "documents, separator",
+    [
+        ([{"a": 1}, {"b": [1, 2, {"c": None}]}, {}], ""),
+        ([{"a": 1}, [], {"b": "}{]["}, {"escaped": 'quote " and \\\\ backslash'}], ""),
+        ([1, "string", None, True, 3.5, {"x": [1]}], "\n"),
+        ([{"unicode": "привет"}, ["emoji 🙂"]], " \n\t"),
+        ([], ""),
+    ],
+)
+def test_concatenated_json_documents(documents: list[Any], separator: str, tmp_path: pathlib.Path):
+    input_file = tmp_path / "input.json"
+    input_file.write_text(separator.join(json.dumps(d, ensure_ascii=False) for d in documents), encoding="utf-8")
+    assert list(iter_concatenated_json_documents(input_file)) == documents
+
+
+@pytest.mark.parametrize("content", ['{"a": 1}{"b": 2', '{"a": 1}]', '{"a": "unterminated}'])
+def test_concatenated_json_documents_malformed(content: str, tmp_path: pathlib.Path):
+    input_file = tmp_path / "input.json"
+    input_file.write_text(content)
+    with pytest.raises(ValueError):
+        list(iter_concatenated_json_documents(input_file))
@@ -0,0 +1,49 @@
+from typing import Any
+
+import pytest
+
+from slow_learner.json_path import JsonPath, parse_json_path
+
+DOCUMENT = {
+    "data": {"items": [{"id": 1}, {"id": 2}, {"id": 3}]},
+    "meta": {"page": 1, "with.dot": True},
+    "included": [],
+}
+
+
+@pytest.mark.parametrize(
+    "expression, expected_values",
+    [
+        ("$", [DOCUMENT]),
+        ("$.meta", [{"page": 1, "with.dot": True}]),
+        ("$.data.items[*]", [{"id": 1}, {"id": 2}, {"id": 3}]),
+        ("$.data.items[*].id", [1, 2, 3]),
+        ("$.data.items[-1]", [{"id": 3}]),
+        ("$.data.items[5]", []),
+        ("$['meta'][\"with.dot\"]", [True]),
+        ("$.meta.*", [1, True]),
+        ("$.included[*]", []),
+        ("$.missing.key", []),
+        ("$.meta.page.deeper", []),
+    ],
+)
+def test_json_path_select(expression: str, expected_values: list[Any]):
+    assert list(JsonPath(expression).select(DOCUMENT)) == expected_values
+
+
+@pytest.mark.parametrize("expression", ["data", "$.", "$[abc]", "$.a[", "$..a"])
+def test_json_path_invalid(expression: str):
+    with pytest.raises(ValueError):
+        parse_json_path(expression)
+
+
+def test_json_path_covers():
+    json_path = JsonPath("$.data.items[*].raw")
+    assert json_path.covers(["data", "items", 3, "raw"])
+    assert json_path.covers(["data", "items", 3, "raw", "nested", 0])
+    assert not json_path.covers(["data", "items", 3])
+    assert not json_path.covers(["data", "meta", 3, "raw"])
+    assert json_path.may_match_below(["data", "items", 3])
+    assert json_path.may_match_below([])
+    assert not json_path.may_match_below(["data", "meta"])
+    assert not json_path.may_match_below(["data", "items", 3, "raw"])
@@ -0,0 +1,64 @@
+import json
+import random
+from typing import Any
+
+import pytest
+
+from slow_learner import TypeLearner
+
+
+def random_value(rng: random.Random, depth: int = 0) -> Any:
+    kind = rng.random()
+    if depth > 4 or kind < 0.4:
+        return rng.choice(
+            [None, True, False, rng.randint(-3, 3), rng.random(), 10**30, "a", "é" * 12, "x" * 20, '"\n"', "😀", ""]
+        )
+    if kind < 0.7:
+        return [random_value(rng, depth + 1) for _ in range(rng.randint(0, 4))]
+    return {rng.choice(["a", "b", "c", "d é", 'x"y']): random_value(rng, depth + 1) for _ in range(rng.randint(0, 4))}
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {},
+        {"max_literal_type_size": 0},
+        {"max_literal_string_length": 5},
+        {"max_recursive_type_depth": 2},
+        {"learn_typed_dicts": False},
+        {"no_literal_patterns": [r"\.a"]},
+        {"sparse_typed_dicts": True},
+        {"exclude_paths": ["$.a", "$.b[*]"]},
+        {"include_paths": ["$.c"], "opaque_excluded_paths": True},
+        {"track_occurrences": True, "min_support": 2, "prune_every": 7},
+        {"discriminator": "a"},
+    ],
+)
+def test_observe_json_bytes(kwargs: dict[str, Any]):
+    rng = random.Random(1312)
+    for _ in range(10):
+        reference = TypeLearner(**kwargs)
+        tl = TypeLearner(**kwargs)
+        for _ in range(20):
+            text = json.dumps(random_value(rng), ensure_ascii=rng.random() < 0.5, indent=rng.choice([None, 1]))
+            reference.observe(json.loads(text))
+            tl.observe_json_bytes(text.encode())
+        assert tl.learnt_type == reference.learnt_type
+        assert tl.generate_type_definition("T", doc="") == reference.generate_type_definition("T", doc="")
+
+
+def test_observe_json_bytes_duplicate_keys():
+    data = b'{"a": 1, "b": [1.5], "a": "x"}'
+    reference = TypeLearner()
+    reference.observe(json.loads(data))
+    tl = TypeLearner()
+    tl.observe_json_bytes(data)
+    assert tl.learnt_type == reference.learnt_type
+
+
+@pytest.mark.parametrize(
+    "data", [b'{"a" 1}', b"[1,]", b"[1 2]", b'{"a": 1', b'"abc', b"tru", b"1 2", b"", b'{"a": "\\x"}', b"{1: 2}"]
+)
+def test_observe_json_bytes_malformed(data: bytes):
+    with pytest.raises(json.JSONDecodeError):
+        TypeLearner().observe_json_bytes(data)
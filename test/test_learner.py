@@ -1,14 +1,20 @@
+import collections.abc
+import concurrent.futures
+import dataclasses
+import io
 import pathlib
+import pickle
 import random
 import string
 import subprocess
 import uuid
-from typing import Any
+from typing import Any, Optional
 
 import pytest
 from pytest import param
 
-from slow_learner import TypeLearner
+from slow_learner import TypeLearner, type_learner
+from slow_learner.item_scanning import ItemScanPolicy
 from slow_learner.learnt_types import (
     LCollection,
     LearntType,
@@ -16,11 +22,19 @@ from slow_learner.learnt_types import (
     LMapping,
     LMissingTypedDictKey,
     LNone,
+    LObject,
+    LRecursive,
+    LRecursiveRef,
+    LSparseTypedDict,
     LTuple,
     LType,
     LTypedDict,
     LUnion,
+    learnt_type_size,
+    map_child_types,
 )
+from slow_learner.type_learner import generate_types_module
+from slow_learner.typedef_generation import PythonVersion
 
 
 @pytest.mark.parametrize(
@@ -36,6 +50,7 @@ from slow_learner.learnt_types import (
         param([True, False], LType(bool), True),
         param([True, False, *range(100)], LType(int), True),
         param([True, False, *string.ascii_letters], LUnion([LType(bool), LType(str)]), True),
+        param([0, 1], LUnion([LLiteral(0), LLiteral(1)]), True, id="int literals are not confused with bools"),
         # tuples
         param([(1, "a")], LTuple([LLiteral(1), LLiteral("a")]), True),
         param(
@@ -229,3 +244,780 @@ def test_type_learner_basic(
             break
 
         random.shuffle(stream)
+
+
+def test_type_learner_size_budget():
+    tl = TypeLearner(max_typed_dict_size=1000, max_learnt_type_size=50, size_check_every=1)
+    for i in range(200):
+        tl.observe({"status": "ok", "items_by_id": {uuid.uuid4().hex: {"value": i, "kind": i % 3 + 5}}})
+        assert learnt_type_size(tl.learnt_type) <= 50
+    assert tl.learnt_type == LTypedDict(
+        {
+            "status": LLiteral("ok"),
+            "items_by_id": LMapping(
+                dict,
+                LType(str),
+                LTypedDict({"value": LType(int), "kind": LUnion([LLiteral(5), LLiteral(6), LLiteral(7)])}),
+            ),
+        }
+    )
+    assert tl.generalized_paths == {"$.items_by_id": "typed dict with 10 key(s) demoted to mapping"}
+    assert "$.items_by_id: typed dict with 10 key(s) demoted to mapping" in tl.generate_type_definition("T", doc="")
+
+
+def test_type_learner_size_budget_check_every():
+    tl = TypeLearner(max_typed_dict_size=1000, max_learnt_type_size=50, size_check_every=20)
+    for i in range(1, 20):
+        tl.observe({uuid.uuid4().hex: i})
+    assert learnt_type_size(tl.learnt_type) > 50 and not tl.generalized_paths
+    tl.observe({uuid.uuid4().hex: 20})
+    assert tl.generalized_paths == {"$": "typed dict with 20 key(s) demoted to mapping"}
+    tl.observe({"status": "ok", "items": [uuid.uuid4().hex for _ in range(30)]})
+    assert tl._merges_since_size_check == 1
+    typedef = tl.generate_type_definition("T", doc="")
+    assert tl._merges_since_size_check == 0 and "Generalized to fit in 50 nodes" in typedef
+    with pytest.raises(ValueError, match="must be positive"):
+        TypeLearner(size_check_every=0)
+
+
+def test_type_learner_size_budget_union_generalization():
+    tl = TypeLearner(max_learnt_type_size=10, size_check_every=1)
+    for value in [(1,), (1, "a"), [2.5], 3, "b"]:
+        tl.observe([value])
+    assert tl.learnt_type == LCollection(
+        list,
+        LUnion(
+            [
+                LType(int),
+                LType(str),
+                LCollection(collections.abc.Collection, LUnion([LType(float), LLiteral("a")])),
+            ]
+        ),
+    )
+    assert tl.generalized_paths == {"$[*]": "3 variant(s) of union of 5 type(s) merged by kind"}
+
+    # object is used only when there's nothing left to merge, and the union doesn't grow again after that
+    tl = TypeLearner(max_learnt_type_size=8, size_check_every=1)
+    for value in [1, "a", b"x", 2.5, None, [1], (1, 2), {"b": [1]}]:
+        tl.observe([value])
+    assert tl.learnt_type == LCollection(list, LType(object))
+    assert tl.generalized_paths["$[*]"] == "union of 6 type(s) generalized to object as a last resort"
+    for value in [{"c": "d"}, [1, "a"], "z", (1, 2, 3), None]:
+        tl.observe([value])
+        assert tl.learnt_type == LCollection(list, LType(object))
+    assert "$[*]: union of 6 type(s) generalized to object as a last resort" in tl.generate_type_definition("T", doc="")
+
+
+@pytest.mark.parametrize("prune_every", [None, 10])
+def test_type_learner_min_support(prune_every: Any):
+    stream: list[Any] = [{"value": i, "status": "ok" if i % 2 else "error"} for i in range(100)]
+    stream.insert(30, {"value": "oops", "status": "Ok", "debug": True})
+    stream.insert(60, {"status": "ok"})
+    stream.insert(90, [1, 2, 3])
+    tl = TypeLearner(min_support=2, prune_every=prune_every)
+    for value in stream:
+        tl.observe(value)
+    expected_learnt_type = LTypedDict({"value": LType(int), "status": LUnion([LLiteral("ok"), LLiteral("error")])})
+    if prune_every is None:
+        assert tl.learnt_type != expected_learnt_type
+        tl.prune()
+    assert tl.learnt_type == expected_learnt_type
+
+
+def test_type_learner_min_support_after_typed_dict_demotion():
+    tl = TypeLearner(max_typed_dict_size=5, min_support=3)
+    for i in range(20):
+        tl.observe({f"key{i}": i, f"other{i}": "value"})
+    tl.observe({"rare": None})
+    assert tl.learnt_type == LMapping(dict, LType(str), LUnion([LType(int), LType(str), LNone()]))
+    tl.prune()
+    assert tl.learnt_type == LMapping(dict, LType(str), LUnion([LType(int), LType(str)]))
+
+
+@pytest.mark.parametrize("sparse_typed_dicts", [False, True])
+def test_type_learner_window(sparse_typed_dicts: bool):
+    tl = TypeLearner(window_size=100, forget_every=10, sparse_typed_dicts=sparse_typed_dicts)
+    for i in range(300):
+        tl.observe({"id": i, "status": "ok" if i % 2 else "legacy", "old": {"flag": True}})
+    for i in range(300):
+        tl.observe({"id": i, "status": "ok" if i % 2 else "error", "items": [i]} if i % 3 else {"id": i})
+    assert tl.learnt_type == LTypedDict(
+        {
+            "id": LType(int),
+            "status": LUnion([LLiteral("ok"), LLiteral("error"), LMissingTypedDictKey()]),
+            "items": LUnion([LCollection(list, LType(int)), LMissingTypedDictKey()]),
+        }
+    )
+    for i in range(150):
+        tl.observe({"id": i, "status": "ok", "items": []})
+    assert tl.learnt_type == LTypedDict(
+        {"id": LType(int), "status": LLiteral("ok"), "items": LCollection(list, LType(int))}
+    )
+    assert tl.occurrences is not None and "$.old" not in tl.occurrences.kinds
+
+
+def test_type_learner_window_seconds(monkeypatch: pytest.MonkeyPatch):
+    from slow_learner import type_learner
+
+    now = 1000.0
+    monkeypatch.setattr(type_learner.time, "time", lambda: now)
+    tl = TypeLearner(window_seconds=60, forget_every=1, discriminator="type")
+    tl.observe({"type": "created", "id": 1})
+    tl.observe({"type": "deleted", "id": "x"})
+    tl.observe([1])
+    now += 30
+    tl.observe({"type": "created", "id": 2.5})
+    now += 40
+    tl.observe({"type": "created", "id": 3})
+    assert list(tl.sub_learners) == ["created"]
+    assert tl.learnt_type is None
+    assert tl.sub_learners["created"].learnt_type == LTypedDict({"type": LLiteral("created"), "id": LType(float)})
+
+
+@pytest.mark.parametrize("random_sampling", [False, True])
+def test_type_learner_item_scan_policy(monkeypatch: pytest.MonkeyPatch, random_sampling: bool):
+    tl = TypeLearner(
+        item_scan_policy=ItemScanPolicy(stable_items=20, max_sampled_items=10, random_sampling=random_sampling, seed=1)
+    )
+    learnt_values_count = 0
+    original_learn_variable_type = tl._learn_variable_type
+
+    def learn_variable_type(*args, **kwargs):
+        nonlocal learnt_values_count
+        learnt_values_count += 1
+        return original_learn_variable_type(*args, **kwargs)
+
+    monkeypatch.setattr(tl, "_learn_variable_type", learn_variable_type)
+    tl.observe({"values": list(range(100_000)), "by_id": {i: {"id": i} for i in range(100_000)}, "small": [1, 2]})
+    assert tl.learnt_type == LTypedDict(
+        {
+            "values": LCollection(list, LType(int)),
+            "by_id": LMapping(dict, LType(int), LTypedDict({"id": LType(int)})),
+            "small": LCollection(list, LUnion([LLiteral(1), LLiteral(2)])),
+        }
+    )
+    assert learnt_values_count < 300
+    assert tl.sampled_paths == {"$.values": 1, "$.by_id": 1}
+    assert "Learnt from sampled items:\n- $.values: 1 time(s)\n- $.by_id: 1 time(s)\n" in tl.generate_type_definition(
+        "T", doc=""
+    )
+
+
+def test_type_learner_item_scan_policy_unstable_items(monkeypatch: pytest.MonkeyPatch):
+    tl = TypeLearner(
+        max_typed_dict_size=10**6,
+        item_scan_policy=ItemScanPolicy(stable_items=20, max_sampled_items=10, max_scanned_items=100),
+    )
+    fingerprints_count = 0
+    original_fingerprint = type_learner.learnt_type_fingerprint
+
+    def learnt_type_fingerprint(*args: Any, **kwargs: Any) -> bytes:
+        nonlocal fingerprints_count
+        fingerprints_count += 1
+        return original_fingerprint(*args, **kwargs)
+
+    monkeypatch.setattr(type_learner, "learnt_type_fingerprint", learnt_type_fingerprint)
+    # each item has a new key, so the reduced item type never stabilizes
+    tl.observe([{f"key{i}": i} for i in range(10_000)])
+    assert isinstance(tl.learnt_type, LCollection) and isinstance(tl.learnt_type.item_type, LTypedDict)
+    assert len(tl.learnt_type.item_type.fields) == 110
+    assert fingerprints_count == 10
+    assert tl.sampled_paths == {"$": 1}
+
+    with pytest.raises(ValueError, match="max_scanned_items"):
+        ItemScanPolicy(stable_items=20, max_scanned_items=10)
+
+
+def test_item_scan_policy_sampled_indices():
+    rng = random.Random(0)
+    assert ItemScanPolicy(max_sampled_items=4).sampled_indices(10, 30, rng) == [10, 15, 20, 25]
+    assert ItemScanPolicy(max_sampled_items=4, stride=3).sampled_indices(10, 30, rng) == [10, 13, 16, 19]
+    random_indices = ItemScanPolicy(max_sampled_items=4, random_sampling=True).sampled_indices(10, 30, rng)
+    assert len(set(random_indices)) == 4 and random_indices == sorted(random_indices)
+    assert all(10 <= idx < 30 for idx in random_indices)
+
+
+@pytest.mark.parametrize("sparse_typed_dicts", [False, True])
+def test_type_learner_seed(monkeypatch: pytest.MonkeyPatch, sparse_typed_dicts: bool):
+    random.seed(1312)
+    values: list[Any] = [
+        {"id": i, "tags": random.sample(["a", "b", "c"], 2), "meta": {"score": random.random()} if i % 2 else None}
+        for i in range(100)
+    ]
+    reference_tl = TypeLearner(sparse_typed_dicts=sparse_typed_dicts)
+    for value in values:
+        reference_tl.observe(value)
+    module = reference_tl.generate_type_definition("T", doc="")
+
+    tl = TypeLearner(sparse_typed_dicts=sparse_typed_dicts)
+    tl.seed_from_module(module, "T")
+    learnt_values: list[Any] = []
+    original_learn_variable_type = tl._learn_variable_type
+
+    def learn_variable_type(var: Any, *args: Any, **kwargs: Any) -> LearntType:
+        learnt_values.append(var)
+        return original_learn_variable_type(var, *args, **kwargs)
+
+    monkeypatch.setattr(tl, "_learn_variable_type", learn_variable_type)
+    for value in values:
+        tl.observe(value)
+    assert all(not isinstance(var, (dict, list)) for var in learnt_values)
+    assert tl.generate_type_definition("T", doc="") == module
+
+    learnt_values.clear()
+    deviating_value = {"id": "x", "tags": ["a"], "meta": {"score": 1.0, "source": "api"}}
+    tl.observe(deviating_value)
+    reference_tl.observe(deviating_value)
+    # only scalars are learnt to be checked against the seed, and then the new field
+    assert learnt_values == ["x", "a", 1.0, "api"]
+    # sparse typed dicts' key counts differ, but not the keys' requiredness
+    assert tl.generate_type_definition("T", doc="") == reference_tl.generate_type_definition("T", doc="")
+
+
+@pytest.mark.parametrize(
+    "values, deviating_value, learn_typed_dicts",
+    [
+        param([{"xs": [1.5, 2.5]}], {"xs": [1, True, "x", "a", "b"]}, True, id="collection"),
+        param([{"xs": [1.5, "x", "a"]}], {"xs": ["a", "x", True, 1]}, True, id="conforming collection"),
+        param([{"x": 1.5}], {"a": 1, "b": True, "c": "x", "d": "a", "e": "b"}, False, id="mapping"),
+    ],
+)
+def test_type_learner_seed_literal_limit(values: list[Any], deviating_value: Any, learn_typed_dicts: bool):
+    # conforming items are not learnt again, but their literals count toward the literal type size limit
+    reference_tl = TypeLearner(max_literal_type_size=3, learn_typed_dicts=learn_typed_dicts)
+    for value in values:
+        reference_tl.observe(value)
+    tl = TypeLearner(max_literal_type_size=3, learn_typed_dicts=learn_typed_dicts)
+    tl.seed_from_module(reference_tl.generate_type_definition("T", doc=""), "T")
+    assert tl.seeded
+    tl.observe(deviating_value)
+    reference_tl.observe(deviating_value)
+    assert "Literal" not in reference_tl.generate_type_definition("T", doc="")
+    assert tl.learnt_type == reference_tl.learnt_type
+
+
+def test_type_learner_seed_discriminator():
+    seed_type = LUnion(
+        [
+            LTypedDict({"type": LLiteral("created"), "id": LType(int)}),
+            LTypedDict({"type": LLiteral("deleted"), "id": LType(int), "reason": LType(str)}),
+            LNone(),
+        ]
+    )
+    tl = TypeLearner(discriminator="type", seed_type=seed_type)
+    assert tl.learnt_type == LNone()
+    assert set(tl.sub_learners) == {"created", "deleted"}
+    tl.observe({"type": "created", "id": 1})
+    assert tl.sub_learners["created"].learnt_type == LTypedDict({"type": LLiteral("created"), "id": LType(int)})
+
+
+@pytest.mark.parametrize("opaque_excluded_paths", [False, True])
+def test_type_learner_path_projection(monkeypatch: pytest.MonkeyPatch, opaque_excluded_paths: bool):
+    tl = TypeLearner(
+        include_paths=["$.data", "$.meta.page"],
+        exclude_paths=["$.data.items[*].raw"],
+        opaque_excluded_paths=opaque_excluded_paths,
+    )
+    learnt_values: list[Any] = []
+    original_learn_variable_type = tl._learn_variable_type
+
+    def learn_variable_type(var: Any, *args: Any, **kwargs: Any) -> LearntType:
+        learnt_values.append(var)
+        return original_learn_variable_type(var, *args, **kwargs)
+
+    monkeypatch.setattr(tl, "_learn_variable_type", learn_variable_type)
+    for i in range(10):
+        tl.observe(
+            {
+                "data": {"items": [{"id": i % 2, "raw": {"blob": [i] * 100}}]},
+                "meta": {"page": 1, "debug": {"trace": ["..."] * 100}},
+                "other": "x" * i,
+            }
+        )
+    assert not any(isinstance(var, dict) and ("blob" in var or "trace" in var) for var in learnt_values)
+    excluded_type = LType(dict) if opaque_excluded_paths else LUnion([])
+    assert tl.learnt_type == LTypedDict(
+        {
+            "data": LTypedDict(
+                {
+                    "items": LCollection(
+                        list, LTypedDict({"id": LUnion([LLiteral(0), LLiteral(1)]), "raw": excluded_type})
+                    )
+                }
+            ),
+            "meta": LTypedDict({"page": LLiteral(1), "debug": excluded_type}),
+            "other": LType(str) if opaque_excluded_paths else LUnion([]),
+        }
+    )
+    assert len(tl._excluded_paths_cache) == 9
+    # decisions are cached by path pattern, not by each key and index that no pattern names
+    for i in range(100):
+        tl.observe({"data": {"items": [{"id": 0}] * 3, f"key{i}": 1}, "meta": {f"key{i}": 1}})
+    assert len(tl._excluded_paths_cache) == 10
+
+    with pytest.raises(ValueError, match="Negative indices"):
+        TypeLearner(exclude_paths=["$.items[-1]"])
+
+
+def test_type_learner_merge_memo():
+    rng = random.Random(0)
+    values = [
+        rng.choice(
+            [
+                {"kind": "a", "user": {"name": "x", "tags": ["a", "b"]}},
+                {"kind": "b", "error": {"code": rng.choice([400, 500]), "message": None}},
+                {"kind": "c", "values": [1.5, None], "page": rng.randint(0, 20)},
+                [rng.choice([True, False, "x"])],
+            ]
+        )
+        for _ in range(500)
+    ]
+    reference = TypeLearner()
+    memoized = TypeLearner(merge_memo_size=8)
+    for value in values:
+        reference.observe(value)
+        memoized.observe(value)
+        assert memoized.learnt_type == reference.learnt_type
+    assert memoized.merge_memo_hits > 300
+    assert memoized.merge_memo_hits + memoized.merge_memo_misses == len(values) - 1
+    assert len(memoized._merge_memo) == 8
+    assert reference.merge_memo_hits == reference.merge_memo_misses == 0
+
+
+def test_type_learner_numpy():
+    numpy = pytest.importorskip("numpy")
+    tl = TypeLearner()
+    tl.observe({"scores": numpy.zeros((1000, 1000)), "count": numpy.int64(3), "name": numpy.str_("x")})
+    tl.observe({"scores": numpy.arange(3), "count": 4, "name": "y", "at": numpy.array([0], dtype="datetime64[s]")})
+    assert tl.learnt_type == LTypedDict(
+        {
+            "scores": LCollection(numpy.ndarray, LType(float)),
+            "count": LUnion([LLiteral(3), LLiteral(4)]),
+            "name": LUnion([LLiteral("x"), LLiteral("y")]),
+            "at": LUnion([LCollection(numpy.ndarray, LType(numpy.datetime64)), LMissingTypedDictKey()]),
+        }
+    )
+    assert all(type(literal.value) in (int, str) for literal in tl.learnt_type.fields["count"].member_types)
+    module = tl.generate_type_definition("T", doc="", target_version=PythonVersion.current())
+    assert "scores: NDArray[floating[Any]]" in module
+    assert "NDArray[datetime64]" in module
+    exec(module, {})
+
+
+@dataclasses.dataclass
+class Tag:
+    name: str
+    weight: Optional[float] = None
+
+
+@dataclasses.dataclass
+class User:
+    id: int
+    tags: list[Tag]
+    manager: Optional["User"] = None
+
+
+def without_objects(lt: LearntType) -> LearntType:
+    return without_objects(lt.fields) if isinstance(lt, LObject) else map_child_types(lt, without_objects)
+
+
+@pytest.mark.parametrize("seeded", [False, True])
+def test_type_learner_object_fields(seeded: bool):
+    users = [User(i, [Tag("a", i / 2)] * (i % 3), manager=User(0, [Tag("b")]) if i % 2 else None) for i in range(20)]
+    reference = TypeLearner()
+    for user in users:
+        reference.observe(dataclasses.asdict(user))
+    unseeded_tl = TypeLearner(learn_object_fields=True)
+    for user in users:
+        unseeded_tl.observe(user)
+    tl = TypeLearner(learn_object_fields=True, seed_type=unseeded_tl.learnt_type if seeded else None)
+    for user in users:
+        tl.observe(user)
+    assert tl.learnt_type == unseeded_tl.learnt_type
+    assert isinstance(tl.learnt_type, LObject) and tl.learnt_type.object_type is User
+    # objects' fields are learnt like their dicts
+    assert without_objects(tl.learnt_type) == reference.learnt_type
+    assert TypeLearner(learn_object_fields=False)._learn_variable_type(users[0]) == LType(User)
+
+
+def test_type_learner_object_fields_classes():
+    @dataclasses.dataclass
+    class Point:
+        x: int
+
+    stream = [Point(1), Tag("a"), {"x": 2}, {"x": 3, "points": [Point(4), Tag("b")]}, Point(5)]
+    tl = TypeLearner(learn_object_fields=True, max_literal_type_size=0)
+    for value in stream:
+        tl.observe(value)
+    # objects are only merged with objects of the same class
+    assert tl.learnt_type == LUnion(
+        [
+            LObject(Point, LTypedDict({"x": LType(int)})),
+            LObject(Tag, LTypedDict({"name": LType(str), "weight": LNone()})),
+            LTypedDict(
+                {
+                    "x": LType(int),
+                    "points": LUnion(
+                        [
+                            LCollection(
+                                list,
+                                LUnion(
+                                    [
+                                        LObject(Point, LTypedDict({"x": LType(int)})),
+                                        LObject(Tag, LTypedDict({"name": LType(str), "weight": LNone()})),
+                                    ]
+                                ),
+                            ),
+                            LMissingTypedDictKey(),
+                        ]
+                    ),
+                }
+            ),
+        ]
+    )
+    typedef = tl.generate_type_definition("T", doc="")
+    assert "class Point(TypedDict):\n    x: int\n" in typedef
+    assert "class Tag(TypedDict):\n    name: str\n    weight: None\n" in typedef
+    assert "points: NotRequired[List[Union[Point2, Tag2]]]" in typedef
+    assert "T = Union[Point, Tag, TVariant3]" in typedef
+    exec(typedef, {})
+
+    tracking_tl = TypeLearner(learn_object_fields=True, max_literal_type_size=0, min_support=2)
+    for value in stream:
+        tracking_tl.observe(value)
+    tracking_tl.prune()
+    # Tag objects and the points key were observed once, Point objects are counted apart from dicts
+    assert tracking_tl.learnt_type == LUnion(
+        [LObject(Point, LTypedDict({"x": LType(int)})), LTypedDict({"x": LType(int)})]
+    )
+
+
+def test_type_learner_attrs_object_fields():
+    attr = pytest.importorskip("attr")
+
+    @attr.s(auto_attribs=True, slots=True)
+    class Point:
+        x: float
+        y: float
+
+    tl = TypeLearner(learn_object_fields=True)
+    tl.observe({"points": [Point(1.0, 2.0)]})
+    assert tl.learnt_type == LTypedDict(
+        {"points": LCollection(list, LObject(Point, LTypedDict({"x": LType(float), "y": LType(float)})))}
+    )
+
+
+def test_type_learner_typedef_caching(monkeypatch: pytest.MonkeyPatch):
+    from slow_learner import typedef_generation
+
+    generated_typed_dicts: list[str] = []
+    original_generate_typed_dict_typedef = typedef_generation.generate_typed_dict_typedef
+
+    def generate_typed_dict_typedef(lt, type_name, *args, **kwargs):
+        generated_typed_dicts.append(type_name)
+        return original_generate_typed_dict_typedef(lt, type_name, *args, **kwargs)
+
+    monkeypatch.setattr(typedef_generation, "generate_typed_dict_typedef", generate_typed_dict_typedef)
+
+    tl = TypeLearner()
+    tl.observe({"unchanged": {"nested": {"value": 1}}, "changing": {"value": 1}})
+    typedef = tl.generate_type_definition("T", doc="")
+    assert generated_typed_dicts == ["T", "TUnchanged", "TUnchangedNested", "TChanging"]
+    assert tl.generate_type_definition("T", doc="") == typedef
+    assert len(generated_typed_dicts) == 4
+
+    tl.observe({"unchanged": {"nested": {"value": 1}}, "changing": {"value": 2}})
+    reference_tl = TypeLearner()
+    reference_tl.observe({"unchanged": {"nested": {"value": 1}}, "changing": {"value": 1}})
+    reference_tl.observe({"unchanged": {"nested": {"value": 1}}, "changing": {"value": 2}})
+    generated_typed_dicts.clear()
+    assert tl.generate_type_definition("T", doc="") == reference_tl.generate_type_definition("T", doc="")
+    assert generated_typed_dicts[:2] == ["T", "TChanging"]
+
+
+def test_type_learner_typedef_caching_by_version(monkeypatch: pytest.MonkeyPatch):
+    from slow_learner import typedef_generation
+
+    fingerprints_count = 0
+    original_fingerprint = typedef_generation.learnt_type_fingerprint
+
+    def learnt_type_fingerprint(*args: Any, **kwargs: Any) -> bytes:
+        nonlocal fingerprints_count
+        fingerprints_count += 1
+        return original_fingerprint(*args, **kwargs)
+
+    monkeypatch.setattr(typedef_generation, "learnt_type_fingerprint", learnt_type_fingerprint)
+    monkeypatch.setattr(type_learner, "learnt_type_fingerprint", learnt_type_fingerprint)
+
+    tl = TypeLearner(sparse_typed_dicts=True, discriminator="kind")
+    tl.observe({"kind": "a", "value": 1})
+    tl.observe({"kind": "b", "values": {"x": 1}})
+    tl.observe([1])
+    typedef = tl.generate_type_definition("T", doc="")
+    fingerprints_count = 0
+    assert tl.generate_type_definition("T", doc="") == typedef
+    assert fingerprints_count == 0
+
+    # sparse typed dicts are merged in place, sub-learners' types change the generated union
+    tl.observe({"kind": "a", "other": "x"})
+    reference_tl = TypeLearner(discriminator="kind")
+    for value in [{"kind": "a", "value": 1}, {"kind": "b", "values": {"x": 1}}, [1], {"kind": "a", "other": "x"}]:
+        reference_tl.observe(value)
+    assert tl.generate_type_definition("T", doc="") == reference_tl.generate_type_definition("T", doc="")
+    assert pickle.loads(pickle.dumps(tl)).generate_type_definition("T", doc="") == tl.generate_type_definition(
+        "T", doc=""
+    )
+
+
+def test_type_learner_sparse_typed_dicts():
+    random.seed(1312)
+    keys = [f"key{i}" for i in range(60)]
+    stream = [
+        {"id": i, **{key: random.choice([1, "a", None, [1.5]]) for key in random.sample(keys, 5)}} for i in range(50)
+    ]
+    tl = TypeLearner(max_typed_dict_size=1000)
+    sparse_tl = TypeLearner(max_typed_dict_size=1000, sparse_typed_dicts=True)
+    for value in stream:
+        tl.observe(value)
+        sparse_tl.observe(value)
+    assert isinstance(sparse_tl.learnt_type, LSparseTypedDict)
+    assert sparse_tl.learnt_type.total_count == 50
+    assert sparse_tl.learnt_type.is_required("id")
+    assert sparse_tl.learnt_type.to_typed_dict() == tl.learnt_type
+    assert sparse_tl.generate_type_definition("T", doc="") == tl.generate_type_definition("T", doc="")
+
+
+def test_type_learner_sparse_typed_dicts_nullable(monkeypatch: pytest.MonkeyPatch):
+    rng = random.Random(1312)
+    keys = [f"key{i}" for i in range(500)]
+    stream: list[Any] = [None] + [{key: 1 for key in rng.sample(keys, 10)} for _ in range(100)]
+    reference = TypeLearner(max_typed_dict_size=10000)
+    for value in stream:
+        reference.observe(value)
+
+    checked_keys_count = 0
+    original_is_required = LSparseTypedDict.is_required
+
+    def is_required(self: LSparseTypedDict, key: str) -> bool:
+        nonlocal checked_keys_count
+        checked_keys_count += 1
+        return original_is_required(self, key)
+
+    monkeypatch.setattr(LSparseTypedDict, "is_required", is_required)
+    tl = TypeLearner(max_typed_dict_size=10000, sparse_typed_dicts=True)
+    for value in stream:
+        tl.observe(value)
+    # merging into a nullable sparse typed dict costs keys in the document, not all keys seen so far
+    assert checked_keys_count == 0
+    assert isinstance(tl.learnt_type, LUnion)
+    assert (
+        LUnion(
+            [
+                member.to_typed_dict() if isinstance(member, LSparseTypedDict) else member
+                for member in tl.learnt_type.member_types
+            ]
+        )
+        == reference.learnt_type
+    )
+
+
+def test_type_learner_sparse_typed_dicts_random_streams():
+    def random_value(rng: random.Random, depth: int = 0) -> Any:
+        if depth > 2 or rng.random() < 0.5:
+            return rng.choice([None, True, 1, 2, 3, "a", "b", "xxx", 1.5, [1], ["a"]])
+        return {rng.choice("abcdefgh"): random_value(rng, depth + 1) for _ in range(rng.randint(0, 7))}
+
+    rng = random.Random(1312)
+    for _ in range(300):
+        tl = TypeLearner(max_typed_dict_size=5, max_literal_type_size=3)
+        sparse_tl = TypeLearner(max_typed_dict_size=5, max_literal_type_size=3, sparse_typed_dicts=True)
+        for _ in range(rng.randint(1, 30)):
+            value = random_value(rng)
+            tl.observe(value)
+            sparse_tl.observe(value)
+        assert sparse_tl.generate_type_definition("T", doc="") == tl.generate_type_definition("T", doc="")
+
+
+def test_type_learner_typedef_caching_recursive_types():
+    tl = TypeLearner(detect_recursive_types=True)
+    value = {"a": {"tree": {"name": "x", "children": [{"name": "y", "children": []}]}}, "b": 1}
+    for b in [1, 2]:
+        tl.observe({**value, "b": b})
+        typedef = tl.generate_type_definition("T", doc="")
+        # the cached definition of TA is reused only with the recursive TATree it depends on
+        assert "class TATree(TypedDict):" in typedef
+        exec(typedef, {})
+
+
+def test_type_learner_discriminator():
+    stream = [
+        {"type": "created", "id": 1, "name": "a"},
+        {"type": "deleted", "id": 2},
+        {"type": "created", "id": 3, "name": "b"},
+        {"type": 5, "code": 500},
+        {"id": 6},
+    ]
+    tl = TypeLearner(discriminator="type")
+    for value in stream:
+        tl.observe(value)
+    assert list(tl.sub_learners) == ["created", "deleted", 5]
+    assert tl.observed_values == 5
+    assert tl.learnt_type == LTypedDict({"id": LLiteral(6)})
+    typedef = tl.generate_type_definition("Event", doc="")
+    assert "class EventCreated(TypedDict):\n    type: Literal['created']\n" in typedef
+    assert "class EventDeleted(TypedDict):\n    type: Literal['deleted']\n" in typedef
+    assert "Event = Union[EventCreated, EventDeleted, Event5, EventUntagged]" in typedef
+
+
+def test_type_learner_discriminator_parallel():
+    random.seed(1312)
+    stream = [
+        {"type": random.choice(["a", "b", "c"]), "value": random.choice([1, "x", None, [1.5]])} for _ in range(300)
+    ]
+    tl = TypeLearner(discriminator="type")
+    for value in stream:
+        tl.observe(value)
+    parallel_tl = TypeLearner(discriminator="type")
+    with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
+        for batch_start in range(0, len(stream), 100):
+            parallel_tl.observe_many(stream[batch_start : batch_start + 100], executor)
+    assert parallel_tl.observed_values == tl.observed_values
+    assert parallel_tl.generate_type_definition("T", doc="") == tl.generate_type_definition("T", doc="")
+
+
+def test_type_learner_discriminator_parallel_batches():
+    class RecordingExecutor(concurrent.futures.ThreadPoolExecutor):
+        def __init__(self) -> None:
+            super().__init__(max_workers=2)
+            # whether each submitted learner had nothing learnt yet
+            self.fresh_learners: list[bool] = []
+
+        def submit(self, fn: Any, /, *args: Any, **kwargs: Any) -> Any:
+            self.fresh_learners.append(args[0].learnt_type is None)
+            return super().submit(fn, *args, **kwargs)
+
+    stream = [{"type": tag, "value": i} for i in range(30) for tag in ["a", "b"]]
+    for kwargs, fresh_learners in [({}, True), ({"track_occurrences": True}, False)]:
+        tl = TypeLearner(discriminator="type", **kwargs)
+        with RecordingExecutor() as executor:
+            for batch_start in range(0, len(stream), 20):
+                tl.observe_many(stream[batch_start : batch_start + 20], executor)
+        # only the batches are sent unless sub-learners' state can't be merged
+        assert executor.fresh_learners == [True, True] + [fresh_learners] * 4
+        assert [sub_learner.observed_values for sub_learner in tl.sub_learners.values()] == [30, 30]
+        assert tl.sub_learners["a"].learnt_type == LTypedDict({"type": LLiteral("a"), "value": LType(int)})
+
+
+def test_type_learner_recursive_types(tmp_path: pathlib.Path):
+    def comment(depth: int) -> dict[str, Any]:
+        return {"id": depth, "author": {"name": "a"}, "replies": [comment(depth - 1)] if depth else []}
+
+    learnt_types = []
+    for depth in (3, 30):
+        tl = TypeLearner(detect_recursive_types=True, max_literal_type_size=0)
+        tl.observe(comment(depth))
+        tl.observe({"id": 0, "author": {"name": "b"}})
+        learnt_types.append(tl.learnt_type)
+    assert learnt_types[0] == learnt_types[1]
+    assert learnt_types[0] == LRecursive(
+        "$",
+        LTypedDict(
+            {
+                "id": LType(int),
+                "author": LTypedDict({"name": LType(str)}),
+                "replies": LUnion([LCollection(list, LRecursiveRef("$")), LMissingTypedDictKey()]),
+            }
+        ),
+    )
+
+    typedef_file = tmp_path / "comment.py"
+    tl.save_type_definition(typedef_file, "Comment", doc="testing recursive type generation")
+    typedef_text = typedef_file.read_text()
+    assert "replies: NotRequired['List[Comment]']" in typedef_text
+    typedef_text += f"\n\ndef func(arg: Comment) -> None:\n    pass\n\n\nfunc({comment(3)!r})\n"
+    typedef_file.write_text(typedef_text)
+    res = subprocess.run(["python", str(typedef_file)], capture_output=True)
+    assert res.returncode == 0, f"Generated file does not contain a valid Python code: {res.stderr.decode()}"
+    res = subprocess.run(["mypy", "--strict", str(typedef_file)], capture_output=True)
+    assert res.returncode == 0, f"Mypy finds errors: {res.stdout.decode()}"
+
+
+def test_type_learner_recursive_types_key_similarity():
+    # an envelope with a nested container under the same key is not a tree node
+    envelope = {"status": "ok", "data": {"id": 1, "data": [1, 2]}}
+    tl = TypeLearner(detect_recursive_types=True, max_literal_type_size=0)
+    tl.observe(envelope)
+    assert tl.learnt_type == LTypedDict(
+        {"status": LType(str), "data": LTypedDict({"id": LType(int), "data": LCollection(list, LType(int))})}
+    )
+
+    tl = TypeLearner(detect_recursive_types=True, max_literal_type_size=0, min_recursive_key_similarity=0.3)
+    tl.observe(envelope)
+    assert isinstance(tl.learnt_type, LRecursive)
+
+
+def test_type_learner_save_type_definition_failure(tmp_path: pathlib.Path):
+    typedef_file = tmp_path / "t.py"
+    tl = TypeLearner()
+    with pytest.raises(RuntimeError, match="at least one value"):
+        tl.save_type_definition(typedef_file, "T", doc="")
+    # no empty or temporary file is left behind, so saving can be retried
+    assert list(tmp_path.iterdir()) == []
+    tl.observe({"a": 1})
+    tl.save_type_definition(typedef_file, "T", doc="")
+    assert list(tmp_path.iterdir()) == [typedef_file]
+    assert typedef_file.read_text() == tl.generate_type_definition("T", doc="")
+    # permissions are the same as of a file created with open()
+    other_file = tmp_path / "other.py"
+    other_file.write_text("")
+    assert typedef_file.stat().st_mode == other_file.stat().st_mode
+
+
+@pytest.mark.parametrize(
+    "target_version, fields",
+    [
+        (PythonVersion.PY38, ["a: Union[int, str]", "b: Optional[float]", "c: Optional[List[int]]"]),
+        (PythonVersion.PY39, ["a: Union[int, str]", "b: Optional[float]", "c: Optional[list[int]]"]),
+        (PythonVersion.PY310, ["a: int | str", "b: float | None", "c: list[int] | None"]),
+        (PythonVersion.PY311, ["a: int | str", "b: float | None", "c: list[int] | None"]),
+    ],
+)
+def test_type_learner_union_typedefs(target_version: PythonVersion, fields: list[str]):
+    tl = TypeLearner(max_literal_type_size=0)
+    tl.observe({"a": 1, "b": None, "c": [1]})
+    tl.observe({"a": "s", "b": 1.5, "c": None})
+    typedef = tl.generate_type_definition("T", doc="", target_version=target_version)
+    assert typedef.endswith("class T(TypedDict):\n" + "\n".join(f"    {field}" for field in fields))
+    assert ("from typing import Union" in typedef) == (target_version < PythonVersion.PY310)
+
+
+def test_generate_types_module(tmp_path: pathlib.Path):
+    items_tl = TypeLearner()
+    items_tl.observe({"id": 1, "meta": {"source": "a"}})
+    meta_tl = TypeLearner()
+    meta_tl.observe({"page": 1, "meta": {"version": 2}})
+    meta_tl.observe(None)
+
+    module = generate_types_module({"Item": items_tl, "Meta": meta_tl}, doc="")
+    assert "class Item(TypedDict):\n    id: Literal[1]\n    meta: ItemMeta\n" in module
+    assert "class Meta2Meta(TypedDict):\n    version: Literal[2]\n" in module
+    assert "class Meta2(TypedDict):\n    page: Literal[1]\n    meta: Meta2Meta\n" in module
+    assert "\nMeta = Optional[Meta2]" in module
+    assert module.count("from typing import TypedDict") == 1
+
+    module_file = tmp_path / "module.py"
+    module_file.write_text(module)
+    res = subprocess.run(["python", str(module_file)], capture_output=True)
+    assert res.returncode == 0, f"Generated file does not contain a valid Python code: {res.stderr.decode()}"
+
+
+def test_type_learner_streaming_typedef_writer():
+    random.seed(1312)
+    tl = TypeLearner()
+    for _ in range(50):
+        tl.observe({"a": {"b": {"c": random.choice([1, None])}}, "d": [{"e": random.random()}], "A": {"x": 1}})
+    buffer = io.StringIO()
+    tl.write_type_definition(buffer, "T", doc="")
+    assert buffer.getvalue() == tl.generate_type_definition("T", doc="")
+    assert "class TA(TypedDict)" in buffer.getvalue()
+    assert "class TA2(TypedDict)" in buffer.getvalue()
@@ -0,0 +1,86 @@
+import dataclasses
+import io
+import pathlib
+import random
+
+import pytest
+
+from slow_learner import TypeLearner
+from slow_learner.learnt_types import LLiteral
+from slow_learner.registry import TypeLearnerRegistry
+from slow_learner.type_learner import generate_types_module
+
+
+def test_type_learner_registry(tmp_path: pathlib.Path):
+    rng = random.Random(1312)
+    reference: dict[str, TypeLearner] = dict()
+    with TypeLearnerRegistry(tmp_path, max_resident=3, learner_options={"max_literal_type_size": 2}) as registry:
+        for _ in range(200):
+            key = ("service", rng.choice(["users", "orders", "items", "tags", "carts"]), rng.choice([200, 404]))
+            value = {"status": key[2], "data": rng.choice([None, [rng.random()], {"id": rng.randint(0, 3)}])}
+            registry.observe(key, value)
+            reference.setdefault("_".join(map(str, key)), TypeLearner(max_literal_type_size=2)).observe(value)
+            assert len(registry.resident_keys) <= 3
+        assert len(registry) == len(reference) == 10
+        assert registry.spills > 0 and registry.loads > 0
+
+    expected_module = generate_types_module(reference, doc="All endpoints")
+    registry = TypeLearnerRegistry(tmp_path, max_resident=1)
+    assert len(registry) == 10 and registry.resident_keys == []
+    buffer = io.StringIO()
+    registry.write_types_module(buffer, doc="All endpoints")
+    assert buffer.getvalue() == expected_module
+    assert registry.resident_keys == [] and registry.loads == 10
+
+    # snapshots are only rewritten for learners used since they were last saved
+    registry.learner(("service", "users", 200))
+    spills = registry.spills
+    registry.flush()
+    assert registry.spills == spills + 1
+    registry.learner(("service", "users", 404))
+    registry.learner(("service", "users", 200))
+    assert registry.spills == spills + 2
+
+    with pytest.raises(ValueError, match="must be positive"):
+        TypeLearnerRegistry(tmp_path, max_resident=0)
+
+
+@dataclasses.dataclass(frozen=True)
+class SameRepr:
+    value: int
+
+    def __repr__(self) -> str:
+        return "SameRepr"
+
+
+def test_type_learner_registry_same_repr_keys(tmp_path: pathlib.Path):
+    with TypeLearnerRegistry(tmp_path, max_resident=1) as registry:
+        registry.observe(SameRepr(1), 1)
+        registry.observe(SameRepr(2), "a")
+    registry = TypeLearnerRegistry(tmp_path, max_resident=1)
+    assert registry.learner(SameRepr(1)).learnt_type == LLiteral(1)
+    assert registry.learner(SameRepr(2)).learnt_type == LLiteral("a")
+
+
+def test_type_learner_registry_max_resident_bytes(tmp_path: pathlib.Path):
+    with TypeLearnerRegistry(tmp_path) as registry:
+        for key in range(10):
+            registry.observe(key, {f"field_{i}": "value" * i for i in range(key * 10)})
+    snapshot_sizes = [(tmp_path / registry._snapshot_names[key]).stat().st_size for key in range(10)]
+
+    registry = TypeLearnerRegistry(tmp_path, max_resident_bytes=sum(snapshot_sizes[-3:]))
+    for key in range(10):
+        registry.learner(key)
+        assert registry.resident_bytes == sum(snapshot_sizes[k] for k in registry.resident_keys)
+    assert registry.resident_keys == [7, 8, 9] and registry.spills == 7
+    registry.learner(0)
+    assert registry.resident_keys == [8, 9, 0] and registry.spills == 8
+
+    # a learner over the budget on its own is still kept resident
+    registry = TypeLearnerRegistry(tmp_path, max_resident_bytes=1)
+    for key in range(10):
+        registry.learner(key)
+    assert registry.resident_keys == [9]
+
+    with pytest.raises(ValueError, match="must be positive"):
+        TypeLearnerRegistry(tmp_path, max_resident_bytes=0)
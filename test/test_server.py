@@ -0,0 +1,85 @@
+import json
+import pathlib
+import socket
+import threading
+import urllib.error
+import urllib.request
+from typing import Any, Iterator, Optional
+
+import pytest
+
+from slow_learner import TypeLearner
+from slow_learner.server import LearnerServer, make_http_server
+from slow_learner.typedef_generation import PythonVersion
+
+
+@pytest.fixture
+def server_url(tmp_path: pathlib.Path) -> Iterator[str]:
+    learner_server = LearnerServer(checkpoint_path=tmp_path / "learners.pickle.z")
+    httpd = make_http_server(learner_server)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    host, port = httpd.server_address  # type: ignore
+    yield f"http://{host}:{port}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def request(url: str, method: str = "GET", body: Optional[Any] = None) -> tuple[int, str]:
+    data = json.dumps(body).encode() if body is not None else None
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, data=data, method=method)) as response:
+            return response.status, response.read().decode()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read().decode()
+
+
+def test_server(server_url: str, tmp_path: pathlib.Path):
+    values = [{"a": 1}, {"a": 2, "b": "x"}, {"a": 3}]
+    assert request(server_url + "/learners/events/observe", "POST", values[:2]) == (
+        200,
+        json.dumps({"observed": 2, "observed_values": 2}),
+    )
+    assert request(server_url + "/learners/events/observe", "POST", values[2:])[0] == 200
+    assert request(server_url + "/learners/other/observe", "POST", {"not": "a list"})[0] == 400
+    assert request(server_url + "/learners") == (200, json.dumps({"events": 3}))
+
+    status, typedef = request(server_url + "/learners/events/typedef?type_name=Event")
+    reference_tl = TypeLearner()
+    for value in values:
+        reference_tl.observe(value)
+    assert status == 200
+    assert typedef == reference_tl.generate_type_definition("Event", doc="Learnt by slow-learner server as 'events'")
+
+    assert request(server_url + "/checkpoint", "POST", {})[0] == 200
+    restored = LearnerServer(checkpoint_path=tmp_path / "learners.pickle.z")
+    assert restored.generate_type_definition("events", "Event", PythonVersion.PY38) == typedef
+
+    assert request(server_url + "/learners/events", "DELETE")[0] == 200
+    assert request(server_url + "/learners/events/typedef")[0] == 404
+
+
+def test_server_unix_socket(tmp_path: pathlib.Path):
+    socket_path = tmp_path / "learner.sock"
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as stale:
+        stale.bind(str(socket_path))  # left behind, as by a killed server
+    assert socket_path.exists()
+
+    httpd = make_http_server(LearnerServer(), unix_socket=socket_path)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    with pytest.raises(OSError, match="Another server is listening"):
+        make_http_server(LearnerServer(), unix_socket=socket_path)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(str(socket_path))
+        client.sendall(b"GET /learners HTTP/1.0\r\n\r\n")
+        assert client.makefile("rb").read().endswith(b"\r\n\r\n{}")
+    httpd.shutdown()
+    httpd.server_close()
+    assert not socket_path.exists()
+
+    # files other than sockets are never removed
+    socket_path.write_text("not a socket")
+    with pytest.raises(OSError):
+        make_http_server(LearnerServer(), unix_socket=socket_path)
+    assert socket_path.read_text() == "not a socket"
@@ -0,0 +1,57 @@
+import datetime
+from typing import Any
+
+import pytest
+
+from slow_learner import TypeLearner
+from slow_learner.learnt_types import LLiteral, LMissingTypedDictKey, LType, LTypedDict, LUnion
+from slow_learner.typedef_generation import PythonVersion
+from slow_learner.typedef_parsing import parse_typedef_module
+
+
+def comment(depth: int) -> dict[str, Any]:
+    return {"id": depth, "author": {"name": "x"}, **({"replies": [comment(depth - 1)]} if depth else {})}
+
+
+VALUES = [
+    {"a": 1, "b": [1, 2, "x"], "c": None, "d": {"x-y": 1.5}, "e": (1, "a"), "f": {0: 0, 1: 1}, "g": [], "s": {1}},
+    {"a": 2, "c": {"k": True}, "h": b"x"},
+    comment(3),
+    None,
+]
+
+
+@pytest.mark.parametrize("target_version", list(PythonVersion))
+@pytest.mark.parametrize("detect_recursive_types", [False, True])
+def test_parse_generated_module(target_version: PythonVersion, detect_recursive_types: bool):
+    tl = TypeLearner(detect_recursive_types=detect_recursive_types)
+    for value in VALUES:
+        tl.observe(value)
+    module = tl.generate_type_definition("T", doc="", target_version=target_version)
+    assert parse_typedef_module(module, "T") == tl.learnt_type
+
+
+def test_parse_typedef_module_namespace():
+    module = "class T(TypedDict, total=False):\n    at: datetime\n    kind: Literal['a', 'b']\n"
+    with pytest.raises(ValueError, match="Unknown type name 'datetime'"):
+        parse_typedef_module(module, "T")
+    assert parse_typedef_module(module, "T", namespace={"datetime": datetime.datetime}) == LTypedDict(
+        {
+            "at": LUnion([LType(datetime.datetime), LMissingTypedDictKey()]),
+            "kind": LUnion([LLiteral("a"), LLiteral("b"), LMissingTypedDictKey()]),
+        }
+    )
+    with pytest.raises(ValueError, match="not defined"):
+        parse_typedef_module(module, "Other")
+
+
+def test_parse_ndarray():
+    numpy = pytest.importorskip("numpy")
+    tl = TypeLearner()
+    tl.observe(
+        {"a": numpy.zeros(3), "b": numpy.array(["x"], dtype=object), "c": numpy.array([0], dtype="datetime64[s]")}
+    )
+    tl.observe({"a": numpy.array([True]), "b": numpy.array([1j]), "c": numpy.array([], dtype="datetime64[s]")})
+    for target_version in PythonVersion:
+        module = tl.generate_type_definition("T", doc="", target_version=target_version)
+        assert parse_typedef_module(module, "T") == tl.learnt_type